@@ -0,0 +1,147 @@
+"""
+Recording and replay of the raw nextBlock responses received from ogmios.
+A recording allows to run the querier against a fixed stream of blocks (including rollbacks)
+without a node or ogmios, i.e. to benchmark and profile the processing of blocks.
+
+The file starts with the magic bytes below, followed by one record per response.
+Each record consists of a header with the length of the compressed response and the slot
+of the block (or rollback point, 0 for the origin), followed by the zlib compressed response.
+Records are compressed individually, so that the file can be scanned and seeked
+by reading only the headers. Recording into an existing file appends to it.
+"""
+import json
+import logging
+import os
+import struct
+import zlib
+from typing import BinaryIO, Iterator, List, Tuple
+
+from . import ogmios
+
+_LOGGER = logging.getLogger(__name__)
+_LOGGER.setLevel(logging.INFO)
+
+MAGIC = b"MSGOVREC1\n"
+RECORD_HEADER = struct.Struct(">IQ")
+
+
+def operation_slot(operation: ogmios.NextBlockResult) -> int:
+    if isinstance(operation, ogmios.Rollforward):
+        return ogmios.tip_from_block(operation.block).slot
+    if isinstance(operation.tip, ogmios.Origin):
+        return 0
+    return operation.tip.slot
+
+
+class BlockRecorder:
+    """
+    Appends raw nextBlock responses to a recording
+    """
+
+    def __init__(self, path: str, compression_level: int = 6):
+        self.path = path
+        self.compression_level = compression_level
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not new_file:
+            with open(path, "rb") as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    raise ValueError(f"{path} is not a block recording")
+        self._file = open(path, "ab")
+        if new_file:
+            self._file.write(MAGIC)
+
+    def record(self, response: str | bytes, operation: ogmios.NextBlockResult):
+        """
+        Append a raw response together with the operation that was parsed from it
+        """
+        if isinstance(response, str):
+            response = response.encode()
+        data = zlib.compress(response, self.compression_level)
+        self._file.write(RECORD_HEADER.pack(len(data), operation_slot(operation)))
+        self._file.write(data)
+        # keep the recording usable if the querier is killed
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def scan_records(f: BinaryIO) -> List[Tuple[int, int, int]]:
+    """
+    Obtain the offset, length and slot of all records, reading only the headers
+    """
+    f.seek(0)
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"{f.name} is not a block recording")
+    records = []
+    while True:
+        header = f.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            break
+        length, slot = RECORD_HEADER.unpack(header)
+        offset = f.tell()
+        if offset + length > os.fstat(f.fileno()).st_size:
+            _LOGGER.warning(f"Ignoring truncated record at offset {offset}")
+            break
+        records.append((offset, length, slot))
+        f.seek(length, os.SEEK_CUR)
+    return records
+
+
+def read_record(f: BinaryIO, offset: int, length: int) -> dict:
+    f.seek(offset)
+    return json.loads(zlib.decompress(f.read(length)))
+
+
+class ReplayIterator:
+    """
+    Replays a recording with the same interface as OgmiosIterator, as fast as the consumer allows.
+    Like ogmios, the replay starts after the most recent recorded block among the start points,
+    with a rollback to that block. If none of them was recorded, the whole recording is replayed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._remaining = 0
+
+    @property
+    def buffered(self) -> int:
+        """
+        Number of operations that are left in the recording
+        """
+        return self._remaining
+
+    def iterate_blocks(
+        self, start_points: list[ogmios.Point]
+    ) -> Iterator[ogmios.NextBlockResult]:
+        with open(self.path, "rb") as f:
+            records = scan_records(f)
+            start = 0
+            points = {(p.slot, p.id) for p in start_points}
+            slots = {slot for slot, _ in points}
+            for i in reversed(range(len(records))):
+                offset, length, slot = records[i]
+                if slot not in slots:
+                    continue
+                operation = ogmios.parse_next_block_response(
+                    read_record(f, offset, length)
+                )
+                if not isinstance(operation, ogmios.Rollforward):
+                    continue
+                tip = ogmios.tip_from_block(operation.block)
+                if (tip.slot, tip.id) in points:
+                    start = i + 1
+                    _LOGGER.info(f"Intersection: {tip}")
+                    self._remaining = len(records) - start
+                    yield ogmios.Rollback(tip=ogmios.Point(slot=tip.slot, id=tip.id))
+                    break
+            for i in range(start, len(records)):
+                offset, length, _ = records[i]
+                self._remaining = len(records) - i - 1
+                yield ogmios.parse_next_block_response(read_record(f, offset, length))
@@ -0,0 +1,154 @@
+"""
+Bulk mode for the initial sync, while the tip of the chain is still far away.
+Maintaining the secondary indexes of the large tables and syncing every commit to disk
+dominate the time of a fresh sync. In bulk mode, these indexes are dropped,
+SQLite does not wait for the disk and foreign keys are not enforced.
+Once the sync gets close to the tip, the indexes are rebuilt,
+the database is checked for consistency and the durable settings are restored.
+Bulk mode is entered further away from the tip than it is left, so that a sync
+hovering around one distance does not rebuild the indexes over and over.
+
+If the querier stops while in bulk mode, the missing indexes are recreated
+by create_schema when the querier starts again.
+On PostgreSQL, only the indexes are deferred.
+"""
+import logging
+from typing import Optional
+
+from peewee import Database
+
+from .db_models import Block, Transaction, TransactionOutput, TransactionOutputValue
+from .db_models.dialect import is_sqlite
+
+_LOGGER = logging.getLogger(__name__)
+_LOGGER.setLevel(logging.INFO)
+
+# the tables that grow with every indexed transaction
+DEFERRED_INDEX_MODELS = (Block, Transaction, TransactionOutput, TransactionOutputValue)
+# indexes that are needed by the processors during the sync
+KEPT_INDEXES = {
+    (TransactionOutputValue, "transaction_output"),
+}
+
+BULK_PRAGMAS = {
+    "synchronous": 0,
+    "foreign_keys": 0,
+    # negative values are in KiB
+    "cache_size": -1024 * 1024,
+    "mmap_size": 2**32,
+}
+
+
+class BulkSyncError(Exception):
+    pass
+
+
+class BulkSyncMode:
+    """
+    Switches the database between bulk mode and the durable live mode.
+    Must only be switched outside of transactions, as SQLite ignores
+    changes to the foreign key enforcement inside transactions.
+
+    :param database: The database to switch
+    :param pragmas: The pragmas applied in bulk mode (default: BULK_PRAGMAS on SQLite)
+    :param enter_distance: Enter bulk mode while the tip is more than this many slots away (None: never)
+    :param exit_distance: Leave bulk mode once the tip is at most this many slots away (at most enter_distance)
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        pragmas: dict = None,
+        enter_distance: Optional[int] = None,
+        exit_distance: Optional[int] = None,
+    ):
+        if exit_distance is None or enter_distance is None:
+            exit_distance = enter_distance
+        else:
+            exit_distance = min(exit_distance, enter_distance)
+        self.database = database
+        self.sqlite = is_sqlite(database)
+        if pragmas is None:
+            pragmas = BULK_PRAGMAS if self.sqlite else {}
+        self.pragmas = pragmas
+        self.enter_distance = enter_distance
+        self.exit_distance = exit_distance
+        self.active = False
+        self._live_pragmas = {}
+        self._live_until_slot = None
+
+    def should_switch(self, slot: int, tip_slot: int) -> bool:
+        """
+        Whether to enter or leave bulk mode before writing the block at slot
+        """
+        if self.active:
+            return tip_slot - slot <= self.exit_distance
+        if self.enter_distance is None:
+            return False
+        if self._live_until_slot is not None:
+            if slot <= self._live_until_slot:
+                return False
+            self._live_until_slot = None
+        return tip_slot - slot > self.enter_distance
+
+    def _deferred_indexes(self):
+        for model in DEFERRED_INDEX_MODELS:
+            for index in model._meta.fields_to_index():
+                if index._unique:
+                    continue
+                if any(
+                    (model, getattr(field, "name", None)) in KEPT_INDEXES
+                    for field in index._expressions
+                ):
+                    continue
+                yield index
+
+    def enter(self):
+        """
+        Drop the deferred indexes and apply the bulk pragmas
+        """
+        if self.active:
+            return
+        _LOGGER.info("Entering bulk sync mode")
+        self._live_pragmas = {name: self.database.pragma(name) for name in self.pragmas}
+        for name, value in self.pragmas.items():
+            self.database.pragma(name, value)
+        with self.database.atomic():
+            for index in self._deferred_indexes():
+                self.database.execute_sql(f'DROP INDEX IF EXISTS "{index._name}"')
+        self.active = True
+
+    def exit(self, live_until_slot: Optional[int] = None):
+        """
+        Rebuild the dropped indexes, check the database and restore the live pragmas
+
+        :param live_until_slot: Stay in live mode until a block after this slot is written,
+            e.g. until the blocks removed by a rollback are synced again
+        """
+        if live_until_slot is not None:
+            self._live_until_slot = live_until_slot
+        if not self.active:
+            return
+        _LOGGER.info("Leaving bulk sync mode, rebuilding indexes")
+        with self.database.atomic():
+            for model in DEFERRED_INDEX_MODELS:
+                model._schema.create_indexes(safe=True)
+        if self.sqlite:
+            self._check()
+        for name, value in self._live_pragmas.items():
+            self.database.pragma(name, value)
+        self.active = False
+        _LOGGER.info("Switched to live mode")
+
+    def _check(self):
+        """
+        Check the foreign keys, which are not enforced in bulk mode, and the integrity of the SQLite database
+        """
+        violations = self.database.execute_sql("PRAGMA foreign_key_check").fetchall()
+        if violations:
+            raise BulkSyncError(
+                f"Found {len(violations)} foreign key violations after bulk sync, e.g. {violations[0]}"
+            )
+        check = self.database.execute_sql("PRAGMA quick_check").fetchall()
+        if check != [("ok",)]:
+            raise BulkSyncError(f"Integrity check failed after bulk sync: {check}")
@@ -1,23 +1,126 @@
 """
 The main file containing the logic for starting the querier.
 The querier syncs with the blockchain, listening for new blocks and updating the database accordingly.
+The derived tables can be rebuilt from the archived transactions with the `reprocess` command (see tx_archive).
 """
+import contextlib
 import logging
+import sys
+import time
+from typing import Tuple
 
 import fire
-from muesliswap_onchain_governance.api.tx_processor import process_tx
+from muesliswap_onchain_governance.api.tx_processor import (
+    process_tx,
+    mark_spent_inputs,
+    flush_spent_inputs,
+    discard_spent_inputs,
+    indexed_outputs,
+    undo_journal,
+    watch_set,
+)
+from muesliswap_onchain_governance.api.tx_processor.to_db import restore_live_states
 
 from ..utils.network import ogmios_url
 from . import ogmios
-from .db_models import Block, GovState, TransactionOutput, TreasurerState
+from .block_recording import BlockRecorder, ReplayIterator
+from .bulk_sync import BulkSyncMode
+from .decode_stage import DecodeStage
+from .metrics import metrics, serve_metrics
+from .segmented_sync import SegmentedIterator, load_checkpoints
+from .tx_archive import archive_transaction, reprocess
+from .tx_filter import RelevanceFilter, inputs_from_tx
+from .db_models import (
+    ALL_MODELS,
+    Block,
+    GovState,
+    TransactionOutput,
+    TrackedGovStates,
+    TrackedTreasuryStates,
+    TreasurerState,
+    create_schema,
+    database,
+    init_database,
+)
+from .write_batch import WriteBatcher
 
 _LOGGER = logging.getLogger(__name__)
 _LOGGER.setLevel(logging.INFO)
 
 
-def main(rollback_to_slot: int = None, debug_sql: bool = False):
+def sync_points() -> list[ogmios.Point]:
+    """
+    The points from which to resume syncing, the most recent stored blocks
+    """
+    blocks = [
+        Block.select().order_by(Block.slot.desc()).offset(offset).first()
+        for offset in (0, 1, 5, 50, 1000)
+    ]
+    return [
+        ogmios.Point(slot=block.slot, id=block.hash)
+        for block in blocks
+        if block is not None
+    ]
+
+
+def unspent_tracked_states() -> Tuple[TrackedGovStates, TrackedTreasuryStates]:
+    """
+    Select the gov and treasurer states that are not spent yet
+    """
+    return (
+        list(
+            GovState.select()
+            .join(TransactionOutput)
+            .where(TransactionOutput.spent_in_block.is_null())
+        ),
+        list(
+            TreasurerState.select()
+            .join(TransactionOutput)
+            .where(TransactionOutput.spent_in_block.is_null())
+        ),
+    )
+
+
+def main(
+    rollback_to_slot: int = None,
+    debug_sql: bool = False,
+    min_pipeline_depth: int = 10,
+    max_pipeline_depth: int = 1000,
+    queue_size: int = 200,
+    decode_workers: int = None,
+    decode_lookahead: int = 100,
+    batch_blocks: int = 100,
+    batch_time_ms: int = 1000,
+    batch_tip_distance: int = 600,
+    bulk_sync_distance: int = 86400,
+    bulk_sync_exit_distance: int = 43200,
+    rollback_window: int = 2160,
+    record_to: str = None,
+    replay_from: str = None,
+    metrics_port: int = None,
+    segment_checkpoints: str = None,
+    segment_workers: int = 4,
+):
     """
     Start the querier.
+    :param rollback_to_slot: Remove all blocks after this slot before starting to sync
+    :param debug_sql: Log all SQL statements
+    :param min_pipeline_depth: Minimum number of blocks requested ahead from ogmios
+    :param max_pipeline_depth: Maximum number of blocks requested ahead from ogmios
+    :param queue_size: Maximum number of received blocks waiting to be processed
+    :param decode_workers: Number of processes decoding transactions (default: number of CPUs, 0: decode in the main process)
+    :param decode_lookahead: Maximum number of upcoming blocks for which transactions are decoded ahead
+    :param batch_blocks: Maximum number of blocks committed to the database in a single transaction
+    :param batch_time_ms: Maximum time in milliseconds before the written blocks are committed
+    :param batch_tip_distance: Blocks within this many slots of the tip are committed individually
+    :param bulk_sync_distance: Enter bulk mode (deferred indexes, no fsync, no foreign key enforcement) while the tip is more than this many slots away (None: never)
+    :param bulk_sync_exit_distance: Leave bulk mode once the tip is at most this many slots away
+    :param rollback_window: Number of recent blocks whose changes are journaled to undo rollbacks quickly
+    :param record_to: Append all responses received from ogmios to this recording
+    :param replay_from: Replay the blocks of this recording instead of connecting to ogmios, stops at its end
+    :param metrics_port: Serve timings and counters of the querier in the Prometheus format at /metrics on this port
+    :param segment_checkpoints: File with checkpoints (see segmented_sync) to fetch the segments between them concurrently
+    :param segment_workers: Number of segments fetched concurrently, each on its own connection to ogmios
     """
     if debug_sql:
         logger = logging.getLogger("peewee")
@@ -25,60 +128,178 @@ def main(rollback_to_slot: int = None, debug_sql: bool = False):
         logger.setLevel(logging.DEBUG)
 
     _LOGGER.info("Starting the querier")
+    tx_filter = RelevanceFilter(watch_set=watch_set)
+    decode_stage = DecodeStage(
+        tx_filter, max_workers=decode_workers, lookahead=decode_lookahead
+    )
+    # forked before the metrics thread is started and before the first query, like reprocess
+    decode_stage.start()
+    if metrics_port is not None:
+        serve_metrics(metrics_port)
     if rollback_to_slot is not None:
         Block.delete().where(Block.slot > rollback_to_slot).execute()
-    sync_blocks = [
-        Block.select().order_by(Block.slot.desc()).first(),
-        Block.select().order_by(Block.slot.desc()).offset(1).first(),
-        Block.select().order_by(Block.slot.desc()).offset(5).first(),
-        Block.select().order_by(Block.slot.desc()).offset(50).first(),
-        Block.select().order_by(Block.slot.desc()).offset(1000).first(),
-    ]
+        restore_live_states()
+    start_points = sync_points()
 
     tracked_gov_states = []
     tracked_treasury_states = []
+    undo_journal.depth = rollback_window
 
-    for operation in ogmios.OgmiosIterator(ogmios_url).iterate_blocks(
-        [
-            ogmios.Point(slot=block.slot, id=block.hash)
-            for block in sync_blocks
-            if block is not None
-        ]
-    ):
-        if isinstance(operation, ogmios.Rollback):
-            if isinstance(operation.tip, ogmios.Origin):
-                _LOGGER.info("Rollback to origin")
-                Block.delete().execute()
-                continue
-            else:
-                _LOGGER.info("Rollback to tip", operation.tip)
-                Block.delete().where(Block.slot > operation.tip.slot).execute()
-                # At least one Rollback is executed once after each restart, so we can be sure this is initialized correctly
-                tracked_gov_states = list(
-                    GovState.select()
-                    .join(TransactionOutput)
-                    .where(TransactionOutput.spent_in_block.is_null())
+    # the recorder and the write batcher are closed when the sync ends or fails
+    with contextlib.ExitStack() as stack:
+        recorder = (
+            stack.enter_context(BlockRecorder(record_to))
+            if record_to is not None
+            else None
+        )
+        if replay_from is not None:
+            block_iterator = ReplayIterator(replay_from)
+        else:
+            block_iterator = ogmios.OgmiosIterator(
+                ogmios_url,
+                window=ogmios.PipelineWindow(
+                    min_depth=min_pipeline_depth,
+                    max_depth=max_pipeline_depth,
+                    initial_depth=min(max(100, min_pipeline_depth), max_pipeline_depth),
+                ),
+                queue_size=queue_size,
+                recorder=recorder,
+            )
+            if segment_checkpoints is not None:
+                block_iterator = SegmentedIterator(
+                    ogmios_url,
+                    load_checkpoints(segment_checkpoints),
+                    live_iterator=block_iterator,
+                    max_workers=segment_workers,
                 )
-                tracked_treasury_states = list(
-                    TreasurerState.select()
-                    .join(TransactionOutput)
-                    .where(TransactionOutput.spent_in_block.is_null())
+        bulk_sync = BulkSyncMode(
+            database,
+            enter_distance=bulk_sync_distance,
+            exit_distance=bulk_sync_exit_distance,
+        )
+        last_slot = None
+        start_time = time.monotonic()
+        write_batcher = stack.enter_context(
+            WriteBatcher(
+                database,
+                max_blocks=batch_blocks,
+                max_time_ms=batch_time_ms,
+                tip_distance=batch_tip_distance,
+                buffered=lambda: block_iterator.buffered + decode_stage.buffered,
+            )
+        )
+        for operation, decoded_block in decode_stage.iterate(
+            block_iterator.iterate_blocks(start_points),
+            buffered=lambda: block_iterator.buffered,
+        ):
+            if isinstance(operation, ogmios.Rollback):
+                metrics.inc("rollbacks")
+                rollback_slot = (
+                    -1
+                    if isinstance(operation.tip, ogmios.Origin)
+                    else operation.tip.slot
                 )
-                continue
-        else:
-            block = ogmios.tip_from_block(operation.block)
-            db_block = Block(hash=block.id, slot=block.slot, height=block.height)
-            db_block.save()
-            try:
-                for i, tx in enumerate(ogmios.txs_from_block(operation.block)):
-                    process_tx(
-                        tx, db_block, i, tracked_gov_states, tracked_treasury_states
-                    )
-            except Exception as e:
-                _LOGGER.info(f"Error processing block {block.id}: {e}")
-                db_block.delete_instance()
-                raise
+                if undo_journal.covers(rollback_slot):
+                    _LOGGER.info(f"Rollback to {operation.tip} using the undo journal")
+                    with write_batcher.write():
+                        tracked_states = undo_journal.rollback(rollback_slot)
+                    write_batcher.commit()
+                    if tracked_states is not None:
+                        tracked_gov_states, tracked_treasury_states = tracked_states
+                        tx_filter.update(tracked_gov_states, tracked_treasury_states)
+                    continue
+                # rollbacks beyond the journal rely on foreign keys to cascade the deletion
+                write_batcher.commit()
+                # the blocks removed by the rollback are synced again in live mode
+                bulk_sync.exit(live_until_slot=last_slot)
+                with write_batcher.write():
+                    if isinstance(operation.tip, ogmios.Origin):
+                        _LOGGER.info("Rollback to origin")
+                        Block.delete().execute()
+                    else:
+                        _LOGGER.info(f"Rollback to tip {operation.tip}")
+                        Block.delete().where(Block.slot > operation.tip.slot).execute()
+                        restore_live_states()
+                        # At least one Rollback is executed once after each restart, so we can be sure this is initialized correctly
+                        (
+                            tracked_gov_states,
+                            tracked_treasury_states,
+                        ) = unspent_tracked_states()
+                        tx_filter.update(tracked_gov_states, tracked_treasury_states)
+                    indexed_outputs.load()
+                write_batcher.commit()
+                undo_journal.reset(rollback_slot)
+            else:
+                block = ogmios.tip_from_block(operation.block)
+                if bulk_sync.should_switch(block.slot, operation.tip.slot):
+                    write_batcher.commit()
+                    if bulk_sync.active:
+                        bulk_sync.exit()
+                    else:
+                        bulk_sync.enter()
+                block_start = time.perf_counter()
+                transactions = ogmios.transactions_from_block(operation.block)
+                undo_journal.begin_block(
+                    block.slot, tracked_gov_states, tracked_treasury_states
+                )
+                try:
+                    with write_batcher.block(block.slot, operation.tip.slot):
+                        db_block = Block.create(
+                            hash=block.id, slot=block.slot, height=block.height
+                        )
+                        for i, tx in enumerate(transactions):
+                            mark_spent_inputs(inputs_from_tx(tx), db_block)
+                            if not tx_filter.is_relevant(tx):
+                                continue
+                            archive_transaction(tx, db_block, i)
+                            metrics.inc("relevant_transactions")
+                            decoded_tx = decoded_block.get(i, tx)
+                            if decoded_tx is None:
+                                continue
+                            process_tx(
+                                decoded_tx,
+                                db_block,
+                                i,
+                                tracked_gov_states,
+                                tracked_treasury_states,
+                            )
+                            # relevant transactions may create or spend tracked states
+                            tx_filter.update(
+                                tracked_gov_states, tracked_treasury_states
+                            )
+                        flush_spent_inputs()
+                except Exception as e:
+                    _LOGGER.info(f"Error processing block {block.id}: {e}")
+                    undo_journal.discard_block()
+                    discard_spent_inputs()
+                    raise
+                undo_journal.end_block()
+                last_slot = block.slot
+                metrics.observe("block", time.perf_counter() - block_start)
+                metrics.inc("blocks")
+                metrics.inc("transactions", len(transactions))
+                metrics.set("sync_lag_slots", operation.tip.slot - block.slot)
+    # only reached when replaying a recording
+    _LOGGER.info(
+        f"Reached the end of the blocks after {time.monotonic() - start_time:.2f}s"
+    )
+
+
+def migrate():
+    """
+    Create the tables and indexes of the database and migrate it to the current models.
+    Runs before every command of the querier, the API only opens read-only connections to the database.
+    """
+    create_schema(database, ALL_MODELS)
 
 
 if __name__ == "__main__":
-    fire.Fire(main)
+    init_database()
+    migrate()
+    # the decode workers of the commands are forked without an open connection
+    database.close()
+    # syncing remains the default command, migrate only creates and migrates the schema
+    if sys.argv[1:2] == ["reprocess"]:
+        fire.Fire(reprocess, command=sys.argv[2:])
+    elif sys.argv[1:2] != ["migrate"]:
+        fire.Fire(main)
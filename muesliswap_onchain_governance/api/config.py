@@ -8,6 +8,7 @@ from ..onchain.gov_state import gov_state_nft
 from ..onchain.staking import vote_permission_nft
 from ..onchain.licenses import licenses
 from ..onchain.treasury import treasurer_nft
+from ..onchain.simple_pool import pool_nft
 
 # Only these scripts need to be hardcoded
 # And should also change seldomly
@@ -23,6 +24,9 @@ _, licenses_policy_id, _ = contracts.get_contract(
 _, treasurer_nft_policy_id, _ = contracts.get_contract(
     module_name(treasurer_nft), compressed=True
 )
+_, pool_nft_policy_id, _ = contracts.get_contract(
+    module_name(pool_nft), compressed=True
+)
 
 # default: start from a block around 19 feb 2024
 start_block_slot = 52616248 if network == Network.TESTNET else 72316796
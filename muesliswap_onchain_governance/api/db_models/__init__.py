@@ -1,4 +1,5 @@
 from .db import (
+    ArchivedTransaction,
     Block,
     Address,
     Datum,
@@ -6,8 +7,13 @@ from .db import (
     Transaction,
     TransactionOutput,
     TransactionOutputValue,
-    sqlite_db,
+    OutputStateModel,
+    database,
+    database_url,
+    init_database,
+    open_database,
 )
+from .migrations import create_schema
 from .gov_state import GovState, GovParams, GovUpgrade, TrackedGovStates
 from .tally_state import (
     TallyState,
@@ -39,42 +45,57 @@ from .staking import (
     StakingDepositParticipationAdded,
     StakingDepositParticipationRemoved,
 )
+from .licenses import LicenseMint, LicenseOutput
+from .simple_pool import PoolState
 
-sqlite_db.connect()
-sqlite_db.create_tables(
-    [
-        Block,
-        Address,
-        Datum,
-        Token,
-        Transaction,
-        TransactionOutput,
-        TransactionOutputValue,
-        GovParams,
-        GovState,
-        GovUpgrade,
-        TallyState,
-        TallyParams,
-        TallyProposals,
-        TallyWeights,
-        TallyCreation,
-        TallyCreationParticipants,
-        TallyVote,
-        TreasurerParams,
-        TreasurerState,
-        TreasuryDelta,
-        TreasuryDeltaValue,
-        TreasuryPayout,
-        ValueStoreState,
-        StakingParams,
-        StakingState,
-        StakingParticipation,
-        StakingDeposit,
-        StakingDepositDelta,
-        StakingDepositParticipationAdded,
-        StakingDepositParticipationRemoved,
-        StakingParticipationInStaking,
-        VotePermission,
-        VotePermissionMint,
-    ]
-)
+ALL_MODELS = [
+    Block,
+    Address,
+    Datum,
+    Token,
+    Transaction,
+    TransactionOutput,
+    TransactionOutputValue,
+    ArchivedTransaction,
+    GovParams,
+    GovState,
+    GovUpgrade,
+    TallyState,
+    TallyParams,
+    TallyProposals,
+    TallyWeights,
+    TallyCreation,
+    TallyCreationParticipants,
+    TallyVote,
+    TreasurerParams,
+    TreasurerState,
+    TreasuryDelta,
+    TreasuryDeltaValue,
+    TreasuryPayout,
+    ValueStoreState,
+    StakingParams,
+    StakingState,
+    StakingParticipation,
+    StakingDeposit,
+    StakingDepositDelta,
+    StakingDepositParticipationAdded,
+    StakingDepositParticipationRemoved,
+    StakingParticipationInStaking,
+    VotePermission,
+    VotePermissionMint,
+    LicenseMint,
+    LicenseOutput,
+    PoolState,
+]
+
+# the states at unspent outputs are read through a partial index on the live flag,
+# so the queries of the current states do not grow with the history
+LIVE_STATE_MODELS = [m for m in ALL_MODELS if issubclass(m, OutputStateModel)]
+for model in LIVE_STATE_MODELS:
+    model.add_index(
+        model.index(
+            model.transaction_output,
+            name=f"{model._meta.table_name}_live",
+            where=model.live,
+        )
+    )
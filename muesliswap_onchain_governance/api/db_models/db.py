@@ -1,22 +1,99 @@
-from peewee import *
+import os
+from urllib.parse import quote, urlparse
 
-sqlite_db = SqliteDatabase(
-    "muesliswap_onchain_governance.db",
-    pragmas={
-        "journal_mode": "wal",
-        "foreign_keys": 1,
-        "ignore_check_constraints": 0,
-    },
-)
+from peewee import *
+from playhouse import db_url
+from playhouse.pool import PooledPostgresqlDatabase
+
+# sqlite:///<path> or postgresql://<user>:<password>@<host>:<port>/<name>
+database_url = os.getenv("DATABASE_URL", "sqlite:///muesliswap_onchain_governance.db")
+
+SQLITE_PRAGMAS = {
+    "journal_mode": "wal",
+    "foreign_keys": 1,
+    "ignore_check_constraints": 0,
+}
+
+# connections of the API, each thread of the server reads through its own connection
+SQLITE_READ_ONLY_PRAGMAS = {
+    "query_only": 1,
+    "mmap_size": 256 * 1024 * 1024,
+    # in KiB
+    "cache_size": -64 * 1024,
+}
+
+# connections of each process to a PostgreSQL database, overridden by the parameters of the url
+POSTGRES_POOL = {
+    "max_connections": 20,
+    "stale_timeout": 300,
+}
+
+# initialized with init_database by the querier, the API and the other entry points
+database = DatabaseProxy()
+
+
+def open_database(url: str, read_only: bool = False) -> Database:
+    """
+    Open the database at the given url, connections are only made by the first query.
+    Connections to PostgreSQL are pooled, several queriers and API replicas can share the database.
+    :param url: sqlite:///<path> or postgresql://<user>:<password>@<host>:<port>/<name>[?max_connections=<n>]
+    :param read_only: Open read-only connections, the database must have been created by the querier
+    """
+    parsed = urlparse(url)
+    if parsed.scheme == "sqlite":
+        path = db_url.parse(url)["database"]
+        if not read_only:
+            return SqliteDatabase(path, pragmas=SQLITE_PRAGMAS)
+        return SqliteDatabase(
+            f"file:{quote(path)}?mode=ro", uri=True, pragmas=SQLITE_READ_ONLY_PRAGMAS
+        )
+    if parsed.scheme in ("postgres", "postgresql"):
+        params = {**POSTGRES_POOL, **db_url.parse(url)}
+        if read_only:
+            params["options"] = "-c default_transaction_read_only=on"
+        return PooledPostgresqlDatabase(**params)
+    raise ValueError(f"Unsupported database url scheme: {parsed.scheme}")
+
+
+def init_database(url: str = database_url, read_only: bool = False):
+    """
+    Bind the models to the database at the given url.
+    The schema is not touched, the querier creates and migrates it with create_schema.
+    :param url: The url of the database, see open_database
+    :param read_only: Open read-only connections, i.e. for the API
+    """
+    database.initialize(open_database(url, read_only=read_only))
+
+
+# called with every newly inserted row, i.e. to record it for rollbacks
+insert_listeners = []
 
 
 class BaseModel(Model):
     class Meta:
-        database = sqlite_db
+        database = database
+
+    def save(self, force_insert=False, only=None):
+        inserted = force_insert or self._pk is None
+        rows = super().save(force_insert=force_insert, only=only)
+        if inserted:
+            for listener in insert_listeners:
+                listener(self)
+        return rows
+
+
+class BytesField(BlobField):
+    """
+    Raw bytes of a hash, policy id, asset name or address, hex encoded only by the API
+    """
+
+    def python_value(self, value):
+        # PostgreSQL returns memoryviews
+        return bytes(value) if value is not None else None
 
 
-PolicyId = lambda: CharField(max_length=64)
-AssetName = lambda: CharField(max_length=64)
+PolicyId = lambda: BytesField()
+AssetName = lambda: BytesField()
 CBORField = BlobField
 
 
@@ -36,23 +113,37 @@ class Token(BaseModel):
 
 
 class Address(BaseModel):
-    address_raw = CharField(max_length=128, unique=True, index=True)
+    address_raw = BytesField(unique=True, index=True)
 
 
 class Datum(BaseModel):
-    hash = CharField(max_length=64, unique=True, index=True)
+    hash = BytesField(unique=True, index=True)
     data = CBORField()
 
 
 class Transaction(BaseModel):
-    transaction_hash = CharField(max_length=64, unique=True, index=True)
+    transaction_hash = BytesField(unique=True, index=True)
     block = ForeignKeyField(Block, backref="transactions", on_delete="CASCADE")
     block_index = IntegerField()
 
 
+class ArchivedTransaction(BaseModel):
+    """
+    Raw transaction handled by the processors, to reprocess it without resyncing the chain
+    """
+
+    block = ForeignKeyField(Block, backref="archived_transactions", on_delete="CASCADE")
+    block_index = IntegerField()
+    transaction_hash = BytesField()
+    cbor = CBORField()
+
+    class Meta:
+        indexes = ((("block", "block_index"), True),)
+
+
 class TransactionOutput(BaseModel):
     transaction = ForeignKeyField(Transaction, backref="outputs", on_delete="CASCADE")
-    transaction_hash = CharField(max_length=64)
+    transaction_hash = BytesField()
     output_index = IntegerField()
     address = ForeignKeyField(Address, backref="outputs", index=True)
     datum_hash = ForeignKeyField(Datum, field="hash", backref="outputs", null=True)
@@ -69,6 +160,8 @@ class OutputStateModel(BaseModel):
     transaction_output = ForeignKeyField(
         TransactionOutput, backref="created_states", on_delete="CASCADE"
     )
+    # whether the output is unspent, the live states are covered by a partial index
+    live = BooleanField(default=True)
 
 
 class TransActionModel(BaseModel):
@@ -82,4 +175,4 @@ class TransactionOutputValue(BaseModel):
         TransactionOutput, backref="assets", on_delete="CASCADE"
     )
     token = ForeignKeyField(Token, backref="outputs")
-    amount = IntegerField()
+    amount = BigIntegerField()
@@ -0,0 +1,46 @@
+"""
+Differences between the SQL dialects of SQLite and PostgreSQL.
+
+The raw queries in db_queries are written in the subset of SQL shared by both,
+with ? placeholders, and build the few expressions that differ with these helpers.
+"""
+from peewee import Database, SqliteDatabase
+
+from .db import database
+
+
+def is_sqlite(db: Database = None) -> bool:
+    """
+    Whether the database (or the database behind a proxy) is a SQLite database
+    :param db: The database, by default the database of the models
+    """
+    if db is None:
+        db = database
+    return isinstance(getattr(db, "obj", db), SqliteDatabase)
+
+
+def group_concat(expression: str) -> str:
+    """
+    The values of the expression in a group as text, separated by ;
+    """
+    if is_sqlite():
+        return f"group_concat({expression}, ';')"
+    return f"string_agg(cast({expression} as text), ';')"
+
+
+def hex_encode(expression: str) -> str:
+    """
+    The blob of the expression as lower case hex
+    """
+    if is_sqlite():
+        return f"lower(hex({expression}))"
+    return f"encode({expression}, 'hex')"
+
+
+def execute_sql(sql: str, params: tuple = ()):
+    """
+    Execute a raw query with ? placeholders on the database
+    """
+    if not is_sqlite():
+        sql = sql.replace("%", "%%").replace("?", database.param)
+    return database.execute_sql(sql, params)
@@ -8,7 +8,7 @@ class GovParams(BaseModel):
     staking_address = ForeignKeyField(Address, backref="gov_states")
     governance_token = ForeignKeyField(Token, backref="gov_states")
     vault_ft_policy = PolicyId()
-    min_quorum = IntegerField()
+    min_quorum = BigIntegerField()
     min_proposal_duration = IntegerField()
     gov_state_nft = ForeignKeyField(Token, backref="gov_states")
     tally_auth_nft_policy = PolicyId()
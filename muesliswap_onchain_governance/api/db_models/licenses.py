@@ -8,7 +8,7 @@ class LicenseMint(TransActionModel):
     """
 
     license_nft = ForeignKeyField(Token, backref="licenses")
-    amount = IntegerField()
+    amount = BigIntegerField()
     receiver = ForeignKeyField(Address, backref="received_licenses")
     tally_proposal_id = IntegerField()
     expiration_date = DateTimeField()
@@ -22,4 +22,4 @@ class LicenseOutput(OutputStateModel):
     Mirrors the presence of a license in an output
     """
 
-    license_nft = ForeignKeyField(Token, backref="licenses")
+    license_nft = ForeignKeyField(Token, backref="license_outputs")
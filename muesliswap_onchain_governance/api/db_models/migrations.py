@@ -0,0 +1,135 @@
+"""
+Migrations of databases created with earlier versions of the models.
+
+The version of the schema is kept in the user_version of SQLite databases and in the
+schemaversion table of PostgreSQL databases. New databases
+are created with the current models at the latest version, existing databases are
+migrated step by step before create_tables adds new tables and indexes.
+A migration is appended to MIGRATIONS whenever a column is added to or changed in an existing table.
+"""
+import logging
+from typing import Callable, List, Type
+
+from peewee import Database, ForeignKeyField
+
+from .db import BaseModel, Block, BytesField, OutputStateModel, TransactionOutput
+from .dialect import is_sqlite
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _add_live_flags(database: Database, models: List[Type[BaseModel]]):
+    """
+    Add the live flag to the state tables, states at spent outputs are not live
+    """
+    # the column type of peewee's BooleanField
+    column = (
+        "INTEGER NOT NULL DEFAULT 1"
+        if is_sqlite(database)
+        else "BOOLEAN NOT NULL DEFAULT TRUE"
+    )
+    for model in models:
+        if not issubclass(model, OutputStateModel):
+            continue
+        table = model._meta.table_name
+        if not database.table_exists(table):
+            continue
+        database.execute_sql(f'ALTER TABLE "{table}" ADD COLUMN "live" {column}')
+        model.update(live=False).where(
+            model.transaction_output.in_(
+                TransactionOutput.select(TransactionOutput.id).where(
+                    TransactionOutput.spent_in_block.is_null(False)
+                )
+            )
+        ).execute()
+
+
+def _is_bytes_column(field) -> bool:
+    if isinstance(field, ForeignKeyField):
+        field = field.rel_field
+    return isinstance(field, BytesField)
+
+
+def _store_hashes_as_bytes(database: Database, models: List[Type[BaseModel]]):
+    """
+    Convert the hashes, policy ids, asset names and addresses from hex text to raw bytes
+    """
+    columns = [
+        (model._meta.table_name, field)
+        for model in models
+        if database.table_exists(model._meta.table_name)
+        for field in model._meta.sorted_fields
+        if _is_bytes_column(field)
+    ]
+    if is_sqlite(database):
+        # the declared column types are kept, SQLite stores blobs in text columns as is
+        database.connection().create_function(
+            "unhex", 1, bytes.fromhex, deterministic=True
+        )
+        database.execute_sql("PRAGMA defer_foreign_keys = 1")
+        for table, field in columns:
+            database.execute_sql(
+                f'UPDATE "{table}" SET "{field.column_name}" = unhex("{field.column_name}") '
+                f"WHERE typeof(\"{field.column_name}\") = 'text'"
+            )
+        return
+    foreign_keys = [(t, f) for t, f in columns if isinstance(f, ForeignKeyField)]
+    for table, field in foreign_keys:
+        database.execute_sql(
+            f'ALTER TABLE "{table}" DROP CONSTRAINT "{table}_{field.column_name}_fkey"'
+        )
+    for table, field in columns:
+        database.execute_sql(
+            f'ALTER TABLE "{table}" ALTER COLUMN "{field.column_name}" '
+            f"TYPE BYTEA USING decode(\"{field.column_name}\", 'hex')"
+        )
+    for table, field in foreign_keys:
+        database.execute_sql(
+            f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_{field.column_name}_fkey" '
+            f'FOREIGN KEY ("{field.column_name}") '
+            f'REFERENCES "{field.rel_model._meta.table_name}" ("{field.rel_field.column_name}")'
+        )
+
+
+MIGRATIONS: List[Callable[[Database, List[Type[BaseModel]]], None]] = [
+    _add_live_flags,
+    _store_hashes_as_bytes,
+]
+
+
+def _schema_version(database: Database) -> int:
+    if is_sqlite(database):
+        return database.pragma("user_version")
+    if not database.table_exists("schemaversion"):
+        return 0
+    return database.execute_sql('SELECT "version" FROM "schemaversion"').fetchone()[0]
+
+
+def _set_schema_version(database: Database, version: int):
+    if is_sqlite(database):
+        database.pragma("user_version", version)
+        return
+    database.execute_sql(
+        'CREATE TABLE IF NOT EXISTS "schemaversion" ("version" INTEGER)'
+    )
+    database.execute_sql('DELETE FROM "schemaversion"')
+    database.execute_sql(
+        f'INSERT INTO "schemaversion" ("version") VALUES ({database.param})',
+        (version,),
+    )
+
+
+def create_schema(database: Database, models: List[Type[BaseModel]]):
+    """
+    Create the tables and indexes of the models, migrating an existing database first
+    :param database: The database, the models must be bound to it
+    :param models: All models of the database
+    """
+    with database.atomic():
+        version = _schema_version(database)
+        if database.table_exists(Block._meta.table_name):
+            for i, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                _LOGGER.info(f"Migrating the database to version {i}")
+                migration(database, models)
+        database.create_tables(models)
+        _set_schema_version(database, len(MIGRATIONS))
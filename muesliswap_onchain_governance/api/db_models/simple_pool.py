@@ -0,0 +1,20 @@
+from .db import *
+
+
+class PoolState(OutputStateModel):
+    """
+    Mirrors the current status of an on-chain simple pool and its reserves
+    """
+
+    pool_nft = ForeignKeyField(Token, backref="pool_states")
+    token_a = ForeignKeyField(Token, backref="pool_states_a")
+    token_b = ForeignKeyField(Token, backref="pool_states_b")
+    lp_token = ForeignKeyField(Token, backref="pool_states_lp")
+    fee_numerator = IntegerField()
+    fee_denominator = IntegerField()
+    last_applied_proposal_id = IntegerField()
+    # amounts of token a and b held by the pool output
+    reserve_a = BigIntegerField()
+    reserve_b = BigIntegerField()
+    # global_liquidity_tokens of the pool datum, i.e. the lp tokens in circulation
+    lp_supply = BigIntegerField()
@@ -23,10 +23,14 @@ class StakingParticipation(BaseModel):
 
     tally_auth_nft = ForeignKeyField(Token, backref="staking_participations")
     proposal_id = IntegerField()
-    weight = IntegerField()
+    weight = BigIntegerField()
     proposal_index = IntegerField()
     end_time = DateTimeField()
 
+    class Meta:
+        # participations are matched with the tally params of the proposal
+        indexes = ((("tally_auth_nft", "proposal_id"), False),)
+
 
 class StakingParticipationInStaking(BaseModel):
     """
@@ -79,7 +83,7 @@ class StakingDepositDelta(BaseModel):
         StakingDeposit, backref="staking_deposit_deltas", on_delete="CASCADE"
     )
     token = ForeignKeyField(Token, backref="staking_deposit_deltas")
-    amount = IntegerField()
+    amount = BigIntegerField()
 
     class Meta:
         constraints = [SQL("UNIQUE (staking_deposit_id, token_id)")]
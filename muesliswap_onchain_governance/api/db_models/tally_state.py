@@ -4,7 +4,7 @@ from .staking import StakingState
 
 
 class TallyParams(BaseModel):
-    quorum = IntegerField()
+    quorum = BigIntegerField()
     end_time = DateTimeField(null=True)
     proposal_id = IntegerField()
     tally_auth_nft = ForeignKeyField(Token, backref="tally_params")
@@ -13,6 +13,9 @@ class TallyParams(BaseModel):
     governance_token = ForeignKeyField(Token, backref="tally_params")
     vault_ft_policy = PolicyId()
 
+    class Meta:
+        indexes = ((("tally_auth_nft", "proposal_id"), False),)
+
 
 class TallyProposals(BaseModel):
     tally_params = ForeignKeyField(TallyParams, backref="tally_proposals")
@@ -37,7 +40,7 @@ class TallyWeights(BaseModel):
         TallyState, backref="tally_votes", on_delete="CASCADE"
     )
     index = IntegerField()
-    weight = IntegerField()
+    weight = BigIntegerField()
 
 
 class TallyVote(TransActionModel):
@@ -49,7 +52,7 @@ class TallyVote(TransActionModel):
         StakingState, backref="tally_voters", on_delete="CASCADE"
     )
     index = IntegerField()
-    weight_delta = IntegerField()
+    weight_delta = BigIntegerField()
     prev_tally_state = ForeignKeyField(
         TallyState, backref="tally_votes_prev", on_delete="CASCADE"
     )
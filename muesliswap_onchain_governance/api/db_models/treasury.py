@@ -58,7 +58,7 @@ class TreasuryDeltaValue(BaseModel):
         TreasuryDelta, backref="treasury_delta_values", on_delete="CASCADE"
     )
     token = ForeignKeyField(Token, backref="treasury_delta_values")
-    amount = IntegerField()
+    amount = BigIntegerField()
 
 
 TrackedTreasuryStates = List[TreasurerState]
@@ -1,23 +1,23 @@
-from ..db_models import sqlite_db
+from ..db_models.dialect import execute_sql, hex_encode
 
 
 def query_current_gov_state():
-    cursor = sqlite_db.execute_sql(
-        """
+    cursor = execute_sql(
+        f"""
         select
-        txo.transaction_hash,
+        {hex_encode('txo.transaction_hash')},
         txo.output_index,
         gs.last_proposal_id,
-        tally_address.address_raw,
-        staking_address.address_raw,
-        gov_token.policy_id,
-        gov_token.asset_name,
+        {hex_encode('tally_address.address_raw')},
+        {hex_encode('staking_address.address_raw')},
+        {hex_encode('gov_token.policy_id')},
+        {hex_encode('gov_token.asset_name')},
         gp.min_quorum,
         gp.min_proposal_duration,
-        gov_nft.policy_id,
-        gov_nft.asset_name,
-        gp.tally_auth_nft_policy,
-        gp.staking_vote_nft_policy,
+        {hex_encode('gov_nft.policy_id')},
+        {hex_encode('gov_nft.asset_name')},
+        {hex_encode('gp.tally_auth_nft_policy')},
+        {hex_encode('gp.staking_vote_nft_policy')},
         gp.latest_applied_proposal_id
         from govstate gs
         join transactionoutput txo on gs.transaction_output_id = txo.id
@@ -26,7 +26,7 @@ def query_current_gov_state():
         join address staking_address on gp.staking_address_id = staking_address.id
         join token gov_token on gp.governance_token_id = gov_token.id
         join token gov_nft on gp.gov_state_nft_id = gov_nft.id
-        where txo.spent_in_block_id is null
+        where gs.live
         """
     )
     results = []
@@ -0,0 +1,202 @@
+"""
+Live pools and swap quotes.
+
+The reserves of the live pools are kept in memory, keyed by the pool nft, so a quote needs
+no query. The table is reloaded from the pool states stored by the querier at most every
+RELOAD_INTERVAL seconds, the querier writes at most once per block.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from ..db_models.dialect import execute_sql, hex_encode
+
+# (policy id, asset name) in hex, lovelace are ("", "")
+TokenId = Tuple[str, str]
+
+RELOAD_INTERVAL = 5
+
+
+class UnknownPoolError(Exception):
+    pass
+
+
+class InvalidSwapError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class Pool:
+    transaction_hash: str
+    output_index: int
+    pool_nft: TokenId
+    token_a: TokenId
+    token_b: TokenId
+    lp_token: TokenId
+    fee_numerator: int
+    fee_denominator: int
+    reserve_a: int
+    reserve_b: int
+    lp_supply: int
+
+
+def token_id(token: str) -> TokenId:
+    """
+    Parse a token given as policy_id.asset_name, "." for lovelace
+    """
+    policy_id, _, asset_name = token.partition(".")
+    return policy_id, asset_name
+
+
+def swap_quote(pool: Pool, swap_token: TokenId, amount: int) -> Optional[dict]:
+    """
+    Quote swapping the given amount of one token of the pool for the other one,
+    with the constant product formula of check_swap in the pool contract.
+    :param pool: The pool to swap in
+    :param swap_token: The token sent to the pool, token a or token b
+    :param amount: The amount of the swap token that is swapped, without the fee
+    :return: The amount to deposit (including the fee) and the amount received, None if the swap is not possible
+    """
+    if amount <= 0:
+        return None
+    if swap_token == pool.token_a:
+        reserve_in, reserve_out, receive_token = (
+            pool.reserve_a,
+            pool.reserve_b,
+            pool.token_b,
+        )
+    elif swap_token == pool.token_b:
+        reserve_in, reserve_out, receive_token = (
+            pool.reserve_b,
+            pool.reserve_a,
+            pool.token_a,
+        )
+    else:
+        return None
+    # ceil(fee * amount) and floor(reserve_out - reserve_in * reserve_out / (reserve_in + amount))
+    fee = -(-pool.fee_numerator * amount // pool.fee_denominator)
+    receive = reserve_out * amount // (reserve_in + amount)
+    return {
+        "pool_nft": ".".join(pool.pool_nft),
+        "swap_token": ".".join(swap_token),
+        "receive_token": ".".join(receive_token),
+        "amount": amount,
+        "fee": fee,
+        "deposit": amount + fee,
+        "receive": receive,
+    }
+
+
+def _select_live_pools() -> Dict[TokenId, Pool]:
+    cursor = execute_sql(
+        f"""
+        select
+        {hex_encode('txo.transaction_hash')},
+        txo.output_index,
+        {hex_encode('pool_nft.policy_id')},
+        {hex_encode('pool_nft.asset_name')},
+        {hex_encode('token_a.policy_id')},
+        {hex_encode('token_a.asset_name')},
+        {hex_encode('token_b.policy_id')},
+        {hex_encode('token_b.asset_name')},
+        {hex_encode('lp_token.policy_id')},
+        {hex_encode('lp_token.asset_name')},
+        ps.fee_numerator,
+        ps.fee_denominator,
+        ps.reserve_a,
+        ps.reserve_b,
+        ps.lp_supply
+        from poolstate ps
+        join transactionoutput txo on ps.transaction_output_id = txo.id
+        join token pool_nft on ps.pool_nft_id = pool_nft.id
+        join token token_a on ps.token_a_id = token_a.id
+        join token token_b on ps.token_b_id = token_b.id
+        join token lp_token on ps.lp_token_id = lp_token.id
+        where ps.live
+        """
+    )
+    pools = {}
+    for row in cursor.fetchall():
+        pool = Pool(
+            transaction_hash=row[0],
+            output_index=row[1],
+            pool_nft=(row[2], row[3]),
+            token_a=(row[4], row[5]),
+            token_b=(row[6], row[7]),
+            lp_token=(row[8], row[9]),
+            fee_numerator=row[10],
+            fee_denominator=row[11],
+            reserve_a=row[12],
+            reserve_b=row[13],
+            lp_supply=row[14],
+        )
+        pools[pool.pool_nft] = pool
+    return pools
+
+
+class PoolReserves:
+    """
+    In-memory table of the live pools and their reserves, shared by the request threads
+    """
+
+    def __init__(self, reload_interval: float = RELOAD_INTERVAL):
+        self.reload_interval = reload_interval
+        self._pools: Dict[TokenId, Pool] = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def pools(self) -> Dict[TokenId, Pool]:
+        """
+        The live pools by pool nft, reloaded if older than the reload interval
+        """
+        now = time.monotonic()
+        if self._loaded_at is None or now - self._loaded_at >= self.reload_interval:
+            with self._lock:
+                if (
+                    self._loaded_at is None
+                    or now - self._loaded_at >= self.reload_interval
+                ):
+                    # replaced as a whole, readers never see a partially loaded table
+                    self._pools = _select_live_pools()
+                    self._loaded_at = now
+        return self._pools
+
+
+pool_reserves = PoolReserves()
+
+
+def _pool_json(pool: Pool) -> dict:
+    return {
+        "transaction_hash": pool.transaction_hash,
+        "output_index": pool.output_index,
+        "pool_nft": {"policy_id": pool.pool_nft[0], "asset_name": pool.pool_nft[1]},
+        "token_a": {"policy_id": pool.token_a[0], "asset_name": pool.token_a[1]},
+        "token_b": {"policy_id": pool.token_b[0], "asset_name": pool.token_b[1]},
+        "lp_token": {"policy_id": pool.lp_token[0], "asset_name": pool.lp_token[1]},
+        "fee": {"numerator": pool.fee_numerator, "denominator": pool.fee_denominator},
+        "reserve_a": pool.reserve_a,
+        "reserve_b": pool.reserve_b,
+        "lp_supply": pool.lp_supply,
+    }
+
+
+def query_pools() -> List[dict]:
+    return [_pool_json(pool) for pool in pool_reserves.pools().values()]
+
+
+def query_swap_quote(pool_nft: str, swap_token: str, amount: int) -> dict:
+    """
+    Quote a swap in the live pool with the given pool nft
+    :raises UnknownPoolError: If there is no live pool with the pool nft
+    :raises InvalidSwapError: If the swap token is not a token of the pool or the amount is not positive
+    """
+    pool = pool_reserves.pools().get(token_id(pool_nft))
+    if pool is None:
+        raise UnknownPoolError(f"No live pool with pool nft {pool_nft}")
+    quote = swap_quote(pool, token_id(swap_token), amount)
+    if quote is None:
+        raise InvalidSwapError(
+            f"Can not swap {amount} of {swap_token} in pool {pool_nft}"
+        )
+    return quote
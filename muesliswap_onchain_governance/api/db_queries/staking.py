@@ -3,7 +3,8 @@ import cbor2
 from muesliswap_onchain_governance.onchain.util import Participation
 from opshin.ledger.api_v2 import FinitePOSIXTime
 from .util import parse_merged_assets
-from ..db_models import sqlite_db
+from ..db_models import init_database
+from ..db_models.dialect import execute_sql, group_concat, hex_encode
 
 
 def parse_merged_participations(
@@ -106,46 +107,47 @@ def query_staking_positions_per_wallet(
     :param wallet: Hex encoded wallet address
     :return:
     """
-    cursor = sqlite_db.execute_sql(
-        """
+    cursor = execute_sql(
+        f"""
         with merged_transaction_output_value as (
             select
-            group_concat(tk.policy_id, ';') as policy_ids,
-            group_concat(tk.asset_name, ';') as asset_names,
-            group_concat(tov.amount, ';') as amounts,
-            group_concat(hex(d.data), ';') as delegated_actions,
+            {group_concat(hex_encode('tk.policy_id'))} as policy_ids,
+            {group_concat(hex_encode('tk.asset_name'))} as asset_names,
+            {group_concat('tov.amount')} as amounts,
+            {group_concat(hex_encode('d.data'))} as delegated_actions,
             tov.transaction_output_id
             from transactionoutputvalue tov
             join token tk on tov.token_id = tk.id
             left outer join votepermission vp on tov.token_id = vp.token_id
             left outer join datum d on vp.delegated_action_id = d.id
+            where tov.transaction_output_id in (select lss.transaction_output_id from stakingstate lss where lss.live)
             group by tov.transaction_output_id
         )
         
         SELECT
-        owner_a.address_raw,
-        txo.transaction_hash,
+        {hex_encode('owner_a.address_raw')},
+        {hex_encode('txo.transaction_hash')},
         txo.output_index,
-        tov.policy_ids,
-        tov.asset_names,
-        tov.amounts,
-        group_concat(spt.end_time, ';'),
-        group_concat(spt.weight, ';'),
-        group_concat(spt.proposal_index, ';'),
-        group_concat(spt.proposal_id, ';'),
-        group_concat(tally_txo.transaction_hash, ';'),
-        group_concat(tally_txo.output_index, ';'),
-        sp.vault_ft_policy,
-        gov_tk.policy_id,
-        gov_tk.asset_name,
-        tov.delegated_actions,
-        tally_auth_tk.policy_id,
-        tally_auth_tk.asset_name
+        mtov.policy_ids,
+        mtov.asset_names,
+        mtov.amounts,
+        {group_concat('spt.end_time')},
+        {group_concat('spt.weight')},
+        {group_concat('spt.proposal_index')},
+        {group_concat('spt.proposal_id')},
+        {group_concat(hex_encode('tally_txo.transaction_hash'))},
+        {group_concat('tally_txo.output_index')},
+        {hex_encode('sp.vault_ft_policy')},
+        {hex_encode('gov_tk.policy_id')},
+        {hex_encode('gov_tk.asset_name')},
+        mtov.delegated_actions,
+        {hex_encode('tally_auth_tk.policy_id')},
+        {hex_encode('tally_auth_tk.asset_name')}
         FROM stakingstate ss
         JOIN stakingparams sp on ss.staking_params_id = sp.id
         JOIN address owner_a on sp.owner_id = owner_a.id
         JOIN transactionoutput txo on ss.transaction_output_id = txo.id
-        JOIN merged_transaction_output_value tov on tov.transaction_output_id = txo.id
+        JOIN merged_transaction_output_value mtov on mtov.transaction_output_id = txo.id
         JOIN token gov_tk on sp.governance_token_id = gov_tk.id
         JOIN token tally_auth_tk on sp.tally_auth_nft_id = tally_auth_tk.id
         left outer JOIN stakingparticipationinstaking spis on ss.id = spis.staking_state_id
@@ -154,11 +156,11 @@ def query_staking_positions_per_wallet(
         left outer join tallystate ts on tp.id = ts.tally_params_id
         left outer join transactionoutput tally_txo on ts.transaction_output_id = tally_txo.id
         WHERE owner_a.address_raw = ? -- only for the given wallet
-        and txo.spent_in_block_id is null -- only unspent outputs
-        and tally_txo.spent_in_block_id is null -- only unspent tally outputs
-        group by owner_a.address_raw, txo.transaction_hash, txo.output_index, tov.policy_ids, tov.asset_names, tov.amounts, sp.vault_ft_policy, gov_tk.policy_id, gov_tk.asset_name
+        and ss.live -- only unspent outputs
+        and (ts.id is null or ts.live) -- only unspent tally outputs
+        group by owner_a.address_raw, txo.transaction_hash, txo.output_index, mtov.policy_ids, mtov.asset_names, mtov.amounts, sp.vault_ft_policy, gov_tk.policy_id, gov_tk.asset_name, mtov.delegated_actions, tally_auth_tk.policy_id, tally_auth_tk.asset_name
         """,
-        (wallet,),
+        (bytes.fromhex(wallet),),
     )
     results = []
     for row in cursor.fetchall():
@@ -186,29 +188,38 @@ def query_staking_history_per_wallet(wallet: str):
     :param wallet: Hex encoded wallet address
     :return:
     """
-    cursor = sqlite_db.execute_sql(
-        """
-        with merged_staking_deposit_delta as (
+    cursor = execute_sql(
+        f"""
+        with wallet_staking_deposit as (
+            select sd.id
+            from stakingdeposit sd
+            join stakingstate ss on sd.next_staking_state_id = ss.id
+            join stakingparams sps on ss.staking_params_id = sps.id
+            join address owner_a on sps.owner_id = owner_a.id
+            where owner_a.address_raw = ?
+        ),
+        merged_staking_deposit_delta as (
             select
-            group_concat(tk.policy_id, ';') as policy_ids,
-            group_concat(tk.asset_name, ';') as asset_names,
-            group_concat(sdd.amount, ';') as amounts,
-            group_concat(hex(d.data), ';') as delegated_actions,
+            {group_concat(hex_encode('tk.policy_id'))} as policy_ids,
+            {group_concat(hex_encode('tk.asset_name'))} as asset_names,
+            {group_concat('sdd.amount')} as amounts,
+            {group_concat(hex_encode('d.data'))} as delegated_actions,
             sdd.staking_deposit_id
             from stakingdepositdelta sdd
             join token tk on sdd.token_id = tk.id
             left outer join votepermission vp on sdd.token_id = vp.token_id
             left outer join datum d on vp.delegated_action_id = d.id
+            where sdd.staking_deposit_id in (select id from wallet_staking_deposit)
             group by sdd.staking_deposit_id
         ),
         merged_participation_additions as (
             select
-            group_concat(spt.end_time, ';') as end_times,
-            group_concat(spt.weight, ';') as weights,
-            group_concat(spt.proposal_index, ';') as proposal_indices,
-            group_concat(spt.proposal_id, ';') as proposal_ids,
-            group_concat(tally_txo.transaction_hash, ';') as tally_transaction_hashes,
-            group_concat(tally_txo.output_index, ';') as tally_output_indices,
+            {group_concat('spt.end_time')} as end_times,
+            {group_concat('spt.weight')} as weights,
+            {group_concat('spt.proposal_index')} as proposal_indices,
+            {group_concat('spt.proposal_id')} as proposal_ids,
+            {group_concat(hex_encode('tally_txo.transaction_hash'))} as tally_transaction_hashes,
+            {group_concat('tally_txo.output_index')} as tally_output_indices,
             spa.staking_deposit_id
             from stakingdepositparticipationadded spa
             join stakingparticipationinstaking spis on spa.staking_deposit_id = spis.staking_state_id
@@ -216,17 +227,18 @@ def query_staking_history_per_wallet(wallet: str):
             left outer join tallyparams tp on (spt.tally_auth_nft_id = tp.tally_auth_nft_id and spt.proposal_id = tp.proposal_id)
             left outer join tallystate ts on tp.id = ts.tally_params_id
             left outer join transactionoutput tally_txo on ts.transaction_output_id = tally_txo.id
-            where tally_txo.spent_in_block_id is null
+            where (ts.id is null or ts.live)
+            and spa.staking_deposit_id in (select id from wallet_staking_deposit)
             group by spa.staking_deposit_id
         ),
         merged_participation_retractions as (
             select
-            group_concat(spt.end_time, ';') as end_times,
-            group_concat(spt.weight, ';') as weights,
-            group_concat(spt.proposal_index, ';') as proposal_indices,
-            group_concat(spt.proposal_id, ';') as proposal_ids,
-            group_concat(tally_txo.transaction_hash, ';') as tally_transaction_hashes,
-            group_concat(tally_txo.output_index, ';') as tally_output_indices,
+            {group_concat('spt.end_time')} as end_times,
+            {group_concat('spt.weight')} as weights,
+            {group_concat('spt.proposal_index')} as proposal_indices,
+            {group_concat('spt.proposal_id')} as proposal_ids,
+            {group_concat(hex_encode('tally_txo.transaction_hash'))} as tally_transaction_hashes,
+            {group_concat('tally_txo.output_index')} as tally_output_indices,
             spa.staking_deposit_id
             from stakingdepositparticipationremoved spa
             join stakingparticipationinstaking spis on spa.staking_deposit_id = spis.staking_state_id
@@ -234,14 +246,15 @@ def query_staking_history_per_wallet(wallet: str):
             left outer join tallyparams tp on (spt.tally_auth_nft_id = tp.tally_auth_nft_id and spt.proposal_id = tp.proposal_id)
             left outer join tallystate ts on tp.id = ts.tally_params_id
             left outer join transactionoutput tally_txo on ts.transaction_output_id = tally_txo.id
-            where tally_txo.spent_in_block_id is null
+            where (ts.id is null or ts.live)
+            and spa.staking_deposit_id in (select id from wallet_staking_deposit)
             -- todo: join with block and mark as retraction only if the block is before the end time of the participation
             group by spa.staking_deposit_id
         )
         
         SELECT
         b.slot,
-        tx.transaction_hash,
+        {hex_encode('tx.transaction_hash')},
         tx.block_index,
         sdd.policy_ids,
         sdd.asset_names,
@@ -259,10 +272,10 @@ def query_staking_history_per_wallet(wallet: str):
         spr.proposal_ids,
         spr.tally_transaction_hashes,
         spr.tally_output_indices,
-        owner_a.address_raw
+        {hex_encode('owner_a.address_raw')}
         from stakingdeposit sd
         join "transaction" tx on sd.transaction_id = tx.id
-        join main.block b on tx.block_id = b.id
+        join "block" b on tx.block_id = b.id
         join stakingstate ss on sd.next_staking_state_id = ss.id
         join stakingparams sps on sps.id = ss.staking_params_id
         join address owner_a on sps.owner_id = owner_a.id
@@ -272,7 +285,7 @@ def query_staking_history_per_wallet(wallet: str):
         where owner_a.address_raw = ?
         order by b.slot, tx.block_index, tx.transaction_hash
         """,
-        (wallet,),
+        (bytes.fromhex(wallet), bytes.fromhex(wallet)),
     )
     results = []
     for row in cursor.fetchall():
@@ -296,6 +309,7 @@ def query_staking_history_per_wallet(wallet: str):
 
 
 if __name__ == "__main__":
+    init_database(read_only=True)
     print(
         query_staking_positions_per_wallet(
             "607195078bd15707f7a74581a317c41c14be16ffe7ce7dc0f22b039713"
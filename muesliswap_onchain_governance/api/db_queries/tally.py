@@ -1,10 +1,18 @@
+import datetime
 from typing import Optional
 
 import pycardano
 
-from muesliswap_onchain_governance.api.db_models import sqlite_db
+from muesliswap_onchain_governance.api.db_models import init_database
+from muesliswap_onchain_governance.api.db_models.dialect import (
+    execute_sql,
+    group_concat,
+    hex_encode,
+)
 from opshin.prelude import Token
 
+from .util import parse_token
+
 
 def parse_merged_tally_votes(
     weights: str, indices: str, proposals: str, proposal_indices: str
@@ -30,34 +38,37 @@ def query_tallies(closed: bool = True, open: bool = True):
     :param open: Show open tallies.
     :return:
     """
+    # end times are stored as naive local datetimes
     if open and closed:
-        dateconstraint = ""
+        dateconstraint, params = "", ()
     elif open:
-        dateconstraint = (
-            "and (tp.end_time is NULL or DATETIME(tp.end_time) > DATETIME('now'))"
-        )
+        dateconstraint = "and (tp.end_time is NULL or tp.end_time > ?)"
+        params = (datetime.datetime.now(),)
     elif closed:
-        dateconstraint = "and DATETIME(tp.end_time) <= DATETIME('now')"
+        dateconstraint = "and tp.end_time <= ?"
+        params = (datetime.datetime.now(),)
     else:
         return []
-    cursor = sqlite_db.execute_sql(
-        """
+    cursor = execute_sql(
+        f"""
         with merged_tally_votes as (
           select
-          sum(tw.weight) as total_weight,
-          group_concat(tw.weight, ';') as weights,
-          group_concat(tw."index", ';') as indices,
+          cast(sum(tw.weight) as bigint) as total_weight,
+          {group_concat('tw.weight')} as weights,
+          {group_concat('tw."index"')} as indices,
           tw.tally_state_id
           from tallyweights tw
+          where tw.tally_state_id in (select lts.id from tallystate lts where lts.live)
           group by tw.tally_state_id
         ),
         merged_tally_proposals as (
             select
             tp.tally_params_id,
-            group_concat(hex(d.data), ';') as proposals,
-            group_concat(tp."index", ';') as indices
+            {group_concat(hex_encode('d.data'))} as proposals,
+            {group_concat('tp."index"')} as indices
             from tallyproposals tp
             join datum d on tp.proposal_id = d.id
+            where tp.tally_params_id in (select lts.tally_params_id from tallystate lts where lts.live)
             group by tp.tally_params_id
         )
         
@@ -65,19 +76,19 @@ def query_tallies(closed: bool = True, open: bool = True):
         tp.quorum,
         tp.end_time,
         tp.proposal_id,
-        tally_auth_nft.policy_id,
-        tally_auth_nft.asset_name,
-        tp.staking_vote_nft_policy,
-        staking_address.address_raw,
-        gov_token.policy_id,
-        gov_token.asset_name,
-        tp.vault_ft_policy,
+        {hex_encode('tally_auth_nft.policy_id')},
+        {hex_encode('tally_auth_nft.asset_name')},
+        {hex_encode('tp.staking_vote_nft_policy')},
+        {hex_encode('staking_address.address_raw')},
+        {hex_encode('gov_token.policy_id')},
+        {hex_encode('gov_token.asset_name')},
+        {hex_encode('tp.vault_ft_policy')},
         mtv.total_weight,
         mtv.weights,
         mtv.indices,
         mtp.proposals,
         mtp.indices,
-        tx_out.transaction_hash,
+        {hex_encode('tx_out.transaction_hash')},
         tx_out.output_index
         FROM tallystate ts
         join tallyparams tp on ts.tally_params_id = tp.id
@@ -87,12 +98,13 @@ def query_tallies(closed: bool = True, open: bool = True):
         join token tally_auth_nft on tp.tally_auth_nft_id = tally_auth_nft.id
         join address staking_address on tp.staking_address_id = staking_address.id
         join token gov_token on tp.governance_token_id = gov_token.id
-        where tx_out.spent_in_block_id is NULL
+        where ts.live
         """
         + dateconstraint
         + """
         order by tp.end_time asc nulls first 
-        """
+        """,
+        params,
     )
     results = []
     for row in cursor.fetchall():
@@ -124,30 +136,32 @@ def query_tallies(closed: bool = True, open: bool = True):
 
 
 def query_tally_details_by_auth_nft_proposal_id(auth_nft: str, proposal_id: int):
-    cursor = sqlite_db.execute_sql(
-        """
+    cursor = execute_sql(
+        f"""
     with merged_tally_votes as (
         select
-        sum(tw.weight) as total_weight,
-        group_concat(tw.weight, ';') as weights,
-        group_concat(tw."index", ';') as indices,
+        cast(sum(tw.weight) as bigint) as total_weight,
+        {group_concat('tw.weight')} as weights,
+        {group_concat('tw."index"')} as indices,
         tw.tally_state_id
         from tallyweights tw
+        where tw.tally_state_id in (select lts.id from tallystate lts where lts.live)
         group by tw.tally_state_id
     ),
     merged_tally_proposals as (
         select
         tp.tally_params_id,
-        group_concat(hex(d.data), ';') as proposals,
-        group_concat(tp."index", ';') as indices
+        {group_concat(hex_encode('d.data'))} as proposals,
+        {group_concat('tp."index"')} as indices
         from tallyproposals tp
         join datum d on tp.proposal_id = d.id
+        where tp.tally_params_id in (select lts.tally_params_id from tallystate lts where lts.live)
         group by tp.tally_params_id
     ),
     merged_tally_creation_participants as (
         select
         tc.next_tally_state_id,
-        group_concat(address.address_raw, ';') as addresses
+        {group_concat(hex_encode('address.address_raw'))} as addresses
         from tallycreation tc
         join tallycreationparticipants tcp on tc.id = tcp.tally_creation_id
         join address on tcp.address_id = address.id
@@ -159,13 +173,13 @@ def query_tally_details_by_auth_nft_proposal_id(auth_nft: str, proposal_id: int)
     tp.quorum,
     tp.end_time,
     tp.proposal_id,
-    tally_auth_nft.policy_id,
-    tally_auth_nft.asset_name,
-    tp.staking_vote_nft_policy,
-    staking_address.address_raw,
-    gov_token.policy_id,
-    gov_token.asset_name,
-    tp.vault_ft_policy,
+    {hex_encode('tally_auth_nft.policy_id')},
+    {hex_encode('tally_auth_nft.asset_name')},
+    {hex_encode('tp.staking_vote_nft_policy')},
+    {hex_encode('staking_address.address_raw')},
+    {hex_encode('gov_token.policy_id')},
+    {hex_encode('gov_token.asset_name')},
+    {hex_encode('tp.vault_ft_policy')},
     mtv.total_weight,
     mtv.weights,
     mtv.indices,
@@ -173,7 +187,7 @@ def query_tally_details_by_auth_nft_proposal_id(auth_nft: str, proposal_id: int)
     mtp.indices,
     tcblk.slot,
     mtcps.addresses,
-    tx_out.transaction_hash,
+    {hex_encode('tx_out.transaction_hash')},
     tx_out.output_index
     FROM tallystate ts
     join tallyparams tp on ts.tally_params_id = tp.id
@@ -188,12 +202,12 @@ def query_tally_details_by_auth_nft_proposal_id(auth_nft: str, proposal_id: int)
     join "transaction" tctx on tc.transaction_id = tctx.id
     join "block" tcblk on tcblk.id = tctx.block_id
     join merged_tally_creation_participants mtcps on tc.next_tally_state_id = mtcps.next_tally_state_id
-    where tx_out.spent_in_block_id is NULL
+    where ts.live
     and tally_auth_nft.policy_id = ?
     and tally_auth_nft.asset_name = ?
     and tp.proposal_id = ?
     """,
-        (*auth_nft.split("."), proposal_id),
+        (*parse_token(auth_nft), proposal_id),
     )
     results = []
     for row in cursor.fetchall():
@@ -233,7 +247,7 @@ def query_tally_auth_nft_proposal_id(transaction_hash: str, transaction_index: i
     :param transaction_index:
     :return: (auth_nft, proposal_id) or None if the transaction output is not part of a tally
     """
-    cursor = sqlite_db.execute_sql(
+    cursor = execute_sql(
         """
     SELECT
     tk.policy_id,
@@ -246,10 +260,10 @@ def query_tally_auth_nft_proposal_id(transaction_hash: str, transaction_index: i
     where tx_out.transaction_hash = ?
     and tx_out.output_index = ?
     """,
-        (transaction_hash, transaction_index),
+        (bytes.fromhex(transaction_hash), transaction_index),
     )
     for row in cursor.fetchall():
-        return (Token(bytes.fromhex(row[0]), bytes.fromhex(row[1])), row[2])
+        return (Token(row[0], row[1]), row[2])
     return None
 
 
@@ -265,36 +279,41 @@ def query_tally_details_by_tx_out(transaction_hash: str, transaction_index: int)
     )
     if auth_nft_proposal_id is None:
         return []
-    return query_tally_details_by_auth_nft_proposal_id(*auth_nft_proposal_id)
+    auth_nft, proposal_id = auth_nft_proposal_id
+    return query_tally_details_by_auth_nft_proposal_id(
+        f"{auth_nft.policy_id.hex()}.{auth_nft.token_name.hex()}", proposal_id
+    )
 
 
 def query_tally_details_by_auth_nft_proposal_id_with_user_vote(
     auth_nft: str, proposal_id: int, user_address: str
 ):
-    cursor = sqlite_db.execute_sql(
-        """
+    cursor = execute_sql(
+        f"""
     with merged_tally_votes as (
         select
-        sum(tw.weight) as total_weight,
-        group_concat(tw.weight, ';') as weights,
-        group_concat(tw."index", ';') as indices,
+        cast(sum(tw.weight) as bigint) as total_weight,
+        {group_concat('tw.weight')} as weights,
+        {group_concat('tw."index"')} as indices,
         tw.tally_state_id
         from tallyweights tw
+        where tw.tally_state_id in (select lts.id from tallystate lts where lts.live)
         group by tw.tally_state_id
     ),
     merged_tally_proposals as (
         select
         tp.tally_params_id,
-        group_concat(hex(d.data), ';') as proposals,
-        group_concat(tp."index", ';') as indices
+        {group_concat(hex_encode('d.data'))} as proposals,
+        {group_concat('tp."index"')} as indices
         from tallyproposals tp
         join datum d on tp.proposal_id = d.id
+        where tp.tally_params_id in (select lts.tally_params_id from tallystate lts where lts.live)
         group by tp.tally_params_id
     ),
     merged_tally_creation_participants as (
         select
         tc.next_tally_state_id,
-        group_concat(address.address_raw, ';') as addresses
+        {group_concat(hex_encode('address.address_raw'))} as addresses
         from tallycreation tc
         join tallycreationparticipants tcp on tc.id = tcp.tally_creation_id
         join address on tcp.address_id = address.id
@@ -323,13 +342,13 @@ def query_tally_details_by_auth_nft_proposal_id_with_user_vote(
     tp.quorum,
     tp.end_time,
     tp.proposal_id,
-    tally_auth_nft.policy_id,
-    tally_auth_nft.asset_name,
-    tp.staking_vote_nft_policy,
-    staking_address.address_raw,
-    gov_token.policy_id,
-    gov_token.asset_name,
-    tp.vault_ft_policy,
+    {hex_encode('tally_auth_nft.policy_id')},
+    {hex_encode('tally_auth_nft.asset_name')},
+    {hex_encode('tp.staking_vote_nft_policy')},
+    {hex_encode('staking_address.address_raw')},
+    {hex_encode('gov_token.policy_id')},
+    {hex_encode('gov_token.asset_name')},
+    {hex_encode('tp.vault_ft_policy')},
     mtv.total_weight,
     mtv.weights,
     mtv.indices,
@@ -337,7 +356,7 @@ def query_tally_details_by_auth_nft_proposal_id_with_user_vote(
     mtp.indices,
     tcblk.slot,
     mtcps.addresses,
-    tx_out.transaction_hash,
+    {hex_encode('tx_out.transaction_hash')},
     tx_out.output_index,
     spart.weight,
     spart.proposal_index
@@ -360,17 +379,17 @@ def query_tally_details_by_auth_nft_proposal_id_with_user_vote(
     join tallyvote tv on tv.next_tally_state_id = ts.id
     join "transaction" last_vote_tx on tv.transaction_id = last_vote_tx.id
     join "block" last_vote_blk on last_vote_blk.id = last_vote_tx.block_id
-    where tx_out.spent_in_block_id is NULL
+    where ts.live
     and tally_auth_nft.policy_id = ?
     and tally_auth_nft.asset_name = ?
     and tp.proposal_id = ?
     and spart.slot <= last_vote_blk.slot
-    order by spart.slot desc
+    order by +spart.slot desc
     limit 1
     """,
         (
-            user_address,
-            *auth_nft.split("."),
+            bytes.fromhex(user_address),
+            *parse_token(auth_nft),
             proposal_id,
         ),
     )
@@ -420,13 +439,16 @@ def query_tally_details_by_tx_out_with_user_vote(
     )
     if auth_nft_proposal_id is None:
         return []
+    auth_nft, proposal_id = auth_nft_proposal_id
     return query_tally_details_by_auth_nft_proposal_id_with_user_vote(
-        *auth_nft_proposal_id, user_address
+        f"{auth_nft.policy_id.hex()}.{auth_nft.token_name.hex()}",
+        proposal_id,
+        user_address,
     )
 
 
 def query_all_user_votes_for_tally(auth_nft: str, proposal_id: int):
-    last_vote_slot, tally_state_id = sqlite_db.execute_sql(
+    last_vote_slot, tally_state_id = execute_sql(
         """
     SELECT
     last_vote_blk.slot,
@@ -441,18 +463,18 @@ def query_all_user_votes_for_tally(auth_nft: str, proposal_id: int):
     join tallyvote tv on tv.next_tally_state_id = ts.id
     join "transaction" last_vote_tx on tv.transaction_id = last_vote_tx.id
     join "block" last_vote_blk on last_vote_blk.id = last_vote_tx.block_id
-    where tx_out.spent_in_block_id is NULL
+    where ts.live
     and tally_auth_nft.policy_id = ?
     and tally_auth_nft.asset_name = ?
     and tp.proposal_id = ?
     """,
         (
-            *auth_nft.split("."),
+            *parse_token(auth_nft),
             proposal_id,
         ),
     ).fetchall()[0]
-    cursor = sqlite_db.execute_sql(
-        """
+    cursor = execute_sql(
+        f"""
     with latest_staking_state_before_vote_per_user as (
         select
         max(blk.slot) as slot,
@@ -463,12 +485,23 @@ def query_all_user_votes_for_tally(auth_nft: str, proposal_id: int):
         join "transaction" tx on tx_out.transaction_id = tx.id
         join "block" blk on tx.block_id = blk.id
         where blk.slot <= ?
+        -- only the owners that participate in the tally
+        and sp.owner_id in (
+            select psp.owner_id
+            from tallystate pts
+            join tallyparams ptp on pts.tally_params_id = ptp.id
+            join stakingparticipation pspt on pspt.tally_auth_nft_id = ptp.tally_auth_nft_id and pspt.proposal_id = ptp.proposal_id
+            join stakingparticipationinstaking pspis on pspt.id = pspis.participation_id
+            join stakingstate pss on pspis.staking_state_id = pss.id
+            join stakingparams psp on pss.staking_params_id = psp.id
+            where pts.id = ?
+        )
         group by sp.owner_id
     )
 
 
     SELECT
-    sa.address_raw,
+    {hex_encode('sa.address_raw')},
     sp.proposal_index,
     sp.weight
     FROM tallystate ts
@@ -488,6 +521,7 @@ def query_all_user_votes_for_tally(auth_nft: str, proposal_id: int):
         (
             last_vote_slot,
             tally_state_id,
+            tally_state_id,
         ),
     )
     results = []
@@ -503,6 +537,7 @@ def query_all_user_votes_for_tally(auth_nft: str, proposal_id: int):
 
 
 if __name__ == "__main__":
+    init_database(read_only=True)
     print(query_tallies(True, False))
     print(query_tallies(False, True))
     print(query_tallies(True, True))
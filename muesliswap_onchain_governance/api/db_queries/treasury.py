@@ -1,5 +1,6 @@
 from .util import parse_merged_assets
-from ..db_models import sqlite_db
+from ..db_models import init_database
+from ..db_models.dialect import execute_sql, group_concat, hex_encode
 
 
 def query_treasury_history():
@@ -7,13 +8,13 @@ def query_treasury_history():
     Query the treasury deposits and payouts
     :return: A list of treasury deposits and payouts in chronological order
     """
-    cursor = sqlite_db.execute_sql(
-        """
+    cursor = execute_sql(
+        f"""
         with merged_treasury_delta_value as (
             select
-            group_concat(tk.policy_id, ';') as policy_ids,
-            group_concat(tk.asset_name, ';') as asset_names,
-            group_concat(tdv.amount, ';') as amounts,
+            {group_concat(hex_encode('tk.policy_id'))} as policy_ids,
+            {group_concat(hex_encode('tk.asset_name'))} as asset_names,
+            {group_concat('tdv.amount')} as amounts,
             tdv.treasury_delta_id
             from treasurydeltavalue tdv
             join token tk on tdv.token_id = tk.id
@@ -22,9 +23,9 @@ def query_treasury_history():
         merged_treasury_payout as (
             select
             tp.treasury_delta_id,
-            payout_to.transaction_hash as payout_transaction_hash,
+            {hex_encode('payout_to.transaction_hash')} as payout_transaction_hash,
             payout_to.output_index as payout_output_index,
-            tally_to.transaction_hash as tally_transaction_hash,
+            {hex_encode('tally_to.transaction_hash')} as tally_transaction_hash,
             tally_to.output_index as tally_output_index
             from treasurypayout tp
             join transactionoutput payout_to on tp.payout_output_id = payout_to.id
@@ -34,7 +35,7 @@ def query_treasury_history():
         
         SELECT 
         b.slot,
-        tx.transaction_hash,
+        {hex_encode('tx.transaction_hash')},
         tx.block_index,
         tp.payout_transaction_hash,
         tp.payout_output_index,
@@ -48,7 +49,8 @@ def query_treasury_history():
         join "block" b on tx.block_id = b.id
         left outer join merged_treasury_delta_value tdv on tdv.treasury_delta_id = td.id
         left outer join merged_treasury_payout tp on tp.treasury_delta_id = td.id
-        ORDER BY b.slot, tx.block_index, tx.transaction_hash
+        -- the unary + keeps sqlite from walking all blocks in slot order
+        ORDER BY +b.slot, tx.block_index, tx.transaction_hash
         """
     )
     results = []
@@ -72,27 +74,39 @@ def query_treasury_history():
 
 
 def query_historical_treasury_funds():
-    cursor = sqlite_db.execute_sql(
-        """
+    cursor = execute_sql(
+        f"""
+        with treasury_delta_slot as (
+            select distinct
+            tdv_block.slot
+            from treasurydelta tdv
+            join "transaction" tdv_tx on tdv.transaction_id = tdv_tx.id
+            join "block" tdv_block on tdv_tx.block_id = tdv_block.id
+        ),
+        value_store_value as (
+            select
+            tov.token_id,
+            tov.amount,
+            created_blk.slot as created_slot,
+            spent_blk.slot as spent_slot
+            from valuestorestate vss
+            join transactionoutput txo on vss.transaction_output_id = txo.id
+            join transactionoutputvalue tov on tov.transaction_output_id = vss.transaction_output_id
+            join "transaction" created_tx on txo.transaction_id = created_tx.id
+            join "block" created_blk on created_tx.block_id = created_blk.id
+            left outer join "block" spent_blk on txo.spent_in_block_id = spent_blk.id
+        )
+
         select
-        tdv_block.slot,
-        tk.policy_id,
-        tk.asset_name,
-        sum(tov.amount) as amount
-        from 
-        treasurydelta tdv
-        join "transaction" tdv_tx on tdv.transaction_id = tdv_tx.id
-        join "block" tdv_block on tdv_tx.block_id = tdv_block.id,
-        valuestorestate vss
-        join transactionoutput txo on vss.transaction_output_id = txo.id
-        join transactionoutputvalue tov on txo.id = tov.transaction_output_id
-        join token tk on tov.token_id = tk.id
-        join "transaction" created_tx on txo.transaction_id = created_tx.id
-        join "block" created_blk on created_tx.block_id = created_blk.id
-        left outer join "block" spent_blk on txo.spent_in_block_id = spent_blk.id
-        where created_blk.slot <= tdv_block.slot
-        and (txo.spent_in_block_id is null or spent_blk.slot > tdv_block.slot)
-        group by tdv_block.slot, tk.policy_id, tk.asset_name
+        tds.slot,
+        {hex_encode('tk.policy_id')},
+        {hex_encode('tk.asset_name')},
+        cast(sum(vsv.amount) as bigint) as amount
+        from treasury_delta_slot tds
+        join value_store_value vsv on vsv.created_slot <= tds.slot and (vsv.spent_slot is null or vsv.spent_slot > tds.slot)
+        join token tk on vsv.token_id = tk.id
+        group by tds.slot, tk.policy_id, tk.asset_name
+        order by tds.slot
         """,
     )
     results = []
@@ -114,17 +128,15 @@ def query_historical_treasury_funds():
 
 
 def query_current_treasury_funds():
-    cursor = sqlite_db.execute_sql(
-        """
+    cursor = execute_sql(
+        f"""
         select
-        tk.policy_id,
-        tk.asset_name,
-        sum(tov.amount) as amount
-        from valuestorestate vss
-        join transactionoutput txo on vss.transaction_output_id = txo.id
-        join transactionoutputvalue tov on txo.id = tov.transaction_output_id
+        {hex_encode('tk.policy_id')},
+        {hex_encode('tk.asset_name')},
+        cast(sum(tov.amount) as bigint) as amount
+        from transactionoutputvalue tov
         join token tk on tov.token_id = tk.id
-        where txo.spent_in_block_id is null
+        where tov.transaction_output_id in (select vss.transaction_output_id from valuestorestate vss where vss.live)
         group by tk.policy_id, tk.asset_name
         """,
     )
@@ -141,6 +153,7 @@ def query_current_treasury_funds():
 
 
 if __name__ == "__main__":
+    init_database(read_only=True)
     print(query_treasury_history())
     print(query_historical_treasury_funds())
     print(query_current_treasury_funds())
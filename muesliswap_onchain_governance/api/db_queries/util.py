@@ -1,3 +1,16 @@
+from typing import Tuple
+
+
+def parse_token(token: str) -> Tuple[bytes, bytes]:
+    """
+    Parse a token given as policy_id.asset_name in hex
+    :param token: The token, i.e. from the API
+    :return: The raw policy id and asset name, as stored in the database
+    """
+    policy_id, _, asset_name = token.partition(".")
+    return bytes.fromhex(policy_id), bytes.fromhex(asset_name)
+
+
 def parse_merged_assets(policy_ids, asset_names, amounts):
     """
     Parse the merged assets
@@ -0,0 +1,205 @@
+"""
+Decodes the relevant transactions of upcoming blocks in a pool of worker processes,
+while the querier is still busy writing the previous blocks to the database.
+"""
+import io
+import multiprocessing
+import pickle
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    Optional,
+    Tuple,
+)
+
+import cbor2
+from pycardano.serialization import DictCBORSerializable
+
+from . import ogmios
+from .metrics import metrics
+from .util import FixedTxHashTransaction
+
+# the worker processes import this module, they must not load the database models
+if TYPE_CHECKING:
+    from .tx_filter import RelevanceFilter
+
+
+def _restore_dict_serializable(cls, data: dict) -> DictCBORSerializable:
+    restored = cls.__new__(cls)
+    restored.data = data
+    return restored
+
+
+class _TransactionPickler(pickle.Pickler):
+    """
+    pycardano transactions can not be pickled as is, because DictCBORSerializable
+    forwards attribute lookups to its (not yet restored) data and cbor2 tags are not picklable
+    """
+
+    def reducer_override(self, obj):
+        if isinstance(obj, DictCBORSerializable):
+            return _restore_dict_serializable, (type(obj), obj.data)
+        if isinstance(obj, cbor2.CBORTag):
+            return cbor2.CBORTag, (obj.tag, obj.value)
+        return NotImplemented
+
+
+def _decode_txs(txs: [dict]) -> Tuple[float, bytes]:
+    """
+    Decode the given transactions, executed in the worker processes.
+    The result is pickled here because the pool would use the default pickler.
+    :return: the time spent decoding and the pickled transactions
+    """
+    start = time.perf_counter()
+    decoded = [ogmios.decode_tx(tx) for tx in txs]
+    duration = time.perf_counter() - start
+    buffer = io.BytesIO()
+    _TransactionPickler(buffer, protocol=pickle.HIGHEST_PROTOCOL).dump(decoded)
+    return duration, buffer.getvalue()
+
+
+class DecodedBlock:
+    """
+    The (pending) decoded relevant transactions of a block
+    """
+
+    def __init__(self, block_indices: [int] = (), future: Future = None):
+        self._block_indices = block_indices
+        self._future = future
+        self._decoded: Optional[Dict[int, FixedTxHashTransaction]] = None
+
+    def get(self, block_index: int, tx: dict) -> Optional[FixedTxHashTransaction]:
+        """
+        Obtain the decoded transaction at the given index of the block.
+        Transactions that were not considered relevant when the block was submitted
+        (because the tracked states changed in the meantime) are decoded on the spot.
+        """
+        if self._decoded is None:
+            self._decoded = {}
+            if self._future is not None:
+                with metrics.timer("decode_wait"):
+                    duration, data = self._future.result()
+                metrics.observe("decode", duration)
+                self._decoded = dict(zip(self._block_indices, pickle.loads(data)))
+        if block_index in self._decoded:
+            return self._decoded[block_index]
+        with metrics.timer("decode"):
+            return ogmios.decode_tx(tx)
+
+
+def submit_decode(
+    pool: ProcessPoolExecutor, block_indices: [int], txs: [dict]
+) -> DecodedBlock:
+    """
+    Submit transactions (in ogmios json format, only id and cbor are needed) of a block for decoding
+    """
+    return DecodedBlock(block_indices, pool.submit(_decode_txs, txs))
+
+
+class DecodeStage:
+    """
+    Submits the relevant transactions of the next `lookahead` blocks to a process pool for decoding.
+    Blocks and their decoded transactions are handed back strictly in the order they were received.
+    """
+
+    def __init__(
+        self,
+        tx_filter: "RelevanceFilter",
+        max_workers: int = None,
+        lookahead: int = 100,
+    ):
+        self.tx_filter = tx_filter
+        self.lookahead = lookahead
+        self.max_workers = max_workers
+        self._pending = deque()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def start(self):
+        """
+        Fork the worker processes, unless decoding in the main process.
+        Call this before any thread is started and before the database is connected,
+        the forked workers would inherit them. Spawned workers would instead re-import
+        the querier module and with it the database models.
+        Otherwise the workers are forked when the iteration starts.
+        """
+        if self.max_workers == 0 or self._pool is not None:
+            return
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("fork"),
+        )
+        self._pool.submit(int).result()
+
+    def _submit(
+        self, pool: ProcessPoolExecutor, operation: ogmios.NextBlockResult
+    ) -> Optional[DecodedBlock]:
+        if not isinstance(operation, ogmios.Rollforward):
+            return None
+        relevant_txs = [
+            (i, tx)
+            for i, tx in enumerate(ogmios.transactions_from_block(operation.block))
+            if self.tx_filter.is_relevant(tx)
+        ]
+        if not relevant_txs:
+            return DecodedBlock()
+        block_indices = [i for i, _ in relevant_txs]
+        # only send what is needed for decoding to the worker
+        txs = [{"id": tx["id"], "cbor": tx["cbor"]} for _, tx in relevant_txs]
+        return submit_decode(pool, block_indices, txs)
+
+    @property
+    def buffered(self) -> int:
+        """
+        The number of operations that were received and submitted, but not yet handed back
+        """
+        return len(self._pending)
+
+    def iterate(
+        self,
+        operations: Iterable[ogmios.NextBlockResult],
+        buffered: Callable[[], int] = None,
+    ) -> Iterator[Tuple[ogmios.NextBlockResult, Optional[DecodedBlock]]]:
+        """
+        Iterate over the operations together with their decoded transactions (None for rollbacks)
+        :param operations: The operations to decode
+        :param buffered: Returns the number of operations that can be obtained without waiting.
+            Only these are submitted ahead, so that a block is never held back while waiting for the next one.
+            By default, all operations are assumed to be available immediately.
+        """
+        if self.max_workers == 0:
+            for operation in operations:
+                yield operation, (
+                    DecodedBlock()
+                    if isinstance(operation, ogmios.Rollforward)
+                    else None
+                )
+            return
+        operations = iter(operations)
+        # forked before the operations are pulled, which starts the receiver thread
+        self.start()
+        pool, self._pool = self._pool, None
+        with pool:
+            pending = self._pending = deque()
+            exhausted = False
+            while not exhausted or pending:
+                while not exhausted and (
+                    not pending
+                    or (
+                        len(pending) < self.lookahead
+                        and (buffered is None or buffered() > 0)
+                    )
+                ):
+                    try:
+                        operation = next(operations)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending.append((operation, self._submit(pool, operation)))
+                if pending:
+                    yield pending.popleft()
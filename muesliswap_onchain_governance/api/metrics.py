@@ -0,0 +1,166 @@
+"""
+Timings and counters of the stages of the querier, exposed in the Prometheus text format.
+The querier serves them on a side port, as the API server runs in a different process.
+"""
+import contextlib
+import http.server
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Deque, Dict, Tuple
+
+PREFIX = "muesliswap_querier"
+QUANTILES = (0.5, 0.99)
+
+COUNTERS = {
+    "blocks": "Number of processed blocks",
+    "transactions": "Number of transactions in the processed blocks",
+    "relevant_transactions": "Number of transactions passed to the processors",
+    "rollbacks": "Number of rollbacks",
+}
+# counters that are only reported for the label values that occurred
+LABELLED_COUNTERS = {
+    "interning_cache_lookups": "Lookups of database rows in the interning caches, by cache and result",
+    "datum_cache_lookups": "Lookups of decoded datums, structures and their rows in the datum cache, by kind and result",
+}
+GAUGES = {
+    "sync_lag_slots": "Slots between the last processed block and the tip of the chain",
+    "pipeline_depth": "Number of nextBlock requests kept in flight",
+}
+
+
+class StageTimer:
+    """
+    Total time and count of a stage, and its most recent samples to estimate quantiles
+    """
+
+    def __init__(self, reservoir_size: int):
+        self.count = 0
+        self.total = 0.0
+        self.samples: Deque[float] = deque(maxlen=reservoir_size)
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.samples.append(seconds)
+
+    def quantile(self, q: float) -> float:
+        if not self.samples:
+            return float("nan")
+        samples = sorted(self.samples)
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class Metrics:
+    """
+    Thread safe registry of stage timers, counters and gauges
+    """
+
+    def __init__(self, reservoir_size: int = 1000):
+        self.reservoir_size = reservoir_size
+        self._lock = threading.Lock()
+        self._stages: Dict[str, StageTimer] = {}
+        self._counters: Dict[str, int] = defaultdict(int)
+        self._labelled_counters: Dict[
+            Tuple[str, Tuple[Tuple[str, str], ...]], int
+        ] = defaultdict(int)
+        self._gauges: Dict[str, float] = {}
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            if stage not in self._stages:
+                self._stages[stage] = StageTimer(self.reservoir_size)
+            self._stages[stage].observe(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, stage: str):
+        """
+        Record the time spent in the body as a sample of the given stage
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def inc(self, counter: str, amount: int = 1, **labels: str):
+        with self._lock:
+            if labels:
+                self._labelled_counters[
+                    (counter, tuple(sorted(labels.items())))
+                ] += amount
+            else:
+                self._counters[counter] += amount
+
+    def set(self, gauge: str, value: float):
+        with self._lock:
+            self._gauges[gauge] = value
+
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text format
+        """
+        lines = []
+        with self._lock:
+            name = f"{PREFIX}_stage_seconds"
+            lines.append(f"# HELP {name} Time spent in each stage of the querier")
+            lines.append(f"# TYPE {name} summary")
+            for stage, timer in sorted(self._stages.items()):
+                for q in QUANTILES:
+                    lines.append(
+                        f'{name}{{stage="{stage}",quantile="{q}"}} {timer.quantile(q)}'
+                    )
+                lines.append(f'{name}_sum{{stage="{stage}"}} {timer.total}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {timer.count}')
+            for counter, description in COUNTERS.items():
+                name = f"{PREFIX}_{counter}_total"
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name} {self._counters[counter]}")
+            for counter, description in LABELLED_COUNTERS.items():
+                name = f"{PREFIX}_{counter}_total"
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} counter")
+                for (c, labels), value in sorted(self._labelled_counters.items()):
+                    if c != counter:
+                        continue
+                    label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                    lines.append(f"{name}{{{label_text}}} {value}")
+            for gauge, description in GAUGES.items():
+                if gauge not in self._gauges:
+                    continue
+                name = f"{PREFIX}_{gauge}"
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {self._gauges[gauge]}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port: int, host: str = "0.0.0.0") -> http.server.HTTPServer:
+    """
+    Serve the metrics at /metrics on the given port from a background thread
+    """
+    server = http.server.ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(
+        target=server.serve_forever, name="metrics-server", daemon=True
+    ).start()
+    return server
@@ -1,16 +1,22 @@
+import asyncio
+import contextlib
 import json
+import math
+import threading
 import time
 import logging
+from collections import deque
 from dataclasses import dataclass
 
 import pycardano
-import websocket
+import websockets
 
 from muesliswap_onchain_governance.api.config import (
     start_block_slot,
     start_block_hash,
 )
 from muesliswap_onchain_governance.api.util import FixedTxHashTransaction
+from muesliswap_onchain_governance.api.metrics import metrics
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -55,45 +61,211 @@ class Rollback:
 NextBlockResult = Rollforward | Rollback
 
 
+class PipelineWindow:
+    """
+    Adaptive number of nextBlock requests that are kept in flight.
+
+    By Little's law, the number of outstanding requests needed so that the consumer never waits
+    for the node is the round-trip latency of a request divided by the time it takes to process a block.
+    Both are tracked as exponential moving averages, the window is kept within [min_depth, max_depth].
+
+    The latency must not include the time a request waits behind the requests already in flight,
+    otherwise a deeper window measures a higher latency and grows further. Therefore only requests
+    sent to an empty pipeline are timed: every `probe_interval` responses, the pipeline is drained
+    and the next request is sent on its own.
+    """
+
+    def __init__(
+        self,
+        min_depth: int = 10,
+        max_depth: int = 1000,
+        initial_depth: int = 100,
+        smoothing: float = 0.05,
+        headroom: float = 2.0,
+        probe_interval: int = 1000,
+    ):
+        assert 0 < min_depth <= initial_depth <= max_depth
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.smoothing = smoothing
+        self.headroom = headroom
+        self.probe_interval = probe_interval
+        self.latency = None
+        self.processing_time = None
+        self._depth = initial_depth
+        self._responses = 0
+        # the first request is sent to an empty pipeline anyway
+        self._next_probe = 0
+
+    def _average(self, current: float | None, sample: float) -> float:
+        if current is None:
+            return sample
+        return (1 - self.smoothing) * current + self.smoothing * sample
+
+    def _update_depth(self):
+        if self.latency is None or not self.processing_time:
+            return
+        depth = math.ceil(self.headroom * self.latency / self.processing_time)
+        self._depth = max(self.min_depth, min(self.max_depth, depth))
+
+    def record_latency(self, seconds: float):
+        """
+        Record the time between sending a nextBlock request to an empty pipeline and receiving its response
+        """
+        self.latency = self._average(self.latency, seconds)
+        self._update_depth()
+
+    def requests_to_send(self, in_flight: int) -> int:
+        """
+        The number of nextBlock requests to send now, none while the pipeline is drained for a probe
+        :param in_flight: The number of requests that were sent and not answered yet
+        """
+        if self._responses < self._next_probe:
+            return max(0, self._depth - in_flight)
+        if in_flight:
+            return 0
+        self._next_probe = self._responses + self.probe_interval
+        return 1
+
+    def record_response(self, sent: float, received: float, alone: bool):
+        """
+        Record the response to a nextBlock request
+        :param sent: Monotonic time the request was sent
+        :param received: Monotonic time the response was received
+        :param alone: Whether the request was sent to an empty pipeline, only then its latency is recorded
+        """
+        self._responses += 1
+        if alone:
+            self.record_latency(received - sent)
+
+    def record_processing(self, seconds: float):
+        """
+        Record the time the consumer spent on a single block
+        """
+        self.processing_time = self._average(self.processing_time, seconds)
+        self._update_depth()
+
+    @property
+    def depth(self) -> int:
+        return self._depth
+
+
+def parse_next_block_response(resp: dict) -> NextBlockResult:
+    result = resp["result"]
+    if result["direction"] == "forward":
+        return Rollforward(
+            tip=Tip(**result["tip"]),
+            block=result["block"],
+        )
+    return Rollback(
+        tip=Point(**result["point"]) if "origin" != result["point"] else Origin(),
+    )
+
+
+def find_intersection_request(start_points: list[Point]) -> str:
+    data = TEMPLATE.copy()
+    data["method"] = "findIntersection"
+    data["params"] = {
+        "points": [{"slot": p.slot, "id": p.id} for p in start_points]
+        + [{"slot": start_block_slot, "id": start_block_hash}]
+        # we send the origin so we will always find an intersection
+        + ["origin"]
+    }
+    return json.dumps(data)
+
+
 class OgmiosIterator:
-    def __init__(self, ogmios_url: str):
+    """
+    Chain-sync client for Ogmios.
+
+    Blocks are received by an asyncio client running in a background thread, which keeps an
+    adaptive number of nextBlock requests in flight (see PipelineWindow) and hands the parsed
+    results to the consumer through a bounded queue. This way, the node and the network are
+    busy while the consumer writes the previous blocks to the database.
+    If a recorder (see block_recording.BlockRecorder) is given, all raw responses are recorded.
+    """
+
+    def __init__(
+        self,
+        ogmios_url: str,
+        window: PipelineWindow = None,
+        queue_size: int = 200,
+        recorder=None,
+    ):
         self.ogmios_url = ogmios_url
-        self.ws = websocket.WebSocket()
-        self.ws.connect(self.ogmios_url)
-
-    def _init_connection(self, start_points: list[Point]):
-        data = TEMPLATE.copy()
-        data["method"] = "findIntersection"
-        data["params"] = {
-            "points": [{"slot": p.slot, "id": p.id} for p in start_points]
-            + [{"slot": start_block_slot, "id": start_block_hash}]
-            + ["origin"]
-        }
-
-        self.ws.send(json.dumps(data))
-        # we send the origin so we will always find an intersection
-        print(self.ws.recv())
+        self.window = window if window is not None else PipelineWindow()
+        self.queue_size = queue_size
+        self.recorder = recorder
+        self._queue = None
+
+    @property
+    def buffered(self) -> int:
+        """
+        Number of received operations that are waiting to be consumed
+        """
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def iterate_blocks_async(self, start_points: list[Point]):
+        """
+        Asynchronously iterate over the blocks following the intersection with the start points
+        """
+        async with websockets.connect(self.ogmios_url, max_size=None) as ws:
+            await ws.send(find_intersection_request(start_points))
+            _LOGGER.info(f"Intersection: {await ws.recv()}")
+            in_flight = deque()
+            while True:
+                for _ in range(self.window.requests_to_send(len(in_flight))):
+                    await ws.send(NEXT_BLOCK)
+                    in_flight.append((time.monotonic(), not in_flight))
+                with metrics.timer("receive"):
+                    resp = await ws.recv()
+                sent, alone = in_flight.popleft()
+                self.window.record_response(sent, time.monotonic(), alone)
+                metrics.set("pipeline_depth", self.window.depth)
+                with metrics.timer("parse"):
+                    operation = parse_next_block_response(json.loads(resp))
+                if self.recorder is not None:
+                    self.recorder.record(resp, operation)
+                yield operation
+
+    async def _receive_blocks(self, start_points: list[Point], queue: asyncio.Queue):
+        try:
+            async for operation in self.iterate_blocks_async(start_points):
+                await queue.put(operation)
+        except Exception as e:
+            await queue.put(e)
 
     def iterate_blocks(self, start_points: list[Point]):
-        self._init_connection(start_points)
-        # we want to always keep 100 blocks in queue to avoid waiting for node
-        for _ in range(100):
-            self.ws.send(NEXT_BLOCK)
-        while True:
-            resp = json.loads(self.ws.recv())
-            result = resp["result"]
-            if result["direction"] == "forward":
-                yield Rollforward(
-                    tip=Tip(**result["tip"]),
-                    block=result["block"],
-                )
-            else:
-                yield Rollback(
-                    tip=Point(**result["point"])
-                    if "origin" != result["point"]
-                    else Origin(),
-                )
-            self.ws.send(NEXT_BLOCK)
+        """
+        Iterate over the blocks following the intersection with the start points.
+        The blocks are received in a background thread while the caller processes the previous ones.
+        """
+        loop = asyncio.new_event_loop()
+        queue = self._queue = asyncio.Queue(maxsize=self.queue_size)
+        receiver = loop.create_task(self._receive_blocks(start_points, queue))
+        thread = threading.Thread(
+            target=loop.run_forever, name="ogmios-receiver", daemon=True
+        )
+        thread.start()
+        try:
+            while True:
+                operation = asyncio.run_coroutine_threadsafe(queue.get(), loop).result()
+                if isinstance(operation, Exception):
+                    raise operation
+                start = time.monotonic()
+                yield operation
+                self.window.record_processing(time.monotonic() - start)
+        finally:
+
+            async def shutdown():
+                receiver.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await receiver
+
+            asyncio.run_coroutine_threadsafe(shutdown(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
 
 
 def tip_from_block(block: dict) -> Tip:
@@ -104,39 +276,51 @@ def tip_from_block(block: dict) -> Tip:
     )
 
 
-def txs_from_block(block: dict) -> list[FixedTxHashTransaction]:
+def transactions_from_block(block: dict) -> list[dict]:
     if block["type"] == "ebb":
         return []
-    txs_transformed = []
-    for tx in block["transactions"]:
-        try:
-            txs_transformed.append(
-                FixedTxHashTransaction(
-                    transaction=pycardano.Transaction.from_cbor(tx["cbor"]),
-                    hash=tx["id"],
-                )
+    return block["transactions"]
+
+
+def decode_tx(tx: dict) -> FixedTxHashTransaction | None:
+    """
+    Decode the cbor of a transaction in ogmios json format.
+    Returns None for transactions that pycardano can not represent.
+    """
+    try:
+        return FixedTxHashTransaction(
+            transaction=pycardano.Transaction.from_cbor(tx["cbor"]),
+            hash=tx["id"],
+        )
+    except KeyError as e:
+        raise ValueError(
+            f"Error parsing transactions in block: {e}, make sure that --include-cbor is set as flag when running ogmios"
+        ) from e
+    except pycardano.DeserializeException as e:
+        if "pycardano.certificate" in str(e):
+            _LOGGER.info(
+                "Ignoring transaction with a certificate that is not supported by pycardano"
             )
-        except KeyError as e:
-            raise ValueError(
-                f"Error parsing transactions in block: {e}, make sure that --include-cbor is set as flag when running ogmios"
-            ) from e
-        except pycardano.DeserializeException as e:
-            if "pycardano.certificate" in str(e):
-                _LOGGER.info(
-                    "Ignoring transaction with a certificate that is not supported by pycardano"
-                )
-                continue
-            print(tx)
-            raise ValueError(f"Error parsing transactions in block: {e}") from e
-        except ValueError as e:
-            if "2 is not a valid Network" in str(e):
-                _LOGGER.info(
-                    "Ignoring transaction with Byron address, not supported by pycardano"
-                )
-                continue
-            print(tx)
-            raise ValueError(f"Error parsing transactions in block: {e}") from e
-        except Exception as e:
-            print(tx)
-            raise ValueError(f"Error parsing transactions in block: {e}") from e
+            return None
+        print(tx)
+        raise ValueError(f"Error parsing transactions in block: {e}") from e
+    except ValueError as e:
+        if "2 is not a valid Network" in str(e):
+            _LOGGER.info(
+                "Ignoring transaction with Byron address, not supported by pycardano"
+            )
+            return None
+        print(tx)
+        raise ValueError(f"Error parsing transactions in block: {e}") from e
+    except Exception as e:
+        print(tx)
+        raise ValueError(f"Error parsing transactions in block: {e}") from e
+
+
+def txs_from_block(block: dict) -> list[FixedTxHashTransaction]:
+    txs_transformed = []
+    for tx in transactions_from_block(block):
+        decoded_tx = decode_tx(tx)
+        if decoded_tx is not None:
+            txs_transformed.append(decoded_tx)
     return txs_transformed
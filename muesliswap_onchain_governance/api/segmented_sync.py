@@ -0,0 +1,234 @@
+"""
+Parallel historical sync over several chain-sync connections.
+
+A single chain-sync connection is served strictly sequentially by the node, so the latency
+of the node caps the throughput of a long catch-up (e.g. a re-index after a schema change).
+Given checkpoints, i.e. points on the chain between the last synced block and the tip,
+the slot range is split into segments that are fetched concurrently by worker processes,
+each on its own connection starting with findIntersection at the beginning of its segment.
+The workers pre-filter the blocks and spool them to disk in the recording format
+(see block_recording). The querier, as the single writer, replays the segments in
+canonical order and then continues with the live chain-sync from the last checkpoint.
+
+The workers can not know which addresses will be tracked by then, so they keep every
+transaction that is relevant for any tracked states (see RelevanceFilter.may_become_relevant)
+and reduce all others to the inputs they spend. Checkpoints have to be settled on the chain,
+i.e. further than the rollback window behind the tip, a segment fails if it encounters a rollback.
+
+Checkpoints can be exported from the blocks of any synced database:
+
+    python -m muesliswap_onchain_governance.api.segmented_sync checkpoints <file> [--interval <slots>]
+"""
+import dataclasses
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterator, List, Tuple
+
+import fire
+
+from . import ogmios
+from .block_recording import BlockRecorder, ReplayIterator
+from .db_models import Block, init_database
+from .tx_filter import RelevanceFilter
+
+_LOGGER = logging.getLogger(__name__)
+_LOGGER.setLevel(logging.INFO)
+
+
+class SegmentError(Exception):
+    pass
+
+
+def load_checkpoints(path: str) -> List[ogmios.Point]:
+    with open(path) as f:
+        return [ogmios.Point(slot=p["slot"], id=p["id"]) for p in json.load(f)]
+
+
+def export_checkpoints(path: str, interval: int = 432000):
+    """
+    Export the stored blocks closest after every `interval` slots as checkpoints
+
+    :param path: File to write the checkpoints to
+    :param interval: Number of slots between checkpoints, by default 5 days
+    """
+    checkpoints = []
+    next_slot = 0
+    for block in Block.select(Block.slot, Block.hash).order_by(Block.slot):
+        if block.slot >= next_slot:
+            checkpoints.append({"slot": block.slot, "id": block.hash})
+            next_slot = block.slot + interval
+    with open(path, "w") as f:
+        json.dump(checkpoints, f, indent=2)
+    _LOGGER.info(f"Exported {len(checkpoints)} checkpoints to {path}")
+
+
+def _slim_transaction(tx_filter: RelevanceFilter, tx: dict) -> dict:
+    if tx_filter.may_become_relevant(tx):
+        return tx
+    # spent inputs are marked for all transactions
+    return {"id": tx["id"], "inputs": tx["inputs"], "outputs": []}
+
+
+def fetch_segment(
+    ogmios_url: str,
+    start_points: List[ogmios.Point],
+    end: ogmios.Point,
+    path: str,
+    record_intersection: bool = False,
+) -> int:
+    """
+    Fetch the blocks after the intersection with the start points up to and including the end point
+    and spool them to a recording. Runs in a worker process.
+    Unless the intersection is recorded (for the first segment), it must be one of the start points.
+    Returns the number of spooled blocks.
+    """
+    tx_filter = RelevanceFilter()
+    iterator = ogmios.OgmiosIterator(ogmios_url)
+    operations = iterator.iterate_blocks(start_points)
+    blocks = 0
+    try:
+        with BlockRecorder(path) as recorder:
+            intersection = next(operations)
+            if not isinstance(intersection, ogmios.Rollback) or (
+                not record_intersection and intersection.tip not in start_points
+            ):
+                raise SegmentError(
+                    f"No intersection with {start_points}, got {intersection}"
+                )
+            if record_intersection:
+                # the first segment starts like the regular sync, from whatever intersection was found
+                point = (
+                    "origin"
+                    if isinstance(intersection.tip, ogmios.Origin)
+                    else dataclasses.asdict(intersection.tip)
+                )
+                recorder.record(
+                    json.dumps(
+                        {
+                            "jsonrpc": "2.0",
+                            "method": "nextBlock",
+                            "result": {"direction": "backward", "point": point},
+                        }
+                    ),
+                    intersection,
+                )
+            for operation in operations:
+                if isinstance(operation, ogmios.Rollback):
+                    raise SegmentError(
+                        f"Rollback to {operation.tip} in the segment up to {end}, the checkpoints must be settled"
+                    )
+                block = dict(operation.block)
+                if block["type"] != "ebb":
+                    block["transactions"] = [
+                        _slim_transaction(tx_filter, tx) for tx in block["transactions"]
+                    ]
+                response = {
+                    "jsonrpc": "2.0",
+                    "method": "nextBlock",
+                    "result": {
+                        "direction": "forward",
+                        "tip": dataclasses.asdict(operation.tip),
+                        "block": block,
+                    },
+                }
+                recorder.record(json.dumps(response), operation)
+                blocks += 1
+                tip = ogmios.tip_from_block(block)
+                if tip.id == end.id:
+                    return blocks
+                if tip.slot >= end.slot:
+                    raise SegmentError(f"Checkpoint {end} is not on the chain")
+    finally:
+        operations.close()
+
+
+class SegmentedIterator:
+    """
+    Iterates over the blocks of the segments between the checkpoints, which are fetched concurrently,
+    and then over the blocks received by the live iterator after the last checkpoint.
+    Has the same interface as OgmiosIterator.
+    """
+
+    def __init__(
+        self,
+        ogmios_url: str,
+        checkpoints: List[ogmios.Point],
+        live_iterator: ogmios.OgmiosIterator,
+        max_workers: int = 4,
+        spool_dir: str = None,
+    ):
+        self.ogmios_url = ogmios_url
+        self.checkpoints = sorted(checkpoints, key=lambda p: p.slot)
+        self.live_iterator = live_iterator
+        self.max_workers = max_workers
+        self.spool_dir = spool_dir
+        self._current = None
+
+    @property
+    def buffered(self) -> int:
+        return self._current.buffered if self._current is not None else 0
+
+    def iterate_blocks(
+        self, start_points: List[ogmios.Point]
+    ) -> Iterator[ogmios.NextBlockResult]:
+        synced_slot = max((p.slot for p in start_points), default=-1)
+        checkpoints = [p for p in self.checkpoints if p.slot > synced_slot]
+        if not checkpoints:
+            self._current = self.live_iterator
+            yield from self.live_iterator.iterate_blocks(start_points)
+            return
+        _LOGGER.info(
+            f"Fetching {len(checkpoints)} segments up to slot {checkpoints[-1].slot} with {self.max_workers} workers"
+        )
+        spool_dir = tempfile.mkdtemp(prefix="segments-", dir=self.spool_dir)
+
+        def submit(i: int) -> Tuple[str, Future]:
+            path = os.path.join(spool_dir, f"{i:06d}.rec")
+            segment_start = start_points if i == 0 else [checkpoints[i - 1]]
+            future = pool.submit(
+                fetch_segment,
+                self.ogmios_url,
+                segment_start,
+                checkpoints[i],
+                path,
+                record_intersection=i == 0,
+            )
+            return path, future
+
+        # forked like the decode workers, the workers must not load the database models again
+        with ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("fork"),
+        ) as pool:
+            # segment i + max_workers is only submitted once the replay of segment i starts,
+            # so the spool holds at most one segment per worker next to the replayed one
+            segments = deque()
+            try:
+                for i in range(min(self.max_workers, len(checkpoints))):
+                    segments.append(submit(i))
+                for i in range(len(checkpoints)):
+                    path, future = segments.popleft()
+                    future.result()
+                    if i + self.max_workers < len(checkpoints):
+                        segments.append(submit(i + self.max_workers))
+                    self._current = ReplayIterator(path)
+                    yield from self._current.iterate_blocks([])
+                    os.remove(path)
+            finally:
+                for _, future in segments:
+                    future.cancel()
+                shutil.rmtree(spool_dir, ignore_errors=True)
+        _LOGGER.info(f"Caught up to {checkpoints[-1]}, continuing with the live sync")
+        self._current = self.live_iterator
+        yield from self.live_iterator.iterate_blocks([checkpoints[-1]])
+
+
+if __name__ == "__main__":
+    init_database(read_only=True)
+    fire.Fire({"checkpoints": export_checkpoints})
@@ -2,7 +2,7 @@ import logging
 from contextlib import asynccontextmanager
 from typing import Any
 
-from fastapi import Query, FastAPI
+from fastapi import HTTPException, Query, FastAPI
 from fastapi.responses import ORJSONResponse
 from starlette.responses import Response
 from fastapi_cache import FastAPICache, Coder
@@ -11,9 +11,10 @@ from fastapi_cache.backends.inmemory import InMemoryBackend
 from fastapi.middleware.cors import CORSMiddleware
 from gelidum import freeze
 
-from muesliswap_onchain_governance.api.db_models import db
+from muesliswap_onchain_governance.api.db_models import db, init_database
 from muesliswap_onchain_governance.api.db_queries import (
     gov_state,
+    simple_pool,
     staking,
     tally,
     treasury,
@@ -40,6 +41,10 @@ app = FastAPI(
     version="0.0.1",
 )
 
+# the querier creates and migrates the database, the API only reads from it,
+# each thread of the server through its own read-only connection
+init_database(read_only=True)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -134,12 +139,14 @@ PubkeyHashesQuery = DashingQuery(
     ],
     # TODO add validation
 )
+# policy_id.asset_name in hex
+TOKEN_PATTERN = r"^([0-9a-fA-F]{2})*\.([0-9a-fA-F]{2})*$"
 WalletQuery = DashingQuery(
     description="Wallet address in hex",
     examples=[
         "01dcbc64ce3cc4aeac225a45dd67dfc3717f732f6303556efb6dd8024f0420b0d045f11e8a66319f9d19ffcba35aa9fee0164014776a1f7c95"
     ],
-    # TODO add validation
+    pattern="^([0-9a-fA-F]{2})*$",
 )
 AddressQuery = DashingQuery(
     description="Wallet address in bech32",
@@ -239,6 +246,7 @@ def tallies(
 def tally_detail(
     tally_auth_nft: str = DashingQuery(
         description="Tally Auth NFT",
+        pattern=TOKEN_PATTERN,
         examples=[
             "471b0b6f3fab69f9c6e8c1c1389782a410a8689d97e22a22ac24b30f.bc0a47f8459162152c33913f9d4e50d2340459ce4b6197761967d64368e0e50c"
         ],
@@ -262,6 +270,7 @@ def tally_detail(
 def tally_votes(
     tally_auth_nft: str = DashingQuery(
         description="Tally Auth NFT",
+        pattern=TOKEN_PATTERN,
         examples=[
             "471b0b6f3fab69f9c6e8c1c1389782a410a8689d97e22a22ac24b30f.bc0a47f8459162152c33913f9d4e50d2340459ce4b6197761967d64368e0e50c"
         ],
@@ -309,3 +318,46 @@ def current_gov_state():
     Get the current state of the governance system
     """
     return ORJSONResponse(gov_state.query_current_gov_state())
+
+
+@app.get("/api/v1/pools")
+def pools():
+    """
+    Get the live pools with their reserves
+    """
+    return ORJSONResponse(simple_pool.query_pools())
+
+
+@app.get("/api/v1/pools/quote")
+def pool_quote(
+    pool_nft: str = DashingQuery(
+        description="Pool NFT",
+        pattern=TOKEN_PATTERN,
+        examples=[
+            "471b0b6f3fab69f9c6e8c1c1389782a410a8689d97e22a22ac24b30f.bc0a47f8459162152c33913f9d4e50d2340459ce4b6197761967d64368e0e50c"
+        ],
+    ),
+    swap_token: str = DashingQuery(
+        description="Token sent to the pool, in hex",
+        pattern=TOKEN_PATTERN,
+        examples=[
+            ".",
+            "afbe91c0b44b3040e360057bf8354ead8c49c4979ae6ab7c4fbdc9eb.4d494c4b7632",
+        ],
+    ),
+    amount: int = DashingQuery(
+        description="Amount of the token sent to the pool, without the pool fee",
+        gt=0,
+        examples=[1000000],
+    ),
+):
+    """
+    Get a quote for a swap in a pool, from the in-memory reserves of the live pools
+    """
+    try:
+        quote = simple_pool.query_swap_quote(pool_nft, swap_token, amount)
+    except simple_pool.UnknownPoolError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except simple_pool.InvalidSwapError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return ORJSONResponse(quote)
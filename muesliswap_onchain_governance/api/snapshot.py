@@ -0,0 +1,159 @@
+"""
+Export and import of snapshots of the indexer database, to bring up new replicas
+without replaying the chain from config.start_block_slot.
+
+A snapshot is a directory with a copy of the database and a metadata file listing the block
+at which it was taken, the points from which to resume the chain sync and the tracked
+gov and treasury states. The copy is made with the SQLite online backup API, which reads a
+consistent state of the WAL database while the querier keeps writing, so it never pauses.
+
+    python -m muesliswap_onchain_governance.api.snapshot export <dir> [--slot <slot>]
+    python -m muesliswap_onchain_governance.api.snapshot import <dir> [--force]
+
+After importing, the querier resumes the chain sync from the points of the snapshot
+as they are the most recent blocks in the database.
+Only SQLite databases are supported, export and import fail for PostgreSQL databases.
+"""
+import datetime
+import json
+import logging
+import os
+import sqlite3
+from typing import Optional
+
+import fire
+from peewee import SqliteDatabase
+
+from .chain_querier import sync_points, unspent_tracked_states
+from .db_models import ALL_MODELS, Block, init_database
+from .db_models.dialect import is_sqlite
+from .tx_processor.to_db import restore_live_states
+
+_LOGGER = logging.getLogger(__name__)
+_LOGGER.setLevel(logging.INFO)
+
+SNAPSHOT_FORMAT = 1
+DATABASE_FILE = "muesliswap_onchain_governance.db"
+METADATA_FILE = "snapshot.json"
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _check_sqlite():
+    if not is_sqlite(Block._meta.database):
+        raise SnapshotError("Snapshots are only supported for SQLite databases")
+
+
+def _backup(source: sqlite3.Connection, target: sqlite3.Connection):
+    # copy all pages in one step, so that concurrent writes do not restart the backup
+    source.backup(target, pages=-1)
+
+
+def _snapshot_state() -> dict:
+    """
+    The metadata describing the state of the currently bound database
+    """
+    block = Block.select().order_by(Block.slot.desc()).first()
+    gov_states, treasury_states = unspent_tracked_states()
+    return {
+        "block": None
+        if block is None
+        else {"slot": block.slot, "hash": block.hash, "height": block.height},
+        "points": [{"slot": p.slot, "id": p.id} for p in sync_points()],
+        "tracked_gov_states": sorted(
+            (
+                s.transaction_output.transaction_hash.hex(),
+                s.transaction_output.output_index,
+            )
+            for s in gov_states
+        ),
+        "tracked_treasury_states": sorted(
+            (
+                s.transaction_output.transaction_hash.hex(),
+                s.transaction_output.output_index,
+            )
+            for s in treasury_states
+        ),
+    }
+
+
+def export_snapshot(path: str, slot: Optional[int] = None) -> dict:
+    """
+    Export a snapshot of the database into a directory
+
+    :param path: Directory to write the snapshot to
+    :param slot: Export the state at the last block up to this slot instead of the latest block
+    """
+    _check_sqlite()
+    os.makedirs(path, exist_ok=True)
+    database_path = os.path.join(path, DATABASE_FILE)
+    if os.path.exists(database_path):
+        raise SnapshotError(f"{database_path} already exists")
+    target = sqlite3.connect(database_path)
+    try:
+        _backup(Block._meta.database.connection(), target)
+    finally:
+        target.close()
+
+    snapshot_db = SqliteDatabase(database_path, pragmas={"foreign_keys": 1})
+    with snapshot_db.bind_ctx(ALL_MODELS):
+        # recreate the indexes in case the copy was taken during a bulk sync
+        snapshot_db.create_tables(ALL_MODELS)
+        if slot is not None:
+            Block.delete().where(Block.slot > slot).execute()
+            restore_live_states()
+        metadata = {
+            "format": SNAPSHOT_FORMAT,
+            "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            **_snapshot_state(),
+        }
+        if slot is not None:
+            snapshot_db.execute_sql("VACUUM")
+    snapshot_db.close()
+
+    with open(os.path.join(path, METADATA_FILE), "w") as f:
+        json.dump(metadata, f, indent=2)
+    _LOGGER.info(f"Exported snapshot at block {metadata['block']} to {path}")
+    return metadata
+
+
+def import_snapshot(path: str, force: bool = False) -> dict:
+    """
+    Import a snapshot into the database of the querier
+
+    :param path: Directory of the snapshot
+    :param force: Overwrite the database even if it already contains blocks
+    """
+    _check_sqlite()
+    with open(os.path.join(path, METADATA_FILE)) as f:
+        metadata = json.load(f)
+    if metadata["format"] != SNAPSHOT_FORMAT:
+        raise SnapshotError(f"Unsupported snapshot format {metadata['format']}")
+    if not force and Block.table_exists() and Block.select().exists():
+        raise SnapshotError(
+            "The database already contains blocks, pass --force to overwrite it"
+        )
+
+    source = sqlite3.connect(
+        f"file:{os.path.join(path, DATABASE_FILE)}?mode=ro", uri=True
+    )
+    try:
+        _backup(source, Block._meta.database.connection())
+    finally:
+        source.close()
+
+    state = json.loads(json.dumps(_snapshot_state()))
+    for key, value in state.items():
+        if metadata[key] != value:
+            raise SnapshotError(
+                f"Imported {key} {value} does not match the snapshot {metadata[key]}"
+            )
+    _LOGGER.info(f"Imported snapshot at block {metadata['block']} from {path}")
+    return metadata
+
+
+if __name__ == "__main__":
+    init_database()
+    fire.Fire({"export": export_snapshot, "import": import_snapshot})
@@ -0,0 +1,206 @@
+"""
+Archive of the raw transactions handled by the processors.
+
+The querier stores the cbor of every relevant transaction together with its block.
+After a fix of a processor, the derived tables can be rebuilt by replaying the archive
+through the processors, without a connection to ogmios:
+
+    python -m muesliswap_onchain_governance.api.chain_querier reprocess
+
+Outputs may also be spent by transactions that are not relevant, these spends are taken over
+from the outputs stored before and replayed at the end of their block.
+The processors share the tracked states, so they replay the transactions in chain order,
+only the decoding is spread over worker processes. Transactions that only become relevant
+with the fix were never archived, picking them up still requires a resync.
+"""
+import heapq
+import itertools
+import logging
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Tuple
+
+from peewee import sort_models
+
+from .db_models import (
+    ALL_MODELS,
+    Address,
+    ArchivedTransaction,
+    Block,
+    Datum,
+    Token,
+    TransactionOutput,
+)
+from .decode_stage import DecodedBlock, submit_decode
+from .tx_processor import (
+    flush_spent_inputs,
+    indexed_outputs,
+    mark_spent_inputs,
+    process_tx,
+    watch_set,
+)
+from .tx_processor.datum_cache import datum_cache
+from .tx_processor.indexed_outputs import OutputRef, output_ref
+from .tx_processor.to_db import clear_interning_caches
+
+_LOGGER = logging.getLogger(__name__)
+_LOGGER.setLevel(logging.INFO)
+
+# the chain itself and the rows that are shared by many outputs are kept when reprocessing
+KEPT_MODELS = (Block, ArchivedTransaction, Address, Token, Datum)
+
+
+def archive_transaction(tx: dict, block: Block, block_index: int):
+    """
+    Store the raw transaction (in ogmios json format) at the given index of the block
+    """
+    ArchivedTransaction.create(
+        block=block,
+        block_index=block_index,
+        transaction_hash=bytes.fromhex(tx["id"]),
+        cbor=bytes.fromhex(tx["cbor"]),
+    )
+
+
+def clear_derived_tables():
+    """
+    Delete all rows written by the processors
+    """
+    for model in reversed(sort_models(ALL_MODELS)):
+        if model not in KEPT_MODELS:
+            model.delete().execute()
+
+
+def stored_spends() -> List[Tuple[Block, List[OutputRef]]]:
+    """
+    The stored outputs that are spent, grouped by the spending block in chain order
+    """
+    spent = (
+        TransactionOutput.select(
+            TransactionOutput.transaction_hash,
+            TransactionOutput.output_index,
+            Block.id,
+            Block.slot,
+        )
+        .join(Block, on=TransactionOutput.spent_in_block == Block.id)
+        .order_by(Block.slot)
+        .tuples()
+    )
+    return [
+        (Block(id=block_id, slot=slot), [(o[0], o[1]) for o in outputs])
+        for (block_id, slot), outputs in itertools.groupby(
+            spent, key=lambda o: (o[2], o[3])
+        )
+    ]
+
+
+def _archived_blocks() -> Iterator[Tuple[Block, List[Tuple[int, dict]]]]:
+    archived = (
+        ArchivedTransaction.select(ArchivedTransaction, Block)
+        .join(Block)
+        .order_by(Block.slot, ArchivedTransaction.block_index)
+    )
+    for block, txs in itertools.groupby(archived, key=lambda a: a.block):
+        yield block, [
+            (a.block_index, {"id": a.transaction_hash.hex(), "cbor": a.cbor.hex()})
+            for a in txs
+        ]
+
+
+def _replayed_blocks(
+    spends: List[Tuple[Block, List[OutputRef]]]
+) -> Iterator[Tuple[Block, List[Tuple[int, dict]], List[OutputRef]]]:
+    """
+    The blocks with archived transactions or spends, in chain order
+    """
+    merged = heapq.merge(
+        ((block, txs, []) for block, txs in _archived_blocks()),
+        ((block, [], refs) for block, refs in spends),
+        key=lambda b: b[0].slot,
+    )
+    for block, parts in itertools.groupby(merged, key=lambda b: b[0]):
+        parts = list(parts)
+        yield (
+            block,
+            [tx for _, txs, _ in parts for tx in txs],
+            [ref for _, _, refs in parts for ref in refs],
+        )
+
+
+def reprocess(decode_workers: int = None, decode_lookahead: int = 100):
+    """
+    Rebuild the tables derived by the processors from the archived transactions.
+    Runs in a single database transaction, the querier must not run at the same time.
+
+    :param decode_workers: Number of processes decoding transactions (default: number of CPUs, 0: decode in the main process)
+    :param decode_lookahead: Maximum number of upcoming blocks for which transactions are decoded ahead
+    """
+    start_time = time.monotonic()
+    pool = None
+    if decode_workers != 0:
+        # forked before the database transaction is opened, like the decode stage
+        pool = ProcessPoolExecutor(
+            max_workers=decode_workers,
+            mp_context=multiprocessing.get_context("fork"),
+        )
+        pool.submit(int).result()
+    blocks = transactions = 0
+    try:
+        with Block._meta.database.atomic():
+            spends = stored_spends()
+            clear_derived_tables()
+            indexed_outputs.load()
+            clear_interning_caches()
+            datum_cache.clear_rows()
+            tracked_gov_states, tracked_treasury_states = [], []
+            watch_set.update(tracked_gov_states, tracked_treasury_states)
+
+            replayed_blocks = _replayed_blocks(spends)
+            pending = deque()
+            while True:
+                for block, txs, spent_outputs in itertools.islice(
+                    replayed_blocks, decode_lookahead - len(pending)
+                ):
+                    pending.append(
+                        (
+                            block,
+                            txs,
+                            spent_outputs,
+                            submit_decode(
+                                pool, [i for i, _ in txs], [tx for _, tx in txs]
+                            )
+                            if pool is not None and txs
+                            else DecodedBlock(),
+                        )
+                    )
+                if not pending:
+                    break
+                block, txs, spent_outputs, decoded_block = pending.popleft()
+                for block_index, tx in txs:
+                    decoded_tx = decoded_block.get(block_index, tx)
+                    if decoded_tx is None:
+                        continue
+                    mark_spent_inputs(
+                        [output_ref(i) for i in decoded_tx.transaction_body.inputs],
+                        block,
+                    )
+                    process_tx(
+                        decoded_tx,
+                        block,
+                        block_index,
+                        tracked_gov_states,
+                        tracked_treasury_states,
+                    )
+                    transactions += 1
+                # the outputs spent by transactions that were not archived
+                mark_spent_inputs(spent_outputs, block)
+                flush_spent_inputs()
+                blocks += 1
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    _LOGGER.info(
+        f"Reprocessed {transactions} transactions in {blocks} blocks in {time.monotonic() - start_time:.2f}s"
+    )
@@ -0,0 +1,121 @@
+"""
+Pre-filter on the ogmios json representation of transactions.
+Only a tiny fraction of transactions on the chain touch the governance system,
+and only those need to be decoded with pycardano and handed to the processors.
+"""
+from typing import Set
+
+
+from .config import (
+    gov_state_nft_policy_id,
+    licenses_policy_id,
+    pool_nft_policy_id,
+    treasurer_nft_policy_id,
+    vote_permission_nft_policy_id,
+)
+from .db_models import TrackedGovStates, TrackedTreasuryStates
+from .tx_processor.indexed_outputs import OutputRef
+from .tx_processor.watch_set import WatchSet
+
+BECH32_CHARSET = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
+
+
+def inputs_from_tx(tx: dict) -> [OutputRef]:
+    """
+    Obtain the references to the outputs spent by a transaction
+    """
+    return [(bytes.fromhex(i["transaction"]["id"]), i["index"]) for i in tx["inputs"]]
+
+
+def is_script_address(address: str) -> bool:
+    """
+    Whether a bech32 encoded shelley address has a script payment credential.
+    Only the header, i.e. the first 8 bits of the data part, is decoded.
+    """
+    separator = address.rfind("1")
+    if separator == -1 or len(address) < separator + 3:
+        # byron addresses are base58 encoded and never belong to a script
+        return False
+    try:
+        header = BECH32_CHARSET.index(address[separator + 1]) << 3
+        header |= BECH32_CHARSET.index(address[separator + 2]) >> 2
+    except ValueError:
+        return False
+    # the address types 1, 3, 5 and 7 have a script payment credential
+    return header >> 4 < 8 and header & 0x10 != 0
+
+
+class RelevanceFilter:
+    """
+    Decides whether a transaction may be relevant to one of the governance processors.
+    A transaction is relevant if it creates an output at a tracked address
+    or holding a tracked policy, or if it mints a tracked policy.
+    The tracked addresses are taken from the watch set, which may be shared with the processors.
+    """
+
+    def __init__(
+        self,
+        output_policy_ids: Set[str] = None,
+        mint_policy_ids: Set[str] = None,
+        watch_set: WatchSet = None,
+    ):
+        self.output_policy_ids = (
+            output_policy_ids
+            if output_policy_ids is not None
+            else {
+                p.payload.hex()
+                for p in (
+                    gov_state_nft_policy_id,
+                    treasurer_nft_policy_id,
+                    licenses_policy_id,
+                    pool_nft_policy_id,
+                )
+            }
+        )
+        self.mint_policy_ids = (
+            mint_policy_ids
+            if mint_policy_ids is not None
+            else {
+                p.payload.hex()
+                for p in (licenses_policy_id, vote_permission_nft_policy_id)
+            }
+        )
+        self.watch_set = watch_set if watch_set is not None else WatchSet()
+
+    @property
+    def addresses(self) -> Set[str]:
+        """
+        The tracked addresses, bech32 encoded as reported by ogmios
+        """
+        return self.watch_set.bech32_addresses
+
+    def update(
+        self,
+        tracked_gov_states: TrackedGovStates,
+        tracked_treasury_states: TrackedTreasuryStates,
+    ):
+        """
+        Update the tracked addresses from the tracked gov and treasury states
+        """
+        self.watch_set.update(tracked_gov_states, tracked_treasury_states)
+
+    def is_relevant(self, tx: dict) -> bool:
+        addresses = self.watch_set.bech32_addresses
+        for output in tx["outputs"]:
+            if output["address"] in addresses:
+                return True
+            if not self.output_policy_ids.isdisjoint(output["value"].keys()):
+                return True
+        return not self.mint_policy_ids.isdisjoint(tx.get("mint", {}).keys())
+
+    def may_become_relevant(self, tx: dict) -> bool:
+        """
+        Whether a transaction is relevant for any possible tracked states,
+        i.e. without knowing the tracked addresses. All tracked addresses are script addresses.
+        """
+        for output in tx["outputs"]:
+            if is_script_address(output["address"]):
+                return True
+            if not self.output_policy_ids.isdisjoint(output["value"].keys()):
+                return True
+        return not self.mint_policy_ids.isdisjoint(tx.get("mint", {}).keys())
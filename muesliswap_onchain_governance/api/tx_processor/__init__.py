@@ -1,14 +1,52 @@
-import peewee
-import pycardano
+from typing import Dict, List
+
 from ..db_models import Block, TransactionOutput, TrackedTreasuryStates
 from ..db_models.gov_state import TrackedGovStates
+from ..metrics import metrics
 from ..util import FixedTxHashTransaction
+from .indexed_outputs import indexed_outputs, OutputRef
+from .to_db import set_states_live
+from .undo_journal import undo_journal
+from .watch_set import watch_set
+from .classifier import classifier, register_processor
+
+# the processors register themselves on import, they run in this order
+from . import gov_state, staking, tally, licenses, treasury, simple_pool
+
+
+# the database ids of the indexed outputs spent in a block, not yet marked in the database
+_pending_spent: Dict[Block, List[int]] = {}
+
+
+def mark_spent_inputs(inputs: [OutputRef], block: Block):
+    """
+    Mark the indexed outputs among the inputs of a transaction as spent.
+    Membership is checked in memory, the hits are written to the database
+    for the whole block at once with flush_spent_inputs.
+    """
+    spent_outputs = indexed_outputs.pop_spent(inputs)
+    if spent_outputs:
+        _pending_spent.setdefault(block, []).extend(spent_outputs.values())
+        undo_journal.record_spent(spent_outputs)
 
-from .gov_state import process_tx as process_gov_state_tx
-from .staking import process_tx as process_staking_tx
-from .tally import process_tx as process_tally_tx
-from .licenses import process_tx as process_licenses_tx
-from .treasury import process_tx as process_treasury_tx
+
+def flush_spent_inputs():
+    """
+    Write the outputs marked as spent since the last flush to the database, one UPDATE per block
+    """
+    for block, output_ids in _pending_spent.items():
+        TransactionOutput.update(spent_in_block=block).where(
+            TransactionOutput.id.in_(output_ids)
+        ).execute()
+        set_states_live(output_ids, False)
+    _pending_spent.clear()
+
+
+def discard_spent_inputs():
+    """
+    Drop the outputs marked as spent since the last flush, i.e. because the writes of the block were rolled back
+    """
+    _pending_spent.clear()
 
 
 def process_tx(
@@ -20,22 +58,23 @@ def process_tx(
 ):
     """
     Process a transaction and update the database accordingly.
+    The inputs of the transaction need to be marked as spent before with mark_spent_inputs.
     """
-
-    # mark all inputs to the transaction as spent
-    spent_inputs = [
-        (_input.transaction_id.payload.hex(), _input.index)
-        for i, _input in enumerate(tx.transaction_body.inputs)
-    ]
-    TransactionOutput.update(spent_in_block=block).where(
-        peewee.Tuple(
-            TransactionOutput.transaction_hash, TransactionOutput.output_index
-        ).in_(spent_inputs)
-    ).execute()
-
-    # model specific processing
-    process_gov_state_tx(tx, block, block_index, tracked_gov_states)
-    process_staking_tx(tx, block, block_index, tracked_gov_states)
-    process_tally_tx(tx, block, block_index, tracked_gov_states)
-    process_licenses_tx(tx, block, block_index, tracked_gov_states)
-    process_treasury_tx(tx, block, block_index, tracked_treasury_states)
+    watch_set.update(tracked_gov_states, tracked_treasury_states)
+    tagged_outputs = classifier.classify(tx)
+    for processor in classifier.processors:
+        output_indices = tagged_outputs.get(processor.name)
+        if output_indices is None:
+            continue
+        with metrics.timer(f"process_{processor.name}"):
+            processor.process_tx(
+                tx,
+                block,
+                block_index,
+                tracked_gov_states,
+                tracked_treasury_states,
+                output_indices,
+            )
+        # the processor may have changed the tracked states and with them the watched addresses
+        if watch_set.update(tracked_gov_states, tracked_treasury_states):
+            tagged_outputs = classifier.classify(tx)
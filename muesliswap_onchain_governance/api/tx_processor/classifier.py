@@ -0,0 +1,109 @@
+"""
+Registration of the transaction processors and the classifier that selects
+which of them to run for a transaction.
+
+Processors declare their interests as addresses (raw bytes, possibly changing with the tracked states),
+policies of the assets held by outputs and minted policies (bytes of the policy ids).
+The classifier visits each output and mint entry of a transaction once and tags
+the outputs with the processors interested in them. A processor only runs if one of
+its interests occurs in the transaction and receives the indices of its tagged outputs.
+
+Redeemers are deliberately not classified. They only matter for transactions that
+already touch an interest of a processor, e.g. the mint redeemers of vote permissions
+in staking or of license releases in licenses, so the selected processors scan
+transaction_witness_set.redeemer themselves.
+"""
+from dataclasses import dataclass
+from typing import Callable, Dict, FrozenSet, Iterable, List, Set
+
+import pycardano
+
+from ..db_models import Block, TrackedGovStates, TrackedTreasuryStates
+
+ProcessTx = Callable[
+    [
+        pycardano.Transaction,
+        Block,
+        int,
+        TrackedGovStates,
+        TrackedTreasuryStates,
+        List[int],
+    ],
+    None,
+]
+
+
+@dataclass
+class RegisteredProcessor:
+    name: str
+    process_tx: ProcessTx
+    addresses: Callable[[], Set[bytes]]
+    policies: FrozenSet[bytes]
+    mint_policies: FrozenSet[bytes]
+
+
+class OutputClassifier:
+    """
+    The registered processors in the order in which they run
+    """
+
+    def __init__(self):
+        self.processors: List[RegisteredProcessor] = []
+
+    def register(
+        self,
+        name: str,
+        addresses: Callable[[], Set[bytes]] = None,
+        policies: Iterable[bytes] = (),
+        mint_policies: Iterable[bytes] = (),
+    ) -> Callable[[ProcessTx], ProcessTx]:
+        """
+        Register a processor, to be used as decorator of its process_tx function
+        :param name: Name of the processor, also used for its metrics
+        :param addresses: Returns the raw addresses of outputs the processor is interested in
+        :param policies: Policy ids of assets in outputs the processor is interested in
+        :param mint_policies: Minted policy ids the processor is interested in
+        """
+
+        def decorator(process_tx: ProcessTx) -> ProcessTx:
+            self.processors.append(
+                RegisteredProcessor(
+                    name=name,
+                    process_tx=process_tx,
+                    addresses=addresses if addresses is not None else frozenset,
+                    policies=frozenset(policies),
+                    mint_policies=frozenset(mint_policies),
+                )
+            )
+            return process_tx
+
+        return decorator
+
+    def classify(self, tx: pycardano.Transaction) -> Dict[str, List[int]]:
+        """
+        Select the processors interested in a transaction
+        :return: the names of the selected processors and the indices of the outputs tagged for them
+        """
+        interests = [
+            (p.name, p.addresses(), p.policies, p.mint_policies)
+            for p in self.processors
+        ]
+        tagged = {}
+        for i, output in enumerate(tx.transaction_body.outputs):
+            address = output.address.to_primitive()
+            policies = {policy_id.payload for policy_id in output.amount.multi_asset}
+            for name, interest_addresses, interest_policies, _ in interests:
+                if address in interest_addresses or not interest_policies.isdisjoint(
+                    policies
+                ):
+                    tagged.setdefault(name, []).append(i)
+        if tx.transaction_body.mint:
+            minted = {policy_id.payload for policy_id in tx.transaction_body.mint}
+            for name, _, _, interest_mint_policies in interests:
+                if not interest_mint_policies.isdisjoint(minted):
+                    tagged.setdefault(name, [])
+        return tagged
+
+
+classifier = OutputClassifier()
+register_processor = classifier.register
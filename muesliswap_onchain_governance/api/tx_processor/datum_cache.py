@@ -0,0 +1,148 @@
+"""
+Bounded caches for decoding the datums of the governance states.
+
+Continuations of a state mostly repeat large parts of its datum, i.e. the params of a tally
+or staking state, which dominate the decoding time and are stored in the database
+with get_or_create. Datums are decoded field by field, the structures in them are shared
+between datums and keyed by the hash of their cbor. The rows stored for a decoded structure
+are remembered as well, so an unchanged params block is neither decoded nor looked up again.
+"""
+import hashlib
+from collections import OrderedDict
+from dataclasses import fields
+from inspect import isclass
+from typing import Callable, List, Type, TypeVar, get_args, get_origin, get_type_hints
+
+import cbor2
+import pycardano
+from pycardano.plutus import get_tag
+
+from ..db_models.db import BaseModel
+from ..metrics import metrics
+
+Data = TypeVar("Data", bound=pycardano.PlutusData)
+Row = TypeVar("Row", bound=BaseModel)
+
+
+def _is_plutus_data(t) -> bool:
+    return isclass(t) and issubclass(t, pycardano.PlutusData)
+
+
+class DatumCache:
+    """
+    LRU caches of decoded datums by datum hash, of decoded structures by the hash of their cbor
+    and of the rows stored for decoded structures.
+    The decoded objects are shared and must not be modified.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._datums: OrderedDict[tuple, pycardano.PlutusData] = OrderedDict()
+        self._structures: OrderedDict[tuple, pycardano.PlutusData] = OrderedDict()
+        # keyed by the identity of the structure, which is kept alive by the entry
+        self._rows: OrderedDict[tuple, tuple] = OrderedDict()
+
+    def _lookup(self, cache: OrderedDict, key: tuple, kind: str, compute: Callable):
+        if key in cache:
+            cache.move_to_end(key)
+            metrics.inc("datum_cache_lookups", kind=kind, result="hit")
+            return cache[key]
+        metrics.inc("datum_cache_lookups", kind=kind, result="miss")
+        value = cache[key] = compute()
+        if len(cache) > self.maxsize:
+            cache.popitem(last=False)
+        return value
+
+    def decode(
+        self, cls: Type[Data], datum_hash: bytes, datum: pycardano.RawPlutusData
+    ) -> Data:
+        """
+        Like cls.from_primitive(datum.data), but only decodes datums and structures not seen recently
+        :param cls: Class of the datum
+        :param datum_hash: Hash of the datum, as stored with the output (datum_hash_id)
+        :param datum: The inline datum of the output
+        """
+        if datum_hash is None:
+            return cls.from_primitive(datum.data)
+        return self._lookup(
+            self._datums,
+            (cls, datum_hash),
+            "datum",
+            lambda: self._decode_fields(cls, datum.data),
+        )
+
+    def _structure(self, cls: Type[Data], value) -> Data:
+        key = hashlib.blake2b(
+            cbor2.dumps(value, default=pycardano.default_encoder), digest_size=32
+        ).digest()
+        return self._lookup(
+            self._structures,
+            (cls, key),
+            "structure",
+            lambda: cls.from_primitive(value),
+        )
+
+    def _decode_fields(self, cls: Type[Data], value) -> Data:
+        """
+        Decode the fields of a datum, the structures in it from the cache.
+        Falls back to decoding the whole datum for encodings and field types that are not handled.
+        """
+        cls_fields = [f for f in fields(cls) if f.init]
+        if (
+            not isinstance(value, cbor2.CBORTag)
+            or value.tag != get_tag(cls.CONSTR_ID)
+            or len(value.value) != len(cls_fields)
+        ):
+            return cls.from_primitive(value)
+        type_hints = get_type_hints(cls)
+        restored = []
+        for f, v in zip(cls_fields, value.value):
+            t = type_hints[f.name]
+            if _is_plutus_data(t):
+                restored.append(self._structure(t, v))
+                continue
+            if get_origin(t) in (list, List) and isinstance(
+                v, (list, tuple, pycardano.IndefiniteList)
+            ):
+                (item_type,) = get_args(t)
+                if _is_plutus_data(item_type):
+                    restored.append([self._structure(item_type, x) for x in v])
+                    continue
+                if item_type in (int, bytes) and all(
+                    isinstance(x, item_type) for x in v
+                ):
+                    restored.append(list(v))
+                    continue
+            if t in (int, bytes) and isinstance(v, t):
+                restored.append(v)
+                continue
+            return cls.from_primitive(value)
+        return cls(*restored)
+
+    def resolve(
+        self,
+        model: Type[Row],
+        structure: pycardano.PlutusData,
+        get_or_create: Callable[[], Row],
+    ) -> Row:
+        """
+        The row stored for a decoded structure, only calls get_or_create if the structure was not seen recently
+        :param model: Model of the row
+        :param structure: Decoded structure, as returned in a datum by decode
+        :param get_or_create: Stores the structure and returns its row
+        """
+        return self._lookup(
+            self._rows,
+            (model, id(structure)),
+            model._meta.table_name,
+            lambda: (structure, get_or_create()),
+        )[1]
+
+    def clear_rows(self):
+        """
+        Forget the resolved rows, i.e. because writes that may have created them were rolled back
+        """
+        self._rows.clear()
+
+
+datum_cache = DatumCache(10_000)
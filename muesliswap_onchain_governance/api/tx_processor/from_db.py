@@ -7,7 +7,7 @@ def from_address(address: Address) -> pycardano.Address:
     """
     Convert an address from the database to a pycardano address.
     """
-    return pycardano.Address.from_primitive(bytes.fromhex(address.address_raw))
+    return pycardano.Address.from_primitive(address.address_raw)
 
 
 def from_output_value(output_value: TransactionOutputValue) -> pycardano.Value:
@@ -15,16 +15,14 @@ def from_output_value(output_value: TransactionOutputValue) -> pycardano.Value:
     Convert an output from the database to a pycardano value.
     """
     token = output_value.token
-    if token.policy_id == "":
+    if token.policy_id == b"":
         return pycardano.Value(output_value.amount)
     return pycardano.Value(
         multi_asset=pycardano.MultiAsset(
             {
-                pycardano.ScriptHash(bytes.fromhex(token.policy_id)): pycardano.Asset(
+                pycardano.ScriptHash(token.policy_id): pycardano.Asset(
                     {
-                        pycardano.AssetName(
-                            bytes.fromhex(token.asset_name)
-                        ): output_value.amount,
+                        pycardano.AssetName(token.asset_name): output_value.amount,
                     }
                 )
             }
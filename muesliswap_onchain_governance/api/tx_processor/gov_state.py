@@ -1,3 +1,5 @@
+from typing import List
+
 import pycardano
 from .to_db import (
     add_output,
@@ -7,8 +9,11 @@ from .to_db import (
     add_token,
     add_transaction,
 )
+from .classifier import register_processor
+from .datum_cache import datum_cache
+from .indexed_outputs import indexed_outputs, output_ref
 from ..config import gov_state_nft_policy_id
-from ..db_models import Block, TransactionOutput, Transaction
+from ..db_models import Block, TransactionOutput, Transaction, TrackedTreasuryStates
 from ..db_models import gov_state as db_gov_state
 
 from ...onchain.gov_state import gov_state as onchain_gov_state
@@ -20,27 +25,31 @@ from ...utils.from_script_context import from_address
 _LOGGER = logging.getLogger(__name__)
 
 
+@register_processor("gov_state", policies=[gov_state_nft_policy_id.payload])
 def process_tx(
     tx: pycardano.Transaction,
     block: Block,
     block_index: int,
     tracked_gov_states: db_gov_state.TrackedGovStates,
+    tracked_treasury_states: TrackedTreasuryStates,
+    output_indices: List[int],
 ):
     """
     Process a transaction and update the database accordingly.
     Updates the tracked_gov_states list with new or spent gov states
     """
     created_states = []
-    for i, output in enumerate(tx.transaction_body.outputs):
+    for i in output_indices:
+        output = tx.transaction_body.outputs[i]
         if not output.amount.multi_asset.get(gov_state_nft_policy_id):
             continue
         _LOGGER.info(f"Transaction contains gov state nft {tx.id.payload.hex()}")
-        gov_state_output = add_output(
-            output, i, tx.id.payload.hex(), block, block_index
-        )
+        gov_state_output = add_output(output, i, tx.id.payload, block, block_index)
         try:
-            _onchain_gov_state: onchain_gov_state.GovStateDatum = (
-                onchain_gov_state.GovStateDatum.from_primitive(output.datum.data)
+            _onchain_gov_state: onchain_gov_state.GovStateDatum = datum_cache.decode(
+                onchain_gov_state.GovStateDatum,
+                gov_state_output.datum_hash_id,
+                output.datum,
             )
         except Exception as e:
             _LOGGER.info(f"Invalid gov state parameters at {tx.id.payload.hex()}")
@@ -57,15 +66,15 @@ def process_tx(
                 from_address(onchain_gov_state_params.staking_address)
             ),
             governance_token=add_token_token(onchain_gov_state_params.governance_token),
-            vault_ft_policy=onchain_gov_state_params.vault_ft_policy.hex(),
+            vault_ft_policy=onchain_gov_state_params.vault_ft_policy,
             min_quorum=onchain_gov_state_params.min_quorum,
             min_proposal_duration=onchain_gov_state_params.min_proposal_duration,
             gov_state_nft=add_token(
                 gov_state_nft_policy_id,
                 gov_state_nft_name,
             ),
-            tally_auth_nft_policy=onchain_gov_state_params.tally_auth_nft_policy.hex(),
-            staking_vote_nft_policy=onchain_gov_state_params.staking_vote_nft_policy.hex(),
+            tally_auth_nft_policy=onchain_gov_state_params.tally_auth_nft_policy,
+            staking_vote_nft_policy=onchain_gov_state_params.staking_vote_nft_policy,
             latest_applied_proposal_id=onchain_gov_state_params.latest_applied_proposal_id,
         )[0]
         _db_gov_state = db_gov_state.GovState.create(
@@ -82,15 +91,8 @@ def process_tx(
     # there is no way to spend a gov state without creating one
     if created_states:
         for input in tx.transaction_body.inputs:
-            _db_gov_state = (
-                db_gov_state.GovState.select()
-                .join(TransactionOutput)
-                .where(
-                    TransactionOutput.transaction_hash
-                    == input.transaction_id.payload.hex(),
-                    TransactionOutput.output_index == input.index,
-                )
-                .first()
+            _db_gov_state = indexed_outputs.state(
+                db_gov_state.GovState, output_ref(input)
             )
             if _db_gov_state is None:
                 continue
@@ -100,7 +102,7 @@ def process_tx(
         # There may be multiple created states, but only one spent state
         for created_state in created_states:
             db_gov_state.GovUpgrade.create(
-                transaction=add_transaction(tx.id.payload.hex(), block, block_index),
+                transaction=add_transaction(tx.id.payload, block, block_index),
                 prev_gov_state=spent_states[0] if spent_states else None,
                 next_gov_state=created_state,
             )
@@ -0,0 +1,208 @@
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple, Type, TypeVar
+
+import pycardano
+from peewee import Expression
+
+from ..db_models import (
+    GovState,
+    LicenseOutput,
+    StakingState,
+    TallyState,
+    TallyWeights,
+    Token,
+    TransactionOutput,
+    TransactionOutputValue,
+    TreasurerState,
+    ValueStoreState,
+)
+from ..db_models.db import OutputStateModel, insert_listeners
+from .values import CompactValue
+
+OutputRef = Tuple[bytes, int]
+
+# the states at outputs that are looked up by the processors
+STATE_MODELS = (
+    GovState,
+    TallyState,
+    StakingState,
+    TreasurerState,
+    ValueStoreState,
+    LicenseOutput,
+)
+
+State = TypeVar("State", bound=OutputStateModel)
+
+
+def output_ref(_input: pycardano.TransactionInput) -> OutputRef:
+    return _input.transaction_id.payload, _input.index
+
+
+class IndexedOutputs:
+    """
+    In-memory mirror of the unspent outputs stored in the database, their values and the states at them.
+    Allows to check whether a transaction spends an indexed output
+    and to resolve the states and values spent or referenced by a transaction without querying the database.
+    """
+
+    def __init__(self):
+        self._outputs: Dict[OutputRef, int] = {}
+        self._values: Dict[OutputRef, CompactValue] = {}
+        self._states: Dict[OutputRef, List[OutputStateModel]] = {}
+        # the states and values of the outputs spent by the last transaction passed to pop_spent
+        self._spent_states: Dict[OutputRef, List[OutputStateModel]] = {}
+        self._spent_values: Dict[OutputRef, CompactValue] = {}
+
+    @staticmethod
+    def _select_states(where: Expression) -> Dict[OutputRef, List[OutputStateModel]]:
+        states = defaultdict(list)
+        for model in STATE_MODELS:
+            for state in (
+                model.select(model, TransactionOutput)
+                .join(TransactionOutput)
+                .where(where)
+            ):
+                output = state.transaction_output
+                states[(output.transaction_hash, output.output_index)].append(state)
+        IndexedOutputs._load_tally_weights(
+            [s for ss in states.values() for s in ss if isinstance(s, TallyState)]
+        )
+        return dict(states)
+
+    @staticmethod
+    def _load_tally_weights(tally_states: List[TallyState]):
+        """
+        Attach the vote weights to the tally states, tally states created during the sync get them from their datum
+        """
+        weights = defaultdict(list)
+        for tally_state_id, weight in (
+            TallyWeights.select(TallyWeights.tally_state, TallyWeights.weight)
+            .where(TallyWeights.tally_state.in_([s.id for s in tally_states]))
+            .order_by(TallyWeights.index)
+            .tuples()
+        ):
+            weights[tally_state_id].append(weight)
+        for tally_state in tally_states:
+            tally_state.weights = weights[tally_state.id]
+
+    @staticmethod
+    def _select_values(where: Expression) -> Dict[OutputRef, CompactValue]:
+        values = defaultdict(dict)
+        for transaction_hash, output_index, policy_id, asset_name, amount in (
+            TransactionOutputValue.select(
+                TransactionOutput.transaction_hash,
+                TransactionOutput.output_index,
+                Token.policy_id,
+                Token.asset_name,
+                TransactionOutputValue.amount,
+            )
+            .join_from(TransactionOutputValue, TransactionOutput)
+            .join_from(TransactionOutputValue, Token)
+            .where(where)
+            .order_by(TransactionOutputValue.id)
+            .tuples()
+        ):
+            values[(transaction_hash, output_index)][(policy_id, asset_name)] = amount
+        return dict(values)
+
+    def load(self):
+        """
+        (Re-)load the unspent outputs, their values and states from the database
+        """
+        self._outputs = {
+            (transaction_hash, output_index): id
+            for id, transaction_hash, output_index in TransactionOutput.select(
+                TransactionOutput.id,
+                TransactionOutput.transaction_hash,
+                TransactionOutput.output_index,
+            )
+            .where(TransactionOutput.spent_in_block.is_null())
+            .tuples()
+        }
+        self._values = self._select_values(TransactionOutput.spent_in_block.is_null())
+        self._states = self._select_states(TransactionOutput.spent_in_block.is_null())
+        self._spent_states = {}
+        self._spent_values = {}
+
+    def add(self, output: TransactionOutput, value: CompactValue):
+        ref = (output.transaction_hash, output.output_index)
+        self._outputs[ref] = output.id
+        self._values[ref] = value
+
+    def record_insert(self, row):
+        """
+        Index the states created at outputs, called for every row inserted into the database
+        """
+        if not isinstance(row, STATE_MODELS):
+            return
+        output = row.transaction_output
+        self._states.setdefault(
+            (output.transaction_hash, output.output_index), []
+        ).append(row)
+
+    def pop_spent(self, inputs: [OutputRef]) -> Dict[OutputRef, int]:
+        """
+        Remove the given inputs of a transaction from the unspent outputs.
+        The states at them can be resolved until the next transaction is passed.
+        :return: the indexed outputs that were spent and their database ids
+        """
+        spent = {
+            _input: self._outputs.pop(_input)
+            for _input in inputs
+            if _input in self._outputs
+        }
+        self._spent_states = {
+            _input: self._states.pop(_input)
+            for _input in spent
+            if _input in self._states
+        }
+        self._spent_values = {_input: self._values.pop(_input, {}) for _input in spent}
+        return spent
+
+    def remove(self, outputs: [OutputRef]):
+        """
+        Remove outputs that were deleted from the database
+        """
+        for output in outputs:
+            self._outputs.pop(output, None)
+            self._values.pop(output, None)
+            self._states.pop(output, None)
+
+    def restore(self, outputs: Dict[OutputRef, int]):
+        """
+        Restore outputs that were marked as unspent again
+        """
+        self._outputs.update(outputs)
+        restored = TransactionOutput.id.in_(list(outputs.values()))
+        self._values.update(self._select_values(restored))
+        self._states.update(self._select_states(restored))
+
+    def state(self, model: Type[State], ref: OutputRef) -> Optional[State]:
+        """
+        Resolve the state of the given kind at an unspent output
+        or at an output spent by the current transaction
+        """
+        states = self._states.get(ref) or self._spent_states.get(ref, ())
+        for state in states:
+            if isinstance(state, model):
+                return state
+        return None
+
+    def value(self, output: TransactionOutput) -> CompactValue:
+        """
+        The value of an unspent output or of an output spent by the current transaction
+        """
+        ref = (output.transaction_hash, output.output_index)
+        if ref in self._values:
+            return self._values[ref]
+        return self._spent_values[ref]
+
+    def __contains__(self, output_ref: OutputRef) -> bool:
+        return output_ref in self._outputs
+
+    def __len__(self):
+        return len(self._outputs)
+
+
+indexed_outputs = IndexedOutputs()
+insert_listeners.append(indexed_outputs.record_insert)
@@ -1,4 +1,5 @@
 import datetime
+from typing import List
 
 import pycardano
 
@@ -9,6 +10,8 @@ from .to_db import (
     add_transaction,
     add_output,
 )
+from .classifier import register_processor
+from .indexed_outputs import indexed_outputs, output_ref
 from ..config import licenses_policy_id
 from ..db_models import (
     Block,
@@ -19,6 +22,7 @@ from ..db_models import (
 )
 from ..db_models import (
     TrackedGovStates,
+    TrackedTreasuryStates,
 )
 from ..db_models.licenses import LicenseMint, LicenseOutput
 
@@ -30,25 +34,33 @@ import logging
 _LOGGER = logging.getLogger(__name__)
 
 
+@register_processor(
+    "licenses",
+    policies=[licenses_policy_id.payload],
+    mint_policies=[licenses_policy_id.payload],
+)
 def process_tx(
     tx: pycardano.Transaction,
     block: Block,
     block_index: int,
     tracked_gov_states: TrackedGovStates,
+    tracked_treasury_states: TrackedTreasuryStates,
+    output_indices: List[int],
 ):
     """
     Process a transaction and update the database accordingly.
     """
     # add outputs if they contain licenses
-    for i, output in enumerate(tx.transaction_body.outputs):
+    for i in output_indices:
+        output = tx.transaction_body.outputs[i]
         if output.amount.multi_asset.get(licenses_policy_id, {}):
-            db_output = add_output(output, i, tx.id.payload.hex(), block, block_index)
+            db_output = add_output(output, i, tx.id.payload, block, block_index)
             for license_token_name in output.amount.multi_asset.get(
                 licenses_policy_id, {}
             ).keys():
                 # we can find the tally input here
                 LicenseOutput.create(
-                    output=db_output,
+                    transaction_output=db_output,
                     license_nft=add_token(licenses_policy_id, license_token_name),
                 )
     # add mints if they contain licenses
@@ -73,7 +85,7 @@ def process_tx(
             break
     release_license_redeemer = None
     for redeemer in tx.transaction_witness_set.redeemer:
-        if redeemer.tag != pycardano.RedeemerTag.MINT.value:
+        if redeemer.tag != pycardano.RedeemerTag.MINT:
             continue
         if (
             sorted(tx.transaction_body.mint, key=lambda x: x.payload)[redeemer.index]
@@ -88,27 +100,19 @@ def process_tx(
             _LOGGER.debug(f"Mint was executed with invalid redeemer")
             continue
     # we can find the tally input here
+    tally_state = None
     if release_license_redeemer is not None:
         input = sorted(
             tx.transaction_body.reference_inputs,
-            key=lambda x: (x.transaction_hash.payload, x.index),
+            key=lambda x: (x.transaction_id.payload, x.index),
         )[release_license_redeemer.tally_input_index]
-        tally_state = (
-            TallyState.select()
-            .join(TransactionOutput)
-            .where(
-                TransactionOutput.transaction_hash
-                == input.transaction_id.payload.hex(),
-                TransactionOutput.output_index == input.index,
-            )
-            .first()
-        )
+        tally_state = indexed_outputs.state(TallyState, output_ref(input))
     if receiver is not None and tally_state is not None:
         LicenseMint.create(
-            transaction=add_transaction(tx.id.payload.hex(), block, block_index),
+            transaction=add_transaction(tx.id.payload, block, block_index),
             receiver=add_address(receiver),
             used_tally_state=tally_state,
-            minted_amount=license_mint_amount,
+            amount=license_mint_amount,
             license_nft=add_token(licenses_policy_id, license_token_name),
             expiration_date=datetime.datetime.fromtimestamp(
                 int.from_bytes(license_token_name.payload[3:], "big")
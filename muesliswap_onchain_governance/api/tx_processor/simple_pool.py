@@ -0,0 +1,75 @@
+from typing import List
+
+import pycardano
+
+from .to_db import add_output, add_token_token
+from .classifier import register_processor
+from .datum_cache import datum_cache
+from .indexed_outputs import indexed_outputs
+from ..config import pool_nft_policy_id
+from ..db_models import Block, TrackedGovStates, TrackedTreasuryStates
+from ..db_models.simple_pool import PoolState
+
+from ...onchain.simple_pool import classes as onchain_pool
+
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def token_amount(value: dict, token) -> int:
+    """
+    The amount of an on-chain token in a compact value, lovelace are the token with empty policy id and name
+    """
+    return value.get((token.policy_id, token.token_name), 0)
+
+
+@register_processor("simple_pool", policies=[pool_nft_policy_id.payload])
+def process_tx(
+    tx: pycardano.Transaction,
+    block: Block,
+    block_index: int,
+    tracked_gov_states: TrackedGovStates,
+    tracked_treasury_states: TrackedTreasuryStates,
+    output_indices: List[int],
+):
+    """
+    Process a transaction and update the database accordingly.
+    Every swap, deposit and withdrawal creates a new pool output, whose state stores the reserves
+    taken directly from the value of the output.
+    """
+    for i in output_indices:
+        output = tx.transaction_body.outputs[i]
+        pool_nfts = output.amount.multi_asset.get(pool_nft_policy_id, {})
+        if not pool_nfts:
+            continue
+        pool_output = add_output(output, i, tx.id.payload, block, block_index)
+        try:
+            onchain_pool_state: onchain_pool.PoolState = datum_cache.decode(
+                onchain_pool.PoolState, pool_output.datum_hash_id, output.datum
+            )
+        except Exception as e:
+            _LOGGER.info(f"Invalid pool state at {tx.id.payload.hex()}")
+            continue
+        im_pool_params = onchain_pool_state.im_pool_params
+        up_pool_params = onchain_pool_state.up_pool_params
+        if im_pool_params.pool_nft.policy_id != pool_nft_policy_id.payload or (
+            pool_nfts.get(pycardano.AssetName(im_pool_params.pool_nft.token_name), 0)
+            != 1
+        ):
+            _LOGGER.info(f"Pool output without its pool nft at {tx.id.payload.hex()}")
+            continue
+        value = indexed_outputs.value(pool_output)
+        PoolState.create(
+            transaction_output=pool_output,
+            pool_nft=add_token_token(im_pool_params.pool_nft),
+            token_a=add_token_token(im_pool_params.token_a),
+            token_b=add_token_token(im_pool_params.token_b),
+            lp_token=add_token_token(im_pool_params.pool_lp_token),
+            fee_numerator=up_pool_params.fee.numerator,
+            fee_denominator=up_pool_params.fee.denominator,
+            last_applied_proposal_id=up_pool_params.last_applied_proposal_id,
+            reserve_a=token_amount(value, im_pool_params.token_a),
+            reserve_b=token_amount(value, im_pool_params.token_b),
+            lp_supply=onchain_pool_state.global_liquidity_tokens,
+        )
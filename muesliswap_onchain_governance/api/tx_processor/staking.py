@@ -1,7 +1,8 @@
+from typing import List
+
 import pycardano
 
 from opshin.ledger.api_v2 import FinitePOSIXTime
-from . import from_db
 from .to_db import (
     add_output,
     add_address,
@@ -10,6 +11,11 @@ from .to_db import (
     add_token,
     add_transaction,
 )
+from .classifier import register_processor
+from .datum_cache import datum_cache
+from .indexed_outputs import indexed_outputs, output_ref
+from .values import value_delta
+from .watch_set import watch_set
 from ..config import vote_permission_nft_policy_id
 from ..db_models import Block, TransactionOutput, Transaction
 from ..db_models import (
@@ -17,6 +23,7 @@ from ..db_models import (
     StakingState,
     StakingParticipation,
     TrackedGovStates,
+    TrackedTreasuryStates,
 )
 
 from ...onchain.staking import staking as onchain_staking
@@ -37,59 +44,75 @@ from ...utils.from_script_context import from_address
 _LOGGER = logging.getLogger(__name__)
 
 
+@register_processor(
+    "staking",
+    addresses=lambda: watch_set.staking_addresses,
+    mint_policies=[vote_permission_nft_policy_id.payload],
+)
 def process_tx(
     tx: pycardano.Transaction,
     block: Block,
     block_index: int,
     tracked_gov_states: TrackedGovStates,
+    tracked_treasury_states: TrackedTreasuryStates,
+    output_indices: List[int],
 ):
     """
     Process a transaction and update the database accordingly.
     """
-    # obtain all staking addresses from the tracked gov states
-    staking_addresses = set(
-        from_db.from_address(gs.gov_params.staking_address).to_primitive()
-        for gs in tracked_gov_states
-    )
+    staking_addresses = watch_set.staking_addresses
 
     created_states = []
-    for i, output in enumerate(tx.transaction_body.outputs):
+    for i in output_indices:
+        output = tx.transaction_body.outputs[i]
         if output.address.to_primitive() in staking_addresses:
             _LOGGER.debug(f"Staking transaction: {tx.id.payload.hex()}")
-            staking_output = add_output(
-                output, i, tx.id.payload.hex(), block, block_index
-            )
+            staking_output = add_output(output, i, tx.id.payload, block, block_index)
             try:
                 onchain_staking_state: onchain_staking.StakingState = (
-                    onchain_staking.StakingState.from_primitive(output.datum.data)
+                    datum_cache.decode(
+                        onchain_staking.StakingState,
+                        staking_output.datum_hash_id,
+                        output.datum,
+                    )
                 )
             except Exception as e:
                 _LOGGER.info(f"Invalid staking parameters at {tx.id.payload.hex()}")
                 continue
             onchain_staking_params = onchain_staking_state.params
-            db_staking_params = StakingParams.get_or_create(
-                owner=add_address(from_address(onchain_staking_params.owner)),
-                governance_token=add_token_token(
-                    onchain_staking_params.governance_token
-                ),
-                vault_ft_policy=onchain_staking_params.vault_ft_policy.hex(),
-                tally_auth_nft=add_token_token(onchain_staking_params.tally_auth_nft),
-            )[0]
+            db_staking_params = datum_cache.resolve(
+                StakingParams,
+                onchain_staking_params,
+                lambda: StakingParams.get_or_create(
+                    owner=add_address(from_address(onchain_staking_params.owner)),
+                    governance_token=add_token_token(
+                        onchain_staking_params.governance_token
+                    ),
+                    vault_ft_policy=onchain_staking_params.vault_ft_policy,
+                    tally_auth_nft=add_token_token(
+                        onchain_staking_params.tally_auth_nft
+                    ),
+                )[0],
+            )
             db_staking_state = StakingState.create(
                 transaction_output=staking_output,
                 staking_params=db_staking_params,
             )
             created_states.append(db_staking_state)
             for i, participation in enumerate(onchain_staking_state.participations):
-                db_staking_participation = StakingParticipation.get_or_create(
-                    tally_auth_nft=add_token_token(participation.tally_auth_nft),
-                    proposal_id=participation.proposal_id,
-                    weight=participation.weight,
-                    proposal_index=participation.proposal_index,
-                    end_time=participation.end_time.time
-                    if isinstance(participation.end_time, FinitePOSIXTime)
-                    else None,
-                )[0]
+                db_staking_participation = datum_cache.resolve(
+                    StakingParticipation,
+                    participation,
+                    lambda: StakingParticipation.get_or_create(
+                        tally_auth_nft=add_token_token(participation.tally_auth_nft),
+                        proposal_id=participation.proposal_id,
+                        weight=participation.weight,
+                        proposal_index=participation.proposal_index,
+                        end_time=participation.end_time.time
+                        if isinstance(participation.end_time, FinitePOSIXTime)
+                        else None,
+                    )[0],
+                )
                 StakingParticipationInStaking.create(
                     staking_state=db_staking_state,
                     participation=db_staking_participation,
@@ -100,50 +123,28 @@ def process_tx(
     # there is no way to spend a stake without creating one
     if created_states:
         for input in tx.transaction_body.inputs:
-            staking_state = (
-                StakingState.select()
-                .join(TransactionOutput)
-                .where(
-                    TransactionOutput.transaction_hash
-                    == input.transaction_id.payload.hex(),
-                    TransactionOutput.output_index == input.index,
-                )
-                .first()
-            )
+            staking_state = indexed_outputs.state(StakingState, output_ref(input))
             if staking_state is None:
                 continue
             spent_states.append(staking_state)
     for created_state in created_states:
         spent_state = spent_states[0] if spent_states else None
         staking_deposit = StakingDeposit.create(
-            transaction=add_transaction(tx.id.payload.hex(), block, block_index),
+            transaction=add_transaction(tx.id.payload, block, block_index),
             prev_staking_state=spent_state,
             next_staking_state=created_state,
         )
-        delta_value = pycardano.Value()
-        delta_value += from_db.from_output_values(
-            created_state.transaction_output.assets
-        )
-        if spent_state is not None:
-            delta_value -= from_db.from_output_values(
-                spent_state.transaction_output.assets
-            )
-
-        lovelace = delta_value.coin
-        if lovelace != 0:
+        for policy_id, asset_name, amount in value_delta(
+            [indexed_outputs.value(created_state.transaction_output)],
+            [indexed_outputs.value(spent_state.transaction_output)]
+            if spent_state is not None
+            else [],
+        ):
             StakingDepositDelta.create(
                 staking_deposit=staking_deposit,
-                token=add_token(b"", b""),
-                amount=lovelace,
+                token=add_token(policy_id, asset_name),
+                amount=amount,
             )
-        for policy_id, d in delta_value.multi_asset.items():
-            for asset_name, amount in d.items():
-                if amount == 0:
-                    continue
-                token = add_token(policy_id, asset_name)
-                StakingDepositDelta.create(
-                    staking_deposit=staking_deposit, token=token, amount=amount
-                )
         if spent_state is not None:
             previous_participations = [
                 p.participation for p in spent_state.staking_participations
@@ -173,7 +174,7 @@ def process_tx(
         for asset_name, amount in vote_permission_nft_policy_mint.items():
             add_token(vote_permission_nft_policy_id, asset_name)
             minted_vote_permissions.append(asset_name.to_primitive())
-        # resolve the granted permission from the redeemer
+        # resolve the granted permission from the redeemer, redeemers are not classified (see classifier)
         for redeemer in tx.transaction_witness_set.redeemer:
             if redeemer.tag != pycardano.RedeemerTag.MINT:
                 continue
@@ -191,9 +192,7 @@ def process_tx(
             ]
             for output_index in output_indices:
                 VotePermissionMint.create(
-                    transaction=add_transaction(
-                        tx.id.payload.hex(), block, block_index
-                    ),
+                    transaction=add_transaction(tx.id.payload, block, block_index),
                     vote_permission=VotePermission.get_or_create(
                         token=add_token(
                             vote_permission_nft_policy_id, datum_hash.payload
@@ -203,7 +202,7 @@ def process_tx(
                     output=add_output(
                         tx.transaction_body.outputs[output_index],
                         output_index,
-                        tx.id.payload.hex(),
+                        tx.id.payload,
                         block,
                         block_index,
                     ),
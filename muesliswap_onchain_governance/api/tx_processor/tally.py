@@ -1,5 +1,7 @@
 import datetime
+import itertools
 from collections import defaultdict
+from typing import List
 
 import pycardano
 
@@ -14,8 +16,18 @@ from .to_db import (
     add_datum,
     add_address_raw,
 )
+from .classifier import register_processor
+from .datum_cache import datum_cache
+from .indexed_outputs import indexed_outputs, output_ref
+from .watch_set import watch_set
 from ..config import gov_state_nft_policy_id
-from ..db_models import Block, TransactionOutput, Transaction, TrackedGovStates
+from ..db_models import (
+    Block,
+    TransactionOutput,
+    Transaction,
+    TrackedGovStates,
+    TrackedTreasuryStates,
+)
 from ..db_models import tally_state as db_tally
 
 from ...onchain.tally import tally as onchain_tally
@@ -27,23 +39,50 @@ from ...utils.from_script_context import from_address
 _LOGGER = logging.getLogger(__name__)
 
 
+def add_tally_params(
+    onchain_tally_params: onchain_tally.ProposalParams,
+) -> db_tally.TallyParams:
+    """
+    Store the tally parameters and their proposals in the database.
+    """
+    db_tally_params = db_tally.TallyParams.get_or_create(
+        quorum=onchain_tally_params.quorum,
+        end_time=datetime.datetime.fromtimestamp(
+            onchain_tally_params.end_time.time / 1000
+        )
+        if isinstance(onchain_tally_params.end_time, onchain_tally.FinitePOSIXTime)
+        else None,
+        proposal_id=onchain_tally_params.proposal_id,
+        tally_auth_nft=add_token_token(onchain_tally_params.tally_auth_nft),
+        staking_vote_nft_policy=onchain_tally_params.staking_vote_nft_policy,
+        staking_address=add_address(from_address(onchain_tally_params.staking_address)),
+        governance_token=add_token_token(onchain_tally_params.governance_token),
+        vault_ft_policy=onchain_tally_params.vault_ft_policy,
+    )[0]
+    for i, proposal in enumerate(onchain_tally_params.proposals):
+        db_tally.TallyProposals.get_or_create(
+            index=i,
+            tally_params=db_tally_params,
+            proposal=add_datum(proposal),
+        )
+    return db_tally_params
+
+
+@register_processor("tally", addresses=lambda: watch_set.tally_addresses)
 def process_tx(
     tx: pycardano.Transaction,
     block: Block,
     block_index: int,
     tracked_gov_states: TrackedGovStates,
+    tracked_treasury_states: TrackedTreasuryStates,
+    output_indices: List[int],
 ):
     """
     Process a transaction and update the database accordingly.
+    All outputs are visited, as the addresses of the other outputs are the participants of a tally creation.
     """
-    tally_auth_nft_policy_ids = set(
-        pycardano.ScriptHash(bytes.fromhex(gs.gov_params.tally_auth_nft_policy))
-        for gs in tracked_gov_states
-    )
-    tally_addresses = set(
-        from_db.from_address(gs.gov_params.tally_address).to_primitive()
-        for gs in tracked_gov_states
-    )
+    tally_auth_nft_policy_ids = watch_set.tally_auth_nft_policy_ids
+    tally_addresses = watch_set.tally_addresses
     created_states = []
     participants = set()
     for i, output in enumerate(tx.transaction_body.outputs):
@@ -51,55 +90,40 @@ def process_tx(
             participants.add(output.address.to_primitive())
             continue
         _LOGGER.info(f"Transaction contains tally {tx.id.payload.hex()}")
-        tally_auth_nft_policy_id = tally_auth_nft_policy_ids.intersection(
-            output.amount.multi_asset.keys()
-        )
-        if not tally_auth_nft_policy_id:
+        if not any(
+            policy_id.payload in tally_auth_nft_policy_ids
+            for policy_id in output.amount.multi_asset.keys()
+        ):
             _LOGGER.warning(
                 f"Transaction output does not contain tally auth nft {tx.id.payload.hex()}"
             )
             continue
-        tally_output = add_output(output, i, tx.id.payload.hex(), block, block_index)
+        tally_output = add_output(output, i, tx.id.payload, block, block_index)
         try:
-            onchain_tally_state: onchain_tally = (
-                onchain_tally.TallyState.from_primitive(output.datum.data)
+            onchain_tally_state: onchain_tally.TallyState = datum_cache.decode(
+                onchain_tally.TallyState, tally_output.datum_hash_id, output.datum
             )
         except Exception as e:
             _LOGGER.info(f"Invalid gov state parameters at {tx.id.payload.hex()}")
             continue
         onchain_tally_params = onchain_tally_state.params
-        db_tally_params = db_tally.TallyParams.get_or_create(
-            quorum=onchain_tally_params.quorum,
-            end_time=datetime.datetime.fromtimestamp(
-                onchain_tally_params.end_time.time / 1000
-            )
-            if isinstance(onchain_tally_params.end_time, onchain_tally.FinitePOSIXTime)
-            else None,
-            proposal_id=onchain_tally_params.proposal_id,
-            tally_auth_nft=add_token_token(onchain_tally_params.tally_auth_nft),
-            staking_vote_nft_policy=onchain_tally_params.staking_vote_nft_policy.hex(),
-            staking_address=add_address(
-                from_address(onchain_tally_params.staking_address)
-            ),
-            governance_token=add_token_token(onchain_tally_params.governance_token),
-            vault_ft_policy=onchain_tally_params.vault_ft_policy.hex(),
-        )[0]
-        for i, proposal in enumerate(onchain_tally_params.proposals):
-            db_tally.TallyProposals.get_or_create(
-                index=i,
-                tally_params=db_tally_params,
-                proposal=add_datum(proposal),
-            )
+        db_tally_params = datum_cache.resolve(
+            db_tally.TallyParams,
+            onchain_tally_params,
+            lambda: add_tally_params(onchain_tally_params),
+        )
         _db_tally = db_tally.TallyState.create(
             transaction_output=tally_output,
             tally_params=db_tally_params,
         )
         for i, weight in enumerate(onchain_tally_state.votes):
-            db_tally.TallyWeights.get_or_create(
+            db_tally.TallyWeights.create(
                 index=i,
                 tally_state=_db_tally,
                 weight=weight,
             )
+        # kept in memory with the state, see IndexedOutputs
+        _db_tally.weights = list(onchain_tally_state.votes)
         created_states.append(_db_tally)
 
     spent_states = []
@@ -109,36 +133,10 @@ def process_tx(
     # there is no way to spend a tally without creating one
     if created_states:
         for input in tx.transaction_body.inputs:
-            _db_tally = (
-                db_tally.TallyState.select()
-                .join(TransactionOutput)
-                .where(
-                    TransactionOutput.transaction_hash
-                    == input.transaction_id.payload.hex(),
-                    TransactionOutput.output_index == input.index,
-                )
-                .first()
-            )
-            _db_gov_state = (
-                db_tally.GovState.select()
-                .join(TransactionOutput)
-                .where(
-                    TransactionOutput.transaction_hash
-                    == input.transaction_id.payload.hex(),
-                    TransactionOutput.output_index == input.index,
-                )
-                .first()
-            )
-            _db_staking_state = (
-                db_tally.StakingState.select()
-                .join(TransactionOutput)
-                .where(
-                    TransactionOutput.transaction_hash
-                    == input.transaction_id.payload.hex(),
-                    TransactionOutput.output_index == input.index,
-                )
-                .first()
-            )
+            ref = output_ref(input)
+            _db_tally = indexed_outputs.state(db_tally.TallyState, ref)
+            _db_gov_state = indexed_outputs.state(db_tally.GovState, ref)
+            _db_staking_state = indexed_outputs.state(db_tally.StakingState, ref)
             if _db_tally is not None:
                 spent_states.append(_db_tally)
             if _db_gov_state is not None:
@@ -150,9 +148,7 @@ def process_tx(
         if not spent_states and spent_gov_states:
             for created_state in created_states:
                 tally_creation = db_tally.TallyCreation.create(
-                    transaction=add_transaction(
-                        tx.id.payload.hex(), block, block_index
-                    ),
+                    transaction=add_transaction(tx.id.payload, block, block_index),
                     gov_state=spent_gov_states[0],
                     next_tally_state=created_state,
                 )
@@ -163,32 +159,21 @@ def process_tx(
                     )
         # if a tally and a stake was spent, then this was a vote
         if spent_states and spent_staking_states:
+            previous_tally_state = spent_states[0]
             for created_state in created_states:
-                # because it is convenient, we just fetch the vote delta from the database
-                previous_tally_state = spent_states[0]
-                OldWeights = db_tally.TallyWeights.alias()
-                NewWeights = db_tally.TallyWeights.alias()
-                res = (
-                    OldWeights.select(
-                        NewWeights.weight - OldWeights.weight,
-                        OldWeights.index,
+                # a vote may change the weights of several proposals at once
+                for index, (old_weight, new_weight) in enumerate(
+                    itertools.zip_longest(
+                        previous_tally_state.weights, created_state.weights, fillvalue=0
                     )
-                    .join(NewWeights, on=(OldWeights.index == NewWeights.index))
-                    .where(
-                        OldWeights.tally_state == previous_tally_state,
-                        NewWeights.tally_state == created_state,
-                        OldWeights.weight != NewWeights.weight,
+                ):
+                    if old_weight == new_weight:
+                        continue
+                    db_tally.TallyVote.create(
+                        transaction=add_transaction(tx.id.payload, block, block_index),
+                        staking_state=spent_staking_states[0],
+                        index=index,
+                        weight_delta=new_weight - old_weight,
+                        prev_tally_state=previous_tally_state,
+                        next_tally_state=created_state,
                     )
-                    .scalar(as_tuple=True)
-                )
-                delta, index = res
-                db_tally.TallyVote.create(
-                    transaction=add_transaction(
-                        tx.id.payload.hex(), block, block_index
-                    ),
-                    staking_state=spent_staking_states[0],
-                    index=index,
-                    weight_delta=delta,
-                    prev_tally_state=previous_tally_state,
-                    next_tally_state=created_state,
-                )
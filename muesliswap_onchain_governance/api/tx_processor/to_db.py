@@ -1,4 +1,5 @@
-from typing import Union
+from collections import OrderedDict
+from typing import List, Tuple, Type, Union
 
 import cbor2
 
@@ -13,14 +14,66 @@ from ..db_models import (
     Token,
     Block,
     Transaction,
+    LIVE_STATE_MODELS,
 )
+from ..db_models.db import BaseModel
+from ..metrics import metrics
+from .indexed_outputs import indexed_outputs
+from .values import compact_value
+
+
+class InterningCache:
+    """
+    Bounded LRU map from the natural key of rows that are shared by many outputs
+    (addresses, tokens, datums) to their ids, to avoid a SELECT (and INSERT) for every use.
+    The rows are never deleted by rollbacks, but rows inserted in a block whose writes
+    are rolled back are, so the caches are cleared then (see undo_journal).
+    """
+
+    def __init__(
+        self, model: Type[BaseModel], key_fields: Tuple[str, ...], maxsize: int
+    ):
+        self.model = model
+        self.key_fields = key_fields
+        self.maxsize = maxsize
+        self._ids: OrderedDict[tuple, int] = OrderedDict()
+
+    def get_or_create(self, **fields) -> BaseModel:
+        """
+        Like Model.get_or_create, but only queries the database if the row is not cached
+        """
+        key = tuple(fields[f] for f in self.key_fields)
+        name = self.model._meta.table_name
+        row_id = self._ids.get(key)
+        if row_id is not None:
+            self._ids.move_to_end(key)
+            metrics.inc("interning_cache_lookups", cache=name, result="hit")
+        else:
+            metrics.inc("interning_cache_lookups", cache=name, result="miss")
+            row_id = self._ids[key] = self.model.get_or_create(**fields)[0].id
+            if len(self._ids) > self.maxsize:
+                self._ids.popitem(last=False)
+        return self.model(id=row_id, **fields)
+
+    def clear(self):
+        self._ids.clear()
+
+
+address_cache = InterningCache(Address, ("address_raw",), 10_000)
+token_cache = InterningCache(Token, ("policy_id", "asset_name"), 10_000)
+datum_row_cache = InterningCache(Datum, ("hash",), 1_000)
+
+
+def clear_interning_caches():
+    for cache in (address_cache, token_cache, datum_row_cache):
+        cache.clear()
 
 
 def add_address_raw(address: bytes) -> Address:
     """
     Store the address in the database.
     """
-    return Address.get_or_create(address_raw=address.hex())[0]
+    return address_cache.get_or_create(address_raw=address)
 
 
 def add_address(address: pycardano.Address) -> Address:
@@ -34,10 +87,10 @@ def add_datum(datum: pycardano.Datum) -> Datum:
     """
     Store the datum in the database.
     """
-    return Datum.get_or_create(
-        hash=pycardano.datum_hash(datum).to_primitive().hex(),
+    return datum_row_cache.get_or_create(
+        hash=pycardano.datum_hash(datum).to_primitive(),
         data=cbor2.dumps(datum, default=pycardano.default_encoder),
-    )[0]
+    )
 
 
 def add_token_token(token: prelude.Token) -> Token:
@@ -58,14 +111,14 @@ def add_token(
         policy_id = policy_id.payload
     if isinstance(asset_name, pycardano.AssetName):
         asset_name = asset_name.payload
-    return Token.get_or_create(
-        policy_id=policy_id.hex(),
-        asset_name=asset_name.hex(),
-    )[0]
+    return token_cache.get_or_create(
+        policy_id=policy_id,
+        asset_name=asset_name,
+    )
 
 
 def add_transaction(
-    transaction_hash: str,
+    transaction_hash: bytes,
     block: Block,
     block_index: int,
 ):
@@ -82,7 +135,7 @@ def add_transaction(
 def add_output(
     tx_output: pycardano.TransactionOutput,
     index: int,
-    transaction_hash: str,
+    transaction_hash: bytes,
     block: Block,
     block_index: int,
 ) -> TransactionOutput:
@@ -92,7 +145,7 @@ def add_output(
     if tx_output.datum is not None:
         datum_hash = add_datum(tx_output.datum).hash
     elif tx_output.datum_hash is not None:
-        datum_hash = tx_output.datum_hash.to_primitive().hex()
+        datum_hash = tx_output.datum_hash.to_primitive()
     else:
         datum_hash = None
     output, created = TransactionOutput.get_or_create(
@@ -104,6 +157,7 @@ def add_output(
     )
     if not created:
         return output
+    indexed_outputs.add(output, compact_value(tx_output.amount))
     lovelace = tx_output.amount.coin
     TransactionOutputValue.create(
         transaction_output=output,
@@ -117,3 +171,29 @@ def add_output(
                 transaction_output=output, token=token, amount=amount
             )
     return output
+
+
+def set_states_live(output_ids: List[int], live: bool):
+    """
+    Set the live flag of the states at the given outputs, i.e. when they are spent or restored
+    """
+    for model in LIVE_STATE_MODELS:
+        model.update(live=live).where(
+            model.transaction_output.in_(output_ids)
+        ).execute()
+
+
+def restore_live_states():
+    """
+    Mark the states at unspent outputs live again,
+    after the database restored the outputs spent in deleted blocks
+    """
+    for model in LIVE_STATE_MODELS:
+        model.update(live=True).where(
+            ~model.live
+            & model.transaction_output.in_(
+                TransactionOutput.select(TransactionOutput.id).where(
+                    TransactionOutput.spent_in_block.is_null()
+                )
+            )
+        ).execute()
@@ -1,7 +1,8 @@
+from typing import List
+
 import pycardano
 
 from opshin.ledger.api_v2 import FinitePOSIXTime
-from . import from_db
 from .to_db import (
     add_output,
     add_address,
@@ -10,6 +11,11 @@ from .to_db import (
     add_token,
     add_transaction,
 )
+from .classifier import register_processor
+from .datum_cache import datum_cache
+from .indexed_outputs import indexed_outputs, output_ref
+from .values import value_delta
+from .watch_set import watch_set
 from ..config import vote_permission_nft_policy_id, treasurer_nft_policy_id
 from ..db_models import Block, TransactionOutput, Transaction, TrackedGovStates
 from ..db_models.treasury import TrackedTreasuryStates
@@ -24,32 +30,41 @@ from ...utils.from_script_context import from_address
 _LOGGER = logging.getLogger(__name__)
 
 
+@register_processor(
+    "treasury",
+    addresses=lambda: watch_set.value_store_addresses,
+    policies=[treasurer_nft_policy_id.payload],
+)
 def process_tx(
     tx: pycardano.Transaction,
     block: Block,
     block_index: int,
+    tracked_gov_states: TrackedGovStates,
     tracked_treasury_states: TrackedTreasuryStates,
+    output_indices: List[int],
 ):
     """
     Process a transaction and update the database accordingly.
     Updates the tracked treasury states.
     """
-    value_stores = set(
-        from_db.from_address(t.treasurer_params.value_store).to_primitive()
-        for t in tracked_treasury_states
-    )
+    value_stores = watch_set.value_store_addresses
 
     created_treasurer_states = []
     created_value_stores = []
-    for i, output in enumerate(tx.transaction_body.outputs):
+    for i in output_indices:
+        output = tx.transaction_body.outputs[i]
         if output.address.to_primitive() in value_stores:
             _LOGGER.debug(f"Stores funds in value store: {tx.id.payload.hex()}")
             value_store_output = add_output(
-                output, i, tx.id.payload.hex(), block, block_index
+                output, i, tx.id.payload, block, block_index
             )
             try:
                 onchain_value_store_state: onchain_treasurer.ValueStoreState = (
-                    onchain_treasurer.ValueStoreState.from_primitive(output.datum.data)
+                    datum_cache.decode(
+                        onchain_treasurer.ValueStoreState,
+                        value_store_output.datum_hash_id,
+                        output.datum,
+                    )
                 )
             except Exception as e:
                 _LOGGER.info(f"Invalid treasurer parameters at {tx.id.payload.hex()}")
@@ -60,12 +75,14 @@ def process_tx(
             )
             created_value_stores.append(value_store_state)
         if output.amount.multi_asset.get(treasurer_nft_policy_id, {}):
-            treasurer_output = add_output(
-                output, i, tx.id.payload.hex(), block, block_index
-            )
+            treasurer_output = add_output(output, i, tx.id.payload, block, block_index)
             try:
                 onchain_treasurer_state: onchain_treasurer.TreasurerState = (
-                    onchain_treasurer.TreasurerState.from_primitive(output.datum.data)
+                    datum_cache.decode(
+                        onchain_treasurer.TreasurerState,
+                        treasurer_output.datum_hash_id,
+                        output.datum,
+                    )
                 )
             except Exception as e:
                 _LOGGER.info(f"Invalid treasurer parameters at {tx.id.payload.hex()}")
@@ -95,27 +112,13 @@ def process_tx(
     if not (created_treasurer_states or created_value_stores):
         return
     for i, input in enumerate(tx.transaction_body.inputs):
-        value_store_state = (
-            db_treasury.ValueStoreState.select()
-            .join(TransactionOutput)
-            .where(
-                TransactionOutput.transaction_hash
-                == input.transaction_id.payload.hex(),
-                TransactionOutput.output_index == input.index,
-            )
-            .first()
+        value_store_state = indexed_outputs.state(
+            db_treasury.ValueStoreState, output_ref(input)
         )
         if value_store_state is not None:
             spent_value_store_states.append(value_store_state)
-        treasurer_state = (
-            db_treasury.TreasurerState.select()
-            .join(TransactionOutput)
-            .where(
-                TransactionOutput.transaction_hash
-                == input.transaction_id.payload.hex(),
-                TransactionOutput.output_index == input.index,
-            )
-            .first()
+        treasurer_state = indexed_outputs.state(
+            db_treasury.TreasurerState, output_ref(input)
         )
         if treasurer_state is not None:
             tracked_treasury_states.remove(treasurer_state)
@@ -136,7 +139,7 @@ def process_tx(
             payout_output = add_output(
                 tx.transaction_body.outputs[onchain_treasurer_redeemer.payout_index],
                 onchain_treasurer_redeemer.payout_index,
-                tx.id.payload.hex(),
+                tx.id.payload,
                 block,
                 block_index,
             )
@@ -147,21 +150,12 @@ def process_tx(
             tx.transaction_body.reference_inputs,
             key=lambda x: (x.transaction_id.payload, x.index),
         )[tally_input_index]
-        tally_state = (
-            db_treasury.TallyState.select()
-            .join(TransactionOutput)
-            .where(
-                TransactionOutput.transaction_hash
-                == input.transaction_id.payload.hex(),
-                TransactionOutput.output_index == input.index,
-            )
-            .first()
-        )
+        tally_state = indexed_outputs.state(db_treasury.TallyState, output_ref(input))
         if tally_state is not None:
             ref_tally_states.append(tally_state)
 
     treasury_delta = db_treasury.TreasuryDelta.create(
-        transaction=add_transaction(tx.id.payload.hex(), block, block_index),
+        transaction=add_transaction(tx.id.payload, block, block_index),
     )
     if spent_treasurer_states and ref_tally_states and payout_output is not None:
         db_treasury.TreasuryPayout.create(
@@ -172,23 +166,12 @@ def process_tx(
             tally_state=ref_tally_states[0] if ref_tally_states else None,
             payout_output=payout_output,
         )
-    delta_value = pycardano.Value()
-    for state in created_value_stores:
-        delta_value += from_db.from_output_values(state.transaction_output.assets)
-    for state in spent_value_store_states:
-        delta_value -= from_db.from_output_values(state.transaction_output.assets)
-    lovelace = delta_value.coin
-    if lovelace != 0:
+    for policy_id, asset_name, amount in value_delta(
+        [indexed_outputs.value(s.transaction_output) for s in created_value_stores],
+        [indexed_outputs.value(s.transaction_output) for s in spent_value_store_states],
+    ):
         db_treasury.TreasuryDeltaValue.create(
             treasury_delta=treasury_delta,
-            token=add_token(b"", b""),
-            amount=lovelace,
+            token=add_token(policy_id, asset_name),
+            amount=amount,
         )
-    for policy_id, d in delta_value.multi_asset.items():
-        for asset_name, amount in d.items():
-            if amount == 0:
-                continue
-            token = add_token(policy_id, asset_name)
-            db_treasury.TreasuryDeltaValue.create(
-                treasury_delta=treasury_delta, token=token, amount=amount
-            )
@@ -0,0 +1,156 @@
+"""
+Journal of the changes of the most recent blocks, used to undo them on a rollback.
+Instead of deleting all blocks after the rollback point and letting the database
+cascade the deletion through the whole history, only the rows inserted
+by the rolled back blocks are deleted and only the outputs spent in them are restored.
+"""
+import itertools
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Tuple
+
+from ..db_models import (
+    Block,
+    TransactionOutput,
+    TrackedGovStates,
+    TrackedTreasuryStates,
+)
+from ..db_models.db import BaseModel, insert_listeners
+from .datum_cache import datum_cache
+from .indexed_outputs import OutputRef, indexed_outputs
+from .to_db import clear_interning_caches, set_states_live
+
+
+def _owned_by_block(model, _seen=()) -> bool:
+    """
+    Whether rows of this model are deleted together with the block they were created in
+    """
+    if model is Block:
+        return True
+    return any(
+        fk.on_delete == "CASCADE"
+        and fk.rel_model not in _seen
+        and _owned_by_block(fk.rel_model, (*_seen, model))
+        for fk in model._meta.refs
+    )
+
+
+@dataclass
+class BlockJournal:
+    slot: int
+    tracked_gov_states: TrackedGovStates
+    tracked_treasury_states: TrackedTreasuryStates
+    inserted: List[BaseModel] = field(default_factory=list)
+    spent: Dict[OutputRef, int] = field(default_factory=dict)
+
+
+class UndoJournal:
+    """
+    Keeps the inserted rows, spent outputs and tracked states of the last `depth` blocks.
+    Rollbacks to a slot before the oldest journaled block can not be undone
+    and need to fall back to deleting the blocks after the rollback point.
+    """
+
+    def __init__(self, depth: int = 2160):
+        self.depth = depth
+        self._blocks: Deque[BlockJournal] = deque()
+        self._current: Optional[BlockJournal] = None
+        # slot of the last block before the journaled ones
+        self._base_slot: Optional[int] = None
+        self._owned_by_block = {}
+
+    def reset(self, slot: int):
+        """
+        Clear the journal after the database was rolled back to the given slot
+        """
+        self._blocks.clear()
+        self._current = None
+        self._base_slot = slot
+
+    def begin_block(
+        self,
+        slot: int,
+        tracked_gov_states: TrackedGovStates,
+        tracked_treasury_states: TrackedTreasuryStates,
+    ):
+        """
+        Start recording the changes of the block at the given slot
+        """
+        self._current = BlockJournal(
+            slot, list(tracked_gov_states), list(tracked_treasury_states)
+        )
+
+    def end_block(self):
+        """
+        Keep the recorded changes of the current block
+        """
+        self._blocks.append(self._current)
+        self._current = None
+        while len(self._blocks) > self.depth:
+            self._base_slot = self._blocks.popleft().slot
+
+    def discard_block(self):
+        """
+        Drop the recorded changes of the current block, i.e. because its writes were rolled back
+        """
+        self._current = None
+        # the rolled back writes may have included interned rows
+        clear_interning_caches()
+        datum_cache.clear_rows()
+
+    def record_insert(self, row: BaseModel):
+        if self._current is None:
+            return
+        model = type(row)
+        if model not in self._owned_by_block:
+            self._owned_by_block[model] = _owned_by_block(model)
+        if self._owned_by_block[model]:
+            self._current.inserted.append(row)
+
+    def record_spent(self, spent: Dict[OutputRef, int]):
+        if self._current is not None:
+            self._current.spent.update(spent)
+
+    def covers(self, slot: int) -> bool:
+        """
+        Whether a rollback to the given slot can be undone using the journal
+        """
+        return self._base_slot is not None and slot >= self._base_slot
+
+    def rollback(
+        self, slot: int
+    ) -> Tuple[TrackedGovStates, TrackedTreasuryStates] | None:
+        """
+        Undo all journaled blocks after the given slot
+        :return: the tracked states before the oldest undone block, None if no block was undone
+        """
+        undone = None
+        while self._blocks and self._blocks[-1].slot > slot:
+            undone = self._blocks.pop()
+            self._undo(undone)
+        if undone is None:
+            return None
+        return undone.tracked_gov_states, undone.tracked_treasury_states
+
+    @staticmethod
+    def _undo(block: BlockJournal):
+        if block.spent:
+            TransactionOutput.update(spent_in_block=None).where(
+                TransactionOutput.id.in_(list(block.spent.values()))
+            ).execute()
+            set_states_live(list(block.spent.values()), True)
+            indexed_outputs.restore(block.spent)
+        # delete in reverse order of insertion, so that rows are deleted before the rows they reference
+        for model, rows in itertools.groupby(reversed(block.inserted), key=type):
+            rows = list(rows)
+            model.delete().where(
+                model._meta.primary_key.in_([r._pk for r in rows])
+            ).execute()
+            if model is TransactionOutput:
+                indexed_outputs.remove(
+                    [(r.transaction_hash, r.output_index) for r in rows]
+                )
+
+
+undo_journal = UndoJournal()
+insert_listeners.append(undo_journal.record_insert)
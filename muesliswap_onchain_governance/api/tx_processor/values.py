@@ -0,0 +1,41 @@
+"""
+Compact in-memory representation of the value of an output, as kept for the indexed outputs.
+"""
+from typing import Dict, Iterable, Iterator, Tuple
+
+import pycardano
+
+# maps (policy id, asset name) to the amount, lovelace are keyed by LOVELACE
+CompactValue = Dict[Tuple[bytes, bytes], int]
+
+LOVELACE = (b"", b"")
+
+
+def compact_value(value: pycardano.Value) -> CompactValue:
+    compact = {LOVELACE: value.coin}
+    for policy_id, assets in value.multi_asset.items():
+        for asset_name, amount in assets.items():
+            compact[(policy_id.payload, asset_name.payload)] = amount
+    return compact
+
+
+def value_delta(
+    added: Iterable[CompactValue], removed: Iterable[CompactValue]
+) -> Iterator[Tuple[bytes, bytes, int]]:
+    """
+    The non-zero amounts of the sum of the added values minus the sum of the removed values.
+    Lovelace come first, the tokens are grouped by policy in order of their first occurrence.
+    """
+    by_policy: Dict[bytes, Dict[bytes, int]] = {}
+    for values, sign in ((added, 1), (removed, -1)):
+        for value in values:
+            for (policy_id, asset_name), amount in value.items():
+                assets = by_policy.setdefault(policy_id, {})
+                assets[asset_name] = assets.get(asset_name, 0) + sign * amount
+    lovelace = by_policy.pop(LOVELACE[0], {}).get(LOVELACE[1], 0)
+    if lovelace != 0:
+        yield LOVELACE[0], LOVELACE[1], lovelace
+    for policy_id, assets in by_policy.items():
+        for asset_name, amount in assets.items():
+            if amount != 0:
+                yield policy_id, asset_name, amount
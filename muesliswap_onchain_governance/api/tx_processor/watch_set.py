@@ -0,0 +1,62 @@
+from typing import Set
+
+import pycardano
+
+from ..db_models import TrackedGovStates, TrackedTreasuryStates
+
+
+class WatchSet:
+    """
+    The addresses and policies watched by the processors, derived from the tracked gov and treasury states.
+    Addresses are keyed by their raw bytes and policies by the bytes of their id.
+    They are only recomputed when the tracked states change, not for every transaction.
+    """
+
+    def __init__(self):
+        self._key = None
+        self.staking_addresses: Set[bytes] = set()
+        self.tally_addresses: Set[bytes] = set()
+        self.tally_auth_nft_policy_ids: Set[bytes] = set()
+        self.value_store_addresses: Set[bytes] = set()
+        # all of the above addresses, bech32 encoded as reported by ogmios
+        self.bech32_addresses: Set[str] = set()
+
+    def update(
+        self,
+        tracked_gov_states: TrackedGovStates,
+        tracked_treasury_states: TrackedTreasuryStates,
+    ) -> bool:
+        """
+        Recompute the watched addresses and policies if the tracked states changed
+        :return: whether the tracked states changed
+        """
+        key = (
+            tuple(gs.id for gs in tracked_gov_states),
+            tuple(ts.id for ts in tracked_treasury_states),
+        )
+        if key == self._key:
+            return False
+        self._key = key
+        self.staking_addresses = {
+            gs.gov_params.staking_address.address_raw for gs in tracked_gov_states
+        }
+        self.tally_addresses = {
+            gs.gov_params.tally_address.address_raw for gs in tracked_gov_states
+        }
+        self.tally_auth_nft_policy_ids = {
+            gs.gov_params.tally_auth_nft_policy for gs in tracked_gov_states
+        }
+        self.value_store_addresses = {
+            ts.treasurer_params.value_store.address_raw
+            for ts in tracked_treasury_states
+        }
+        self.bech32_addresses = {
+            pycardano.Address.from_primitive(a).encode()
+            for a in self.staking_addresses
+            | self.tally_addresses
+            | self.value_store_addresses
+        }
+        return True
+
+
+watch_set = WatchSet()
@@ -0,0 +1,94 @@
+"""
+Groups the database writes of several blocks into a single SQLite transaction.
+Committing once per row (or per block) is dominated by the WAL commit,
+so during catch-up several blocks are committed at once.
+Near the tip, or whenever the next block is not available yet,
+every block is committed as soon as it is processed.
+"""
+import contextlib
+import time
+from typing import Callable
+
+from peewee import Database
+
+from .metrics import metrics
+
+
+class WriteBatcher:
+    """
+    Wraps the writes of each block in a savepoint of a transaction spanning multiple blocks.
+    The transaction is committed after `max_blocks` blocks, after `max_time_ms` milliseconds
+    or as soon as a block within `tip_distance` slots of the chain tip was written.
+    It is also committed when `buffered` reports that no further block is available yet,
+    so that written blocks are never kept uncommitted while waiting for the chain.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        max_blocks: int = 100,
+        max_time_ms: int = 1000,
+        tip_distance: int = 600,
+        buffered: Callable[[], int] = None,
+    ):
+        self.database = database
+        self.max_blocks = max_blocks
+        self.max_time_ms = max_time_ms
+        self.tip_distance = tip_distance
+        self.buffered = buffered
+        self._transaction = None
+        self._started = 0.0
+        self._blocks = 0
+
+    def _begin(self):
+        if self._transaction is None:
+            self._transaction = self.database.atomic()
+            self._transaction.__enter__()
+            self._started = time.monotonic()
+            self._blocks = 0
+
+    def commit(self):
+        """
+        Commit all blocks written so far
+        """
+        if self._transaction is not None:
+            transaction, self._transaction = self._transaction, None
+            with metrics.timer("commit"):
+                transaction.__exit__(None, None, None)
+
+    @contextlib.contextmanager
+    def write(self):
+        """
+        Execute writes that do not belong to a block (i.e. rollbacks) as part of the current batch
+        """
+        self._begin()
+        try:
+            with self.database.atomic():
+                yield
+        except BaseException:
+            self.commit()
+            raise
+
+    @contextlib.contextmanager
+    def block(self, slot: int, tip_slot: int):
+        """
+        Execute the writes of a block at the given slot.
+        If processing the block fails, all of its writes are rolled back,
+        the previous blocks of the batch are committed and the error is re-raised.
+        """
+        with self.write():
+            yield
+        self._blocks += 1
+        if (
+            self._blocks >= self.max_blocks
+            or (time.monotonic() - self._started) * 1000 >= self.max_time_ms
+            or tip_slot - slot <= self.tip_distance
+            or (self.buffered is not None and self.buffered() == 0)
+        ):
+            self.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.commit()
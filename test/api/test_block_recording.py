@@ -0,0 +1,89 @@
+import json
+
+from muesliswap_onchain_governance.api import ogmios
+from muesliswap_onchain_governance.api.block_recording import (
+    BlockRecorder,
+    ReplayIterator,
+)
+
+
+def forward_response(slot: int) -> str:
+    block = {
+        "type": "praos",
+        "id": f"{slot:064x}",
+        "slot": slot,
+        "height": slot,
+        "transactions": [],
+    }
+    return json.dumps(
+        {
+            "jsonrpc": "2.0",
+            "method": "nextBlock",
+            "result": {
+                "direction": "forward",
+                "tip": {"slot": 100, "id": "ff" * 32, "height": 100},
+                "block": block,
+            },
+        }
+    )
+
+
+def backward_response(point) -> str:
+    return json.dumps(
+        {
+            "jsonrpc": "2.0",
+            "method": "nextBlock",
+            "result": {"direction": "backward", "point": point},
+        }
+    )
+
+
+def record(path, responses: list):
+    with BlockRecorder(path) as recorder:
+        for response in responses:
+            operation = ogmios.parse_next_block_response(json.loads(response))
+            recorder.record(response, operation)
+
+
+def slots(operations) -> list:
+    return [
+        ogmios.tip_from_block(o.block).slot
+        if isinstance(o, ogmios.Rollforward)
+        else ("rollback", getattr(o.tip, "slot", None))
+        for o in operations
+    ]
+
+
+def test_replay_whole_recording(tmp_path):
+    path = tmp_path / "blocks.rec"
+    record(path, [backward_response("origin"), forward_response(1)])
+    # recording into an existing file appends
+    record(
+        path,
+        [
+            forward_response(2),
+            backward_response({"slot": 1, "id": f"{1:064x}"}),
+            forward_response(3),
+        ],
+    )
+    iterator = ReplayIterator(path)
+    assert slots(iterator.iterate_blocks([])) == [
+        ("rollback", None),
+        1,
+        2,
+        ("rollback", 1),
+        3,
+    ]
+    assert iterator.buffered == 0
+
+
+def test_replay_from_intersection(tmp_path):
+    path = tmp_path / "blocks.rec"
+    record(
+        path, [backward_response("origin")] + [forward_response(s) for s in (1, 2, 3)]
+    )
+    iterator = ReplayIterator(path)
+    operations = iterator.iterate_blocks(
+        [ogmios.Point(slot=2, id=f"{2:064x}"), ogmios.Point(slot=1, id=f"{1:064x}")]
+    )
+    assert slots(operations) == [("rollback", 2), 3]
@@ -0,0 +1,95 @@
+import pytest
+from peewee import SqliteDatabase
+
+from muesliswap_onchain_governance.api.bulk_sync import BulkSyncMode, BulkSyncError
+from muesliswap_onchain_governance.api.db_models import (
+    Address,
+    Block,
+    Datum,
+    Token,
+    Transaction,
+    TransactionOutput,
+    TransactionOutputValue,
+)
+
+MODELS = [
+    Block,
+    Address,
+    Datum,
+    Token,
+    Transaction,
+    TransactionOutput,
+    TransactionOutputValue,
+]
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = SqliteDatabase(
+        tmp_path / "bulk.db", pragmas={"journal_mode": "wal", "foreign_keys": 1}
+    )
+    with database.bind_ctx(MODELS):
+        database.create_tables(MODELS)
+        yield database
+    database.close()
+
+
+def index_names(database) -> set:
+    return {
+        name
+        for name, in database.execute_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+        )
+    }
+
+
+def test_bulk_mode_drops_and_rebuilds_indexes(database):
+    live_indexes = index_names(database)
+    bulk_sync = BulkSyncMode(database)
+    bulk_sync.enter()
+    assert bulk_sync.active
+    bulk_indexes = index_names(database)
+    assert "block_slot" not in bulk_indexes
+    assert "transactionoutput_spent_in_block_id" not in bulk_indexes
+    # unique indexes and those needed while syncing are kept
+    assert "block_hash" in bulk_indexes
+    assert "transactionoutput_transaction_hash_output_index" in bulk_indexes
+    assert "transactionoutputvalue_transaction_output_id" in bulk_indexes
+    assert database.pragma("foreign_keys") == 0
+    assert database.pragma("synchronous") == 0
+
+    bulk_sync.exit()
+    assert not bulk_sync.active
+    assert index_names(database) == live_indexes
+    assert database.pragma("foreign_keys") == 1
+    assert database.pragma("synchronous") == 2
+
+
+def test_bulk_mode_detects_foreign_key_violations(database):
+    bulk_sync = BulkSyncMode(database)
+    bulk_sync.enter()
+    Transaction.create(transaction_hash="00" * 32, block=42, block_index=0)
+    with pytest.raises(BulkSyncError):
+        bulk_sync.exit()
+
+
+def test_bulk_mode_hysteresis(database):
+    bulk_sync = BulkSyncMode(database, enter_distance=1000, exit_distance=500)
+    assert not bulk_sync.should_switch(slot=0, tip_slot=1000)
+    assert bulk_sync.should_switch(slot=0, tip_slot=1001)
+    bulk_sync.enter()
+    # between the distances, the mode is kept in both directions
+    assert not bulk_sync.should_switch(slot=0, tip_slot=501)
+    assert bulk_sync.should_switch(slot=0, tip_slot=500)
+    bulk_sync.exit()
+    assert not bulk_sync.should_switch(slot=0, tip_slot=501)
+
+
+def test_bulk_mode_is_not_entered_again_after_a_rollback(database):
+    bulk_sync = BulkSyncMode(database, enter_distance=1000)
+    bulk_sync.enter()
+    bulk_sync.exit(live_until_slot=200)
+    assert not bulk_sync.active
+    assert not bulk_sync.should_switch(slot=100, tip_slot=5000)
+    assert not bulk_sync.should_switch(slot=200, tip_slot=5000)
+    assert bulk_sync.should_switch(slot=201, tip_slot=5000)
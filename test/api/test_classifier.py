@@ -0,0 +1,53 @@
+import pycardano
+
+from muesliswap_onchain_governance.api.tx_processor.classifier import (
+    OutputClassifier,
+)
+
+POLICY_ID = pycardano.ScriptHash(bytes.fromhex("11" * 28))
+MINT_POLICY_ID = pycardano.ScriptHash(bytes.fromhex("22" * 28))
+WATCHED_ADDRESS = pycardano.Address(
+    pycardano.ScriptHash(bytes.fromhex("33" * 28)), network=pycardano.Network.TESTNET
+)
+OTHER_ADDRESS = pycardano.Address(
+    pycardano.VerificationKeyHash(bytes.fromhex("44" * 28)),
+    network=pycardano.Network.TESTNET,
+)
+
+
+def multi_asset(policy_id: pycardano.ScriptHash) -> pycardano.MultiAsset:
+    return pycardano.MultiAsset(
+        {policy_id: pycardano.Asset({pycardano.AssetName(b""): 1})}
+    )
+
+
+def transaction(outputs: list, mint: pycardano.MultiAsset = None):
+    return pycardano.Transaction(
+        pycardano.TransactionBody(inputs=[], outputs=outputs, fee=0, mint=mint),
+        pycardano.TransactionWitnessSet(),
+    )
+
+
+def test_classify_tags_outputs_and_mints():
+    classifier = OutputClassifier()
+    watched_addresses = set()
+    classifier.register("by_address", addresses=lambda: watched_addresses)(None)
+    classifier.register("by_policy", policies=[POLICY_ID.payload])(None)
+    classifier.register("by_mint", mint_policies=[MINT_POLICY_ID.payload])(None)
+    tx = transaction(
+        [
+            pycardano.TransactionOutput(OTHER_ADDRESS, 2_000_000),
+            pycardano.TransactionOutput(
+                WATCHED_ADDRESS, pycardano.Value(2_000_000, multi_asset(POLICY_ID))
+            ),
+        ]
+    )
+    assert classifier.classify(tx) == {"by_policy": [1]}
+
+    watched_addresses.add(WATCHED_ADDRESS.to_primitive())
+    tx.transaction_body.mint = multi_asset(MINT_POLICY_ID)
+    assert classifier.classify(tx) == {
+        "by_address": [1],
+        "by_policy": [1],
+        "by_mint": [],
+    }
@@ -0,0 +1,63 @@
+import pycardano
+import pytest
+from opshin.prelude import (
+    Address,
+    FinitePOSIXTime,
+    NoStakingCredential,
+    PubKeyCredential,
+    Token,
+)
+from opshin.std.fractions import Fraction
+
+from muesliswap_onchain_governance.api.db_models import TallyParams
+from muesliswap_onchain_governance.api.tx_processor.datum_cache import DatumCache
+from muesliswap_onchain_governance.onchain.tally import tally as onchain_tally
+
+PARAMS = onchain_tally.ProposalParams(
+    100,
+    Fraction(1, 2),
+    [b"a", b"b"],
+    FinitePOSIXTime(1_700_000_000_000),
+    1,
+    Token(b"\x01" * 28, b""),
+    b"\x0b" * 28,
+    Address(PubKeyCredential(b"\x02" * 28), NoStakingCredential()),
+    Token(b"\x03" * 28, b"gov"),
+    b"\x0a" * 28,
+)
+
+
+def inline_datum(datum: pycardano.PlutusData) -> pycardano.RawPlutusData:
+    return pycardano.RawPlutusData.from_cbor(datum.to_cbor())
+
+
+def test_decode_shares_unchanged_structures():
+    cache = DatumCache(maxsize=10)
+    first = inline_datum(onchain_tally.TallyState([0, 0], PARAMS))
+    second = inline_datum(onchain_tally.TallyState([0, 150], PARAMS))
+
+    decoded = cache.decode(onchain_tally.TallyState, "first", first)
+    assert decoded == onchain_tally.TallyState.from_primitive(first.data)
+    assert cache.decode(onchain_tally.TallyState, "first", first) is decoded
+    continuation = cache.decode(onchain_tally.TallyState, "second", second)
+    assert continuation.votes == [0, 150]
+    assert continuation.params is decoded.params
+
+    created = []
+
+    def get_or_create():
+        created.append(TallyParams(id=len(created) + 1))
+        return created[-1]
+
+    row = cache.resolve(TallyParams, decoded.params, get_or_create)
+    assert cache.resolve(TallyParams, continuation.params, get_or_create) is row
+    cache.clear_rows()
+    assert cache.resolve(TallyParams, continuation.params, get_or_create) is not row
+    assert len(created) == 2
+
+
+def test_decode_rejects_other_datums():
+    cache = DatumCache(maxsize=10)
+    datum = inline_datum(onchain_tally.TallyState([0], PARAMS))
+    with pytest.raises(pycardano.DeserializeException):
+        cache.decode(onchain_tally.BoxedInt, "hash", datum)
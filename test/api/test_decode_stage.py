@@ -0,0 +1,75 @@
+import pycardano
+import pytest
+
+from muesliswap_onchain_governance.api import ogmios
+from muesliswap_onchain_governance.api.decode_stage import DecodeStage
+from muesliswap_onchain_governance.api.tx_filter import RelevanceFilter
+
+POLICY_ID = "11" * 28
+ADDRESS = pycardano.Address(
+    pycardano.VerificationKeyHash(bytes.fromhex("44" * 28)),
+    network=pycardano.Network.TESTNET,
+)
+
+
+def ogmios_tx(n: int, relevant: bool) -> dict:
+    multi_asset = (
+        pycardano.MultiAsset.from_primitive({bytes.fromhex(POLICY_ID): {b"": 1}})
+        if relevant
+        else pycardano.MultiAsset()
+    )
+    tx = pycardano.Transaction(
+        pycardano.TransactionBody(
+            inputs=[pycardano.TransactionInput.from_primitive(["66" * 32, n])],
+            outputs=[
+                pycardano.TransactionOutput(
+                    ADDRESS, pycardano.Value(2_000_000 + n, multi_asset)
+                )
+            ],
+            fee=n,
+        ),
+        pycardano.TransactionWitnessSet(),
+    )
+    return {
+        "id": tx.id.payload.hex(),
+        "inputs": [{"transaction": {"id": "66" * 32}, "index": n}],
+        "outputs": [
+            {
+                "address": ADDRESS.encode(),
+                "value": {
+                    "ada": {"lovelace": 2_000_000 + n},
+                    **({POLICY_ID: {"": 1}} if relevant else {}),
+                },
+            }
+        ],
+        "cbor": tx.to_cbor_hex(),
+    }
+
+
+def rollforward(slot: int, txs: list) -> ogmios.Rollforward:
+    return ogmios.Rollforward(
+        tip=ogmios.Tip(slot=slot, id="00" * 32, height=slot),
+        block={"type": "praos", "slot": slot, "transactions": txs},
+    )
+
+
+@pytest.mark.parametrize("max_workers", [0, 1, 2])
+def test_decode_stage_keeps_order(max_workers):
+    operations = [
+        rollforward(1, [ogmios_tx(1, True), ogmios_tx(2, False)]),
+        rollforward(2, []),
+        ogmios.Rollback(tip=ogmios.Point(slot=1, id="00" * 32)),
+        rollforward(3, [ogmios_tx(3, False), ogmios_tx(4, True)]),
+    ]
+    tx_filter = RelevanceFilter({POLICY_ID}, set())
+    stage = DecodeStage(tx_filter, max_workers=max_workers, lookahead=2)
+    results = list(stage.iterate(operations))
+    assert [operation for operation, _ in results] == operations
+    assert results[2][1] is None
+    for operation, decoded_block in results:
+        if decoded_block is None:
+            continue
+        for i, tx in enumerate(ogmios.transactions_from_block(operation.block)):
+            decoded_tx = decoded_block.get(i, tx)
+            assert decoded_tx.hash == tx["id"]
+            assert decoded_tx.transaction.to_cbor_hex() == tx["cbor"]
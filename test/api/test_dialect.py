@@ -0,0 +1,82 @@
+import pytest
+from peewee import OperationalError, PostgresqlDatabase, SqliteDatabase
+from playhouse.pool import PooledPostgresqlDatabase
+
+from muesliswap_onchain_governance.api.db_models import dialect, open_database
+
+
+class StatementRecorder(PostgresqlDatabase):
+    """
+    Records the statements instead of connecting to a server
+    """
+
+    def __init__(self):
+        super().__init__("governance")
+        self.statements = []
+
+    def execute_sql(self, sql: str, params=None):
+        self.statements.append((sql, params))
+
+
+def test_open_database():
+    sqlite = open_database("sqlite:///governance.db")
+    assert isinstance(sqlite, SqliteDatabase)
+    assert sqlite.database == "governance.db"
+    assert dict(sqlite._pragmas)["foreign_keys"] == 1
+
+    postgres = open_database("postgresql://user:secret@db:5433/gov?max_connections=4")
+    assert isinstance(postgres, PooledPostgresqlDatabase)
+    assert postgres.database == "gov"
+    assert postgres.connect_params["host"] == "db"
+    assert postgres.connect_params["port"] == 5433
+    assert postgres._max_connections == 4
+
+    read_only = open_database("postgresql://db/gov", read_only=True)
+    assert "default_transaction_read_only=on" in read_only.connect_params["options"]
+
+
+def test_open_read_only_sqlite(tmp_path):
+    path = tmp_path / "governance.db"
+    writer = open_database(f"sqlite:///{path}")
+    writer.execute_sql("create table t (a integer)")
+    writer.execute_sql("insert into t values (1)")
+    reader = open_database(f"sqlite:///{path}", read_only=True)
+    assert reader.execute_sql("select a from t").fetchall() == [(1,)]
+    assert reader.pragma("query_only") == 1
+    with pytest.raises(OperationalError):
+        reader.execute_sql("insert into t values (2)")
+    reader.close()
+    writer.close()
+
+
+def test_sqlite_expressions(tmp_path, monkeypatch):
+    database = SqliteDatabase(tmp_path / "dialect.db")
+    monkeypatch.setattr(dialect, "database", database)
+    cursor = dialect.execute_sql(
+        f"""
+        with t(a, b) as (values (1, x'0aff'), (2, x'10'))
+        select {dialect.group_concat('a')}, {dialect.group_concat(dialect.hex_encode('b'))}
+        from t where a < ?
+        """,
+        (3,),
+    )
+    assert cursor.fetchone() == ("1;2", "0aff;10")
+    database.close()
+
+
+def test_postgres_expressions(monkeypatch):
+    database = StatementRecorder()
+    monkeypatch.setattr(dialect, "database", database)
+    assert not dialect.is_sqlite()
+    dialect.execute_sql(
+        f"select {dialect.group_concat(dialect.hex_encode('d.data'))} "
+        "from datum d where d.hash like '%' || ?",
+        ("00",),
+    )
+    assert database.statements == [
+        (
+            "select string_agg(cast(encode(d.data, 'hex') as text), ';') "
+            "from datum d where d.hash like '%%' || %s",
+            ("00",),
+        )
+    ]
@@ -0,0 +1,81 @@
+from peewee import SqliteDatabase
+
+from muesliswap_onchain_governance.api.db_models import (
+    ALL_MODELS,
+    LIVE_STATE_MODELS,
+    Address,
+    Block,
+    LicenseOutput,
+    Token,
+    Transaction,
+    TransactionOutput,
+)
+from muesliswap_onchain_governance.api.db_models.migrations import (
+    MIGRATIONS,
+    create_schema,
+)
+from muesliswap_onchain_governance.api.tx_processor.to_db import (
+    restore_live_states,
+    set_states_live,
+)
+
+
+def license_output(block: Block, i: int) -> LicenseOutput:
+    output = TransactionOutput.create(
+        transaction=Transaction.create(
+            transaction_hash=i.to_bytes(32, "big"), block=block, block_index=i
+        ),
+        transaction_hash=i.to_bytes(32, "big"),
+        output_index=0,
+        address=Address.get_or_create(address_raw=b"\x00")[0],
+    )
+    return LicenseOutput.create(
+        transaction_output=output,
+        license_nft=Token.get_or_create(policy_id=b"\x01", asset_name=b"")[0],
+    )
+
+
+def test_live_flag_follows_spends_and_rollbacks(tmp_path):
+    database = SqliteDatabase(tmp_path / "live.db", pragmas={"foreign_keys": 1})
+    with database.bind_ctx(ALL_MODELS):
+        create_schema(database, ALL_MODELS)
+        first = Block.create(hash=f"{10:064x}", slot=10, height=10)
+        second = Block.create(hash=f"{20:064x}", slot=20, height=20)
+        state = license_output(first, 0)
+        assert LicenseOutput.get_by_id(state.id).live
+
+        TransactionOutput.update(spent_in_block=second).execute()
+        set_states_live([state.transaction_output_id], False)
+        assert not LicenseOutput.get_by_id(state.id).live
+        # the database restores the outputs spent in deleted blocks
+        second.delete_instance()
+        restore_live_states()
+        assert LicenseOutput.get_by_id(state.id).live
+    database.close()
+
+
+def test_migration_adds_live_flag(tmp_path):
+    database = SqliteDatabase(tmp_path / "old.db", pragmas={"foreign_keys": 1})
+    with database.bind_ctx(ALL_MODELS):
+        database.create_tables(ALL_MODELS)
+        first = Block.create(hash=f"{10:064x}", slot=10, height=10)
+        spent, unspent = license_output(first, 0), license_output(first, 1)
+        TransactionOutput.update(spent_in_block=first).where(
+            TransactionOutput.id == spent.transaction_output_id
+        ).execute()
+        # the schema before the live flag
+        for model in LIVE_STATE_MODELS:
+            table = model._meta.table_name
+            database.execute_sql(f'DROP INDEX "{table}_live"')
+            database.execute_sql(f'ALTER TABLE "{table}" DROP COLUMN "live"')
+
+        create_schema(database, ALL_MODELS)
+        assert database.pragma("user_version") == len(MIGRATIONS)
+        assert [s.live for s in LicenseOutput.select().order_by(LicenseOutput.id)] == [
+            False,
+            True,
+        ]
+        assert "licenseoutput_live" in [
+            i.name for i in database.get_indexes("licenseoutput")
+        ]
+    database.close()
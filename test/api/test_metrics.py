@@ -0,0 +1,38 @@
+from muesliswap_onchain_governance.api.metrics import Metrics, StageTimer
+
+
+def test_stage_timer_quantiles_use_recent_samples():
+    timer = StageTimer(reservoir_size=100)
+    for i in range(1000):
+        timer.observe(i)
+    assert timer.count == 1000
+    assert timer.quantile(0.5) == 950
+    assert timer.quantile(0.99) == 999
+
+
+def test_render_prometheus_text():
+    metrics = Metrics()
+    metrics.observe("commit", 0.5)
+    metrics.inc("blocks", 3)
+    metrics.set("sync_lag_slots", 20)
+    lines = metrics.render().splitlines()
+    assert (
+        'muesliswap_querier_stage_seconds{stage="commit",quantile="0.5"} 0.5' in lines
+    )
+    assert 'muesliswap_querier_stage_seconds_count{stage="commit"} 1' in lines
+    assert "muesliswap_querier_blocks_total 3" in lines
+    assert "muesliswap_querier_rollbacks_total 0" in lines
+    assert "muesliswap_querier_sync_lag_slots 20" in lines
+    assert "# TYPE muesliswap_querier_pipeline_depth gauge" not in lines
+
+
+def test_render_labelled_counters():
+    metrics = Metrics()
+    assert "interning_cache_lookups_total{" not in metrics.render()
+    metrics.inc("interning_cache_lookups", cache="token", result="miss")
+    metrics.inc("interning_cache_lookups", 2, cache="token", result="hit")
+    lines = metrics.render().splitlines()
+    assert (
+        'muesliswap_querier_interning_cache_lookups_total{cache="token",result="hit"} 2'
+        in lines
+    )
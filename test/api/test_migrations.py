@@ -0,0 +1,47 @@
+from peewee import SqliteDatabase
+
+from muesliswap_onchain_governance.api.db_models import (
+    ALL_MODELS,
+    Datum,
+    Token,
+    TransactionOutput,
+)
+from muesliswap_onchain_governance.api.db_models.migrations import (
+    MIGRATIONS,
+    create_schema,
+)
+
+
+def test_migration_stores_hashes_as_bytes(tmp_path):
+    database = SqliteDatabase(tmp_path / "old.db", pragmas={"foreign_keys": 1})
+    with database.bind_ctx(ALL_MODELS):
+        database.create_tables(ALL_MODELS)
+        # the rows of a database before hashes were stored as bytes, i.e. as hex text
+        for sql in (
+            "INSERT INTO block VALUES (1, '{:064x}', 10, 10)".format(10),
+            "INSERT INTO \"transaction\" VALUES (1, '{:064x}', 1, 0)".format(1),
+            "INSERT INTO address VALUES (1, '00aa')",
+            "INSERT INTO datum VALUES (1, '{}', x'00')".format("dd" * 32),
+            "INSERT INTO transactionoutput "
+            "(id, transaction_id, transaction_hash, output_index, address_id, datum_hash_id) "
+            "VALUES (1, 1, '{:064x}', 0, 1, '{}')".format(1, "dd" * 32),
+            "INSERT INTO token VALUES (1, '', ''), (2, '{}', '6d696c6b')".format(
+                "0b" * 28
+            ),
+        ):
+            database.execute_sql(sql)
+        database.pragma("user_version", 1)
+
+        create_schema(database, ALL_MODELS)
+        assert database.pragma("user_version") == len(MIGRATIONS)
+        output = TransactionOutput.get_by_id(1)
+        assert output.transaction_hash == (1).to_bytes(32, "big")
+        assert output.transaction.transaction_hash == output.transaction_hash
+        assert output.address.address_raw == b"\x00\xaa"
+        assert output.datum_hash == Datum.get(Datum.hash == b"\xdd" * 32)
+        assert [(t.policy_id, t.asset_name) for t in Token.select()] == [
+            (b"", b""),
+            (b"\x0b" * 28, b"milk"),
+        ]
+        assert not database.execute_sql("PRAGMA foreign_key_check").fetchall()
+    database.close()
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import threading
+from collections import deque
+
+import pytest
+import websockets
+from hypothesis import given, strategies as st
+
+from muesliswap_onchain_governance.api import ogmios
+
+
+@given(
+    latency=st.floats(min_value=1e-6, max_value=10),
+    processing_time=st.floats(min_value=1e-6, max_value=10),
+)
+def test_pipeline_window_bounds(latency: float, processing_time: float):
+    window = ogmios.PipelineWindow(min_depth=5, max_depth=50, initial_depth=10)
+    window.record_latency(latency)
+    window.record_processing(processing_time)
+    assert 5 <= window.depth <= 50
+
+
+def test_pipeline_window_adapts():
+    window = ogmios.PipelineWindow(
+        min_depth=1, max_depth=1000, initial_depth=100, headroom=1
+    )
+    window.record_processing(0.001)
+    window.record_latency(0.1)
+    assert window.depth == 100
+    # the consumer got slower, less blocks need to be in flight
+    window.smoothing = 1
+    window.record_processing(0.01)
+    assert window.depth == 10
+
+    # a node answering after a round trip of 50ms and sending at most one block per 5ms,
+    # requests sent behind others wait for their responses, but only the round trip counts
+    round_trip, service_time = 0.05, 0.005
+    window = ogmios.PipelineWindow(
+        min_depth=1, max_depth=1000, initial_depth=100, probe_interval=100
+    )
+    window.record_processing(0.01)
+    now = last_response = 0.0
+    in_flight = deque()
+    for _ in range(5000):
+        for _ in range(window.requests_to_send(len(in_flight))):
+            in_flight.append((now, not in_flight))
+        sent, alone = in_flight.popleft()
+        last_response = max(sent + round_trip, last_response + service_time)
+        now = last_response
+        window.record_response(sent, last_response, alone)
+    assert window.latency == pytest.approx(round_trip)
+    # 2 (headroom) * 50ms / 10ms, up to rounding
+    assert 10 <= window.depth <= 11
+
+
+def fake_block(height: int) -> dict:
+    return {
+        "type": "praos",
+        "id": f"{height:064x}",
+        "slot": height * 20,
+        "height": height,
+        "transactions": [],
+    }
+
+
+async def serve_blocks(websocket, n_blocks: int):
+    request = json.loads(await websocket.recv())
+    assert request["method"] == "findIntersection"
+    await websocket.send(json.dumps({"jsonrpc": "2.0", "result": {}}))
+    served = 0
+    async for message in websocket:
+        assert json.loads(message)["method"] == "nextBlock"
+        if served == 0:
+            result = {"direction": "backward", "point": "origin"}
+        elif served <= n_blocks:
+            result = {
+                "direction": "forward",
+                "tip": {"slot": n_blocks * 20, "id": "00", "height": n_blocks},
+                "block": fake_block(served),
+            }
+        else:
+            # the tip is reached, no further answers
+            continue
+        served += 1
+        await websocket.send(json.dumps({"jsonrpc": "2.0", "result": result}))
+
+
+def test_iterate_blocks_in_order():
+    n_blocks = 50
+    started = threading.Event()
+    server_loop = asyncio.new_event_loop()
+
+    async def run_server():
+        async with websockets.serve(
+            lambda ws: serve_blocks(ws, n_blocks), "localhost", 0
+        ) as server:
+            run_server.port = server.sockets[0].getsockname()[1]
+            started.set()
+            await asyncio.Future()
+
+    thread = threading.Thread(
+        target=server_loop.run_until_complete, args=(run_server(),), daemon=True
+    )
+    thread.start()
+    started.wait()
+
+    iterator = ogmios.OgmiosIterator(
+        f"ws://localhost:{run_server.port}",
+        window=ogmios.PipelineWindow(min_depth=2, max_depth=8, initial_depth=4),
+        queue_size=3,
+    )
+    operations = iterator.iterate_blocks([])
+    assert isinstance(next(operations), ogmios.Rollback)
+    heights = [next(operations).block["height"] for _ in range(n_blocks)]
+    operations.close()
+    assert heights == list(range(1, n_blocks + 1))
@@ -0,0 +1,111 @@
+"""
+Runs the migrations and the query_* functions of db_queries against a real PostgreSQL database.
+Skipped unless DATABASE_URL points to a PostgreSQL database, all tables in it are dropped.
+"""
+import inspect
+import os
+
+import pytest
+from peewee import ForeignKeyField
+
+from muesliswap_onchain_governance.api.db_models import (
+    ALL_MODELS,
+    LIVE_STATE_MODELS,
+    Address,
+    Datum,
+    Token,
+    TransactionOutput,
+    dialect,
+    open_database,
+)
+from muesliswap_onchain_governance.api.db_models.migrations import (
+    MIGRATIONS,
+    _is_bytes_column,
+    _schema_version,
+    _set_schema_version,
+    create_schema,
+)
+from muesliswap_onchain_governance.api.db_queries import simple_pool
+
+from .test_query_plans import ARGUMENTS, fill_database, query_functions
+
+DATABASE_URL = os.getenv("DATABASE_URL", "")
+
+pytestmark = pytest.mark.skipif(
+    not DATABASE_URL.startswith("postgres"),
+    reason="DATABASE_URL is not a PostgreSQL database",
+)
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = open_database(DATABASE_URL)
+    monkeypatch.setattr(dialect, "database", database)
+    monkeypatch.setattr(simple_pool, "pool_reserves", simple_pool.PoolReserves())
+    with database.bind_ctx(ALL_MODELS):
+        database.drop_tables(ALL_MODELS, cascade=True)
+        database.execute_sql('DROP TABLE IF EXISTS "schemaversion"')
+        create_schema(database, ALL_MODELS)
+        yield database
+        database.drop_tables(ALL_MODELS, cascade=True)
+        database.execute_sql('DROP TABLE IF EXISTS "schemaversion"')
+    database.close_all()
+
+
+def downgrade(database):
+    """
+    Turn the current schema into the first one: hex text instead of bytes and no live flags
+    """
+    columns = [
+        (model._meta.table_name, field)
+        for model in ALL_MODELS
+        for field in model._meta.sorted_fields
+        if _is_bytes_column(field)
+    ]
+    foreign_keys = [(t, f) for t, f in columns if isinstance(f, ForeignKeyField)]
+    for table, field in foreign_keys:
+        database.execute_sql(
+            f'ALTER TABLE "{table}" DROP CONSTRAINT "{table}_{field.column_name}_fkey"'
+        )
+    for table, field in columns:
+        database.execute_sql(
+            f'ALTER TABLE "{table}" ALTER COLUMN "{field.column_name}" '
+            f"TYPE TEXT USING encode(\"{field.column_name}\", 'hex')"
+        )
+    for table, field in foreign_keys:
+        database.execute_sql(
+            f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_{field.column_name}_fkey" '
+            f'FOREIGN KEY ("{field.column_name}") '
+            f'REFERENCES "{field.rel_model._meta.table_name}" ("{field.rel_field.column_name}")'
+        )
+    for model in LIVE_STATE_MODELS:
+        table = model._meta.table_name
+        database.execute_sql(f'DROP INDEX "{table}_live"')
+        database.execute_sql(f'ALTER TABLE "{table}" DROP COLUMN "live"')
+    _set_schema_version(database, 0)
+
+
+def test_migrations(database):
+    fill_database()
+    Datum.create(hash=b"\xdd" * 32, data=b"\x00")
+    TransactionOutput.update(datum_hash=b"\xdd" * 32).execute()
+    before = {model: sorted(model.select().tuples()) for model in ALL_MODELS}
+    downgrade(database)
+
+    create_schema(database, ALL_MODELS)
+    assert _schema_version(database) == len(MIGRATIONS)
+    assert Address.get_by_id(1).address_raw == bytes.fromhex(ARGUMENTS["wallet"])
+    assert Token.get(Token.asset_name == b"gov").policy_id == b"\x07" * 28
+    live_types = database.execute_sql(
+        "SELECT DISTINCT data_type FROM information_schema.columns WHERE column_name = 'live'"
+    ).fetchall()
+    assert live_types == [("boolean",)]
+    for model, rows in before.items():
+        assert sorted(model.select().tuples()) == rows, model.__name__
+
+
+@pytest.mark.parametrize("name,function", list(query_functions()))
+def test_query(database, name, function):
+    fill_database()
+    parameters = inspect.signature(function).parameters
+    function(**{p: ARGUMENTS[p] for p in parameters if p in ARGUMENTS})
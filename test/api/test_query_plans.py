@@ -0,0 +1,297 @@
+"""
+Runs every query_* function of db_queries against a small synthetic database
+and checks the EXPLAIN QUERY PLAN of each statement for full scans of large tables.
+The database is not analyzed, like the production database, so the plans do not
+depend on the amount of synthetic data.
+"""
+import datetime
+import inspect
+import re
+
+import pytest
+from peewee import SqliteDatabase
+
+from muesliswap_onchain_governance.api.db_models import (
+    ALL_MODELS,
+    Address,
+    Block,
+    GovParams,
+    GovState,
+    PoolState,
+    StakingDeposit,
+    StakingDepositDelta,
+    StakingDepositParticipationAdded,
+    StakingParams,
+    StakingParticipation,
+    StakingParticipationInStaking,
+    StakingState,
+    TallyCreation,
+    TallyCreationParticipants,
+    TallyParams,
+    TallyState,
+    TallyVote,
+    TallyWeights,
+    Token,
+    Transaction,
+    TransactionOutput,
+    TransactionOutputValue,
+    TreasuryDelta,
+    TreasuryDeltaValue,
+    ValueStoreState,
+)
+from muesliswap_onchain_governance.api.db_models import dialect
+from muesliswap_onchain_governance.api.db_models.migrations import create_schema
+from muesliswap_onchain_governance.api.db_queries import (
+    gov_state,
+    simple_pool,
+    staking,
+    tally,
+    treasury,
+)
+
+QUERY_MODULES = (gov_state, simple_pool, staking, tally, treasury)
+
+# tables that grow with the history of the chain
+LARGE_TABLES = {
+    "block",
+    "transaction",
+    "transactionoutput",
+    "transactionoutputvalue",
+    "datum",
+    "govstate",
+    "tallystate",
+    "tallyweights",
+    "tallyvote",
+    "stakingstate",
+    "stakingparticipation",
+    "stakingparticipationinstaking",
+    "stakingdeposit",
+    "stakingdepositdelta",
+    "stakingdepositparticipationadded",
+    "stakingdepositparticipationremoved",
+    "valuestorestate",
+    "poolstate",
+}
+
+# full scans that are inherent to a query, i.e. histories that list all rows of a table
+ALLOWED_SCANS = {
+    "query_treasury_history": {"treasurydelta", "treasurydeltavalue", "treasurypayout"},
+    "query_historical_treasury_funds": {"treasurydelta", "valuestorestate"},
+}
+
+WALLET = "00" + "aa" * 28
+AUTH_NFT = ("08" * 28, "01")
+POOL_NFT = ("0f" * 28, "02")
+
+ARGUMENTS = {
+    "wallet": WALLET,
+    "user_address": WALLET,
+    "auth_nft": ".".join(AUTH_NFT),
+    "proposal_id": 1,
+    "transaction_hash": f"{3:064x}",
+    "transaction_index": 0,
+    "pool_nft": ".".join(POOL_NFT),
+    "swap_token": ".",
+    "amount": 1000,
+}
+
+
+def output(block: Block, i: int, spent_in: Block = None) -> TransactionOutput:
+    transaction = Transaction.create(
+        transaction_hash=i.to_bytes(32, "big"), block=block, block_index=i
+    )
+    txo = TransactionOutput.create(
+        transaction=transaction,
+        transaction_hash=i.to_bytes(32, "big"),
+        output_index=0,
+        address=Address.get_or_create(address_raw=bytes.fromhex(WALLET))[0],
+        spent_in_block=spent_in,
+    )
+    TransactionOutputValue.create(
+        transaction_output=txo,
+        token=Token.get_or_create(policy_id=b"", asset_name=b"")[0],
+        amount=2_000_000,
+    )
+    return txo
+
+
+def fill_database():
+    first = Block.create(hash=f"{10:064x}", slot=10, height=10)
+    second = Block.create(hash=f"{20:064x}", slot=20, height=20)
+    owner = Address.create(address_raw=bytes.fromhex(WALLET))
+    gov_token = Token.create(policy_id=b"\x07" * 28, asset_name=b"gov")
+    auth_nft = Token.create(
+        policy_id=bytes.fromhex(AUTH_NFT[0]), asset_name=bytes.fromhex(AUTH_NFT[1])
+    )
+    pool_nft = Token.create(
+        policy_id=bytes.fromhex(POOL_NFT[0]), asset_name=bytes.fromhex(POOL_NFT[1])
+    )
+    lovelace = Token.get_or_create(policy_id=b"", asset_name=b"")[0]
+
+    gov_params = GovParams.create(
+        tally_address=owner,
+        staking_address=owner,
+        governance_token=gov_token,
+        vault_ft_policy=b"",
+        min_quorum=100,
+        min_proposal_duration=1000,
+        gov_state_nft=gov_token,
+        tally_auth_nft_policy=bytes.fromhex(AUTH_NFT[0]),
+        staking_vote_nft_policy=b"",
+        latest_applied_proposal_id=0,
+    )
+    gov = GovState.create(
+        transaction_output=output(first, 1),
+        last_proposal_id=1,
+        gov_params=gov_params,
+    )
+
+    tally_params = TallyParams.create(
+        quorum=100,
+        end_time=datetime.datetime(2030, 1, 1),
+        proposal_id=1,
+        tally_auth_nft=auth_nft,
+        staking_vote_nft_policy=b"",
+        staking_address=owner,
+        governance_token=gov_token,
+        vault_ft_policy=b"",
+    )
+    created = TallyState.create(
+        transaction_output=output(first, 2, spent_in=second),
+        tally_params=tally_params,
+        live=False,
+    )
+    voted = TallyState.create(
+        transaction_output=output(second, 3), tally_params=tally_params
+    )
+    for tally_state, weight in ((created, 0), (voted, 150)):
+        TallyWeights.create(tally_state=tally_state, index=0, weight=weight)
+    creation = TallyCreation.create(
+        transaction=created.transaction_output.transaction,
+        gov_state=gov,
+        next_tally_state=created,
+    )
+    TallyCreationParticipants.create(tally_creation=creation, address=owner)
+
+    staking_state = StakingState.create(
+        transaction_output=output(first, 4),
+        staking_params=StakingParams.create(
+            owner=owner,
+            governance_token=gov_token,
+            vault_ft_policy=b"",
+            tally_auth_nft=auth_nft,
+        ),
+    )
+    participation = StakingParticipation.create(
+        tally_auth_nft=auth_nft,
+        proposal_id=1,
+        weight=150,
+        proposal_index=0,
+        end_time=datetime.datetime(2030, 1, 1),
+    )
+    StakingParticipationInStaking.create(
+        staking_state=staking_state, participation=participation, index=0
+    )
+    deposit = StakingDeposit.create(
+        transaction=staking_state.transaction_output.transaction,
+        next_staking_state=staking_state,
+    )
+    StakingDepositDelta.create(staking_deposit=deposit, token=gov_token, amount=150)
+    StakingDepositParticipationAdded.create(
+        staking_deposit=deposit, participation=participation
+    )
+    TallyVote.create(
+        transaction=voted.transaction_output.transaction,
+        staking_state=staking_state,
+        index=0,
+        weight_delta=150,
+        prev_tally_state=created,
+        next_tally_state=voted,
+    )
+
+    value_store = ValueStoreState.create(
+        transaction_output=output(first, 5), treasurer_nft=gov_token
+    )
+    delta = TreasuryDelta.create(transaction=value_store.transaction_output.transaction)
+    TreasuryDeltaValue.create(treasury_delta=delta, token=lovelace, amount=2_000_000)
+
+    PoolState.create(
+        transaction_output=output(first, 6),
+        pool_nft=pool_nft,
+        token_a=lovelace,
+        token_b=gov_token,
+        lp_token=pool_nft,
+        fee_numerator=3,
+        fee_denominator=1000,
+        last_applied_proposal_id=0,
+        reserve_a=2_000_000,
+        reserve_b=500,
+        lp_supply=1000,
+    )
+
+
+class PlanRecorder(SqliteDatabase):
+    """
+    Stands in for the database of the raw queries, records the plan of every statement
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.plans = []
+
+    def execute_sql(self, sql: str, params=None):
+        plan = super().execute_sql("EXPLAIN QUERY PLAN " + sql, params)
+        self.plans.append((sql, [row[3] for row in plan.fetchall()]))
+        return super().execute_sql(sql, params)
+
+
+def scanned_tables(sql: str, plan: [str], tables: [str]):
+    """
+    The tables scanned by a plan, scans through partial indexes only read the covered rows
+    """
+    aliases = {
+        alias or table: table
+        for table, alias in re.findall(
+            r'(?:from|join|,)\s+"?(\w+)"?(?:\s+(?!on\b|join\b|where\b)(\w+))?',
+            sql,
+            flags=re.IGNORECASE,
+        )
+        if table in tables
+    }
+    for detail in plan:
+        match = re.match(r"SCAN (\w+)(?: USING (?:COVERING )?INDEX (\w+))?", detail)
+        if match is None:
+            continue
+        name, index = match.groups()
+        if index is not None and index.endswith("_live"):
+            continue
+        yield aliases.get(name, name)
+
+
+def query_functions():
+    for module in QUERY_MODULES:
+        for name, function in inspect.getmembers(module, inspect.isfunction):
+            if name.startswith("query_") and function.__module__ == module.__name__:
+                yield name, function
+
+
+@pytest.mark.parametrize("name,function", list(query_functions()))
+def test_query_plan_has_no_full_scans(tmp_path, monkeypatch, name, function):
+    database = SqliteDatabase(tmp_path / "plans.db", pragmas={"foreign_keys": 1})
+    recorder = PlanRecorder(tmp_path / "plans.db")
+    monkeypatch.setattr(dialect, "database", recorder)
+    monkeypatch.setattr(simple_pool, "pool_reserves", simple_pool.PoolReserves())
+    with database.bind_ctx(ALL_MODELS):
+        create_schema(database, ALL_MODELS)
+        fill_database()
+        parameters = inspect.signature(function).parameters
+        function(**{p: ARGUMENTS[p] for p in parameters if p in ARGUMENTS})
+        tables = database.get_tables()
+    database.close()
+    recorder.close()
+
+    assert recorder.plans, f"{name} did not query the database"
+    for sql, plan in recorder.plans:
+        scans = set(scanned_tables(sql, plan, tables)) & LARGE_TABLES
+        scans -= ALLOWED_SCANS.get(name, set())
+        assert not scans, f"{name} scans {scans}:\n" + "\n".join(plan)
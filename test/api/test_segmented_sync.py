@@ -0,0 +1,137 @@
+import asyncio
+import json
+import threading
+import time
+
+import pycardano
+import pytest
+import websockets
+
+from muesliswap_onchain_governance.api import ogmios
+from muesliswap_onchain_governance.api.block_recording import ReplayIterator
+from muesliswap_onchain_governance.api.segmented_sync import (
+    SegmentError,
+    SegmentedIterator,
+    fetch_segment,
+)
+
+KEY_ADDRESS = pycardano.Address(
+    pycardano.VerificationKeyHash(bytes.fromhex("44" * 28)),
+    network=pycardano.Network.TESTNET,
+).encode()
+SCRIPT_ADDRESS = pycardano.Address(
+    pycardano.ScriptHash(bytes.fromhex("33" * 28)), network=pycardano.Network.TESTNET
+).encode()
+
+
+def fake_block(height: int) -> dict:
+    return {
+        "type": "praos",
+        "id": f"{height:064x}",
+        "slot": height * 20,
+        "height": height,
+        "transactions": [
+            {
+                "id": f"{height:064x}",
+                "inputs": [{"transaction": {"id": "66" * 32}, "index": height}],
+                "outputs": [{"address": address, "value": {}}],
+                "cbor": "00",
+            }
+            for address in (KEY_ADDRESS, SCRIPT_ADDRESS)
+        ],
+    }
+
+
+def point(height: int) -> ogmios.Point:
+    return ogmios.Point(slot=height * 20, id=f"{height:064x}")
+
+
+async def serve_chain(websocket, n_blocks: int):
+    request = json.loads(await websocket.recv())
+    assert request["method"] == "findIntersection"
+    start = request["params"]["points"][0]
+    await websocket.send(json.dumps({"jsonrpc": "2.0", "result": {}}))
+    height = start["slot"] // 20
+    results = [{"direction": "backward", "point": start}] + [
+        {
+            "direction": "forward",
+            "tip": {"slot": n_blocks * 20, "id": "00", "height": n_blocks},
+            "block": fake_block(h),
+        }
+        for h in range(height + 1, n_blocks + 1)
+    ]
+    async for message in websocket:
+        if results:
+            await websocket.send(
+                json.dumps({"jsonrpc": "2.0", "result": results.pop(0)})
+            )
+
+
+@pytest.fixture(scope="module")
+def ogmios_url():
+    started = threading.Event()
+
+    async def run_server():
+        async with websockets.serve(
+            lambda ws: serve_chain(ws, 20), "localhost", 0
+        ) as server:
+            run_server.port = server.sockets[0].getsockname()[1]
+            started.set()
+            await asyncio.Future()
+
+    threading.Thread(
+        target=asyncio.new_event_loop().run_until_complete,
+        args=(run_server(),),
+        daemon=True,
+    ).start()
+    started.wait()
+    return f"ws://localhost:{run_server.port}"
+
+
+def test_fetch_segment(ogmios_url, tmp_path):
+    path = tmp_path / "segment.rec"
+    assert fetch_segment(ogmios_url, [point(5)], point(10), path) == 5
+    operations = list(ReplayIterator(path).iterate_blocks([]))
+    assert [o.block["height"] for o in operations] == [6, 7, 8, 9, 10]
+    key_tx, script_tx = operations[0].block["transactions"]
+    # transactions that can not become relevant only keep their inputs
+    assert key_tx == {
+        "id": f"{6:064x}",
+        "inputs": [{"transaction": {"id": "66" * 32}, "index": 6}],
+        "outputs": [],
+    }
+    assert script_tx["cbor"] == "00"
+
+
+def test_fetch_segment_past_checkpoint(ogmios_url, tmp_path):
+    with pytest.raises(SegmentError):
+        fetch_segment(
+            ogmios_url, [point(5)], ogmios.Point(slot=150, id="ff" * 32), tmp_path / "s"
+        )
+
+
+def test_segments_are_spooled_ahead_of_the_replay_by_one_per_worker(
+    ogmios_url, tmp_path
+):
+    iterator = SegmentedIterator(
+        ogmios_url,
+        [point(h) for h in (4, 8, 12, 16, 20)],
+        live_iterator=ogmios.OgmiosIterator(ogmios_url),
+        max_workers=2,
+        spool_dir=tmp_path,
+    )
+    operations = iterator.iterate_blocks([point(0)])
+    assert isinstance(next(operations), ogmios.Rollback)
+    heights = []
+    for operation in operations:
+        if operation.block["height"] == 1:
+            # give the workers time to spool every segment they were given
+            time.sleep(0.5)
+        (spool_dir,) = tmp_path.iterdir()
+        assert len(list(spool_dir.iterdir())) <= 3
+        heights.append(operation.block["height"])
+        if heights[-1] == 20:
+            break
+    operations.close()
+    assert heights == list(range(1, 21))
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,159 @@
+import pycardano
+import pytest
+from opshin.prelude import Nothing
+from opshin.prelude import Token as OnchainToken
+from opshin.std.fractions import (
+    Fraction,
+    ceil_fraction,
+    floor_fraction,
+    mul_fraction,
+    sub_fraction,
+)
+from peewee import SqliteDatabase
+
+from muesliswap_onchain_governance.api.config import pool_nft_policy_id
+from muesliswap_onchain_governance.api.db_models import ALL_MODELS, Block, PoolState
+from muesliswap_onchain_governance.api.db_queries import simple_pool as pool_queries
+from muesliswap_onchain_governance.api.db_queries.simple_pool import (
+    InvalidSwapError,
+    Pool,
+    PoolReserves,
+    UnknownPoolError,
+    query_swap_quote,
+    swap_quote,
+)
+from muesliswap_onchain_governance.api.tx_processor import indexed_outputs
+from muesliswap_onchain_governance.api.tx_processor import simple_pool
+from muesliswap_onchain_governance.api.tx_processor.datum_cache import datum_cache
+from muesliswap_onchain_governance.api.tx_processor.to_db import (
+    clear_interning_caches,
+)
+from muesliswap_onchain_governance.onchain.simple_pool import classes
+
+TOKEN_B = OnchainToken(b"\x0b" * 28, b"milk")
+POOL_NFT = OnchainToken(pool_nft_policy_id.payload, b"\x01" * 32)
+
+
+def pool_state(lp_supply: int) -> classes.PoolState:
+    return classes.PoolState(
+        classes.ImmutablePoolParams(
+            OnchainToken(b"", b""),
+            TOKEN_B,
+            POOL_NFT,
+            OnchainToken(b"\x0c" * 28, POOL_NFT.token_name),
+        ),
+        classes.UpgradeablePoolParams(
+            Fraction(3, 1000),
+            OnchainToken(b"\x0d" * 28, b""),
+            b"\x0e" * 28,
+            0,
+        ),
+        lp_supply,
+        Nothing(),
+    )
+
+
+def test_pool_state_reserves_from_output(tmp_path):
+    address = pycardano.Address(pycardano.ScriptHash(b"\x0f" * 28))
+    value = pycardano.Value.from_primitive(
+        [
+            5_000_000,
+            {
+                TOKEN_B.policy_id: {TOKEN_B.token_name: 700},
+                POOL_NFT.policy_id: {POOL_NFT.token_name: 1},
+            },
+        ]
+    )
+    tx = pycardano.Transaction(
+        pycardano.TransactionBody(
+            inputs=[pycardano.TransactionInput.from_primitive([b"\x00" * 32, 0])],
+            outputs=[
+                pycardano.TransactionOutput(
+                    address,
+                    value,
+                    datum=pycardano.RawPlutusData.from_cbor(
+                        pool_state(1_000).to_cbor()
+                    ),
+                )
+            ],
+            fee=0,
+        ),
+        pycardano.TransactionWitnessSet(),
+    )
+    database = SqliteDatabase(tmp_path / "pools.db", pragmas={"foreign_keys": 1})
+    with database.bind_ctx(ALL_MODELS):
+        database.create_tables(ALL_MODELS)
+        clear_interning_caches()
+        datum_cache.clear_rows()
+        indexed_outputs.load()
+        block = Block.create(hash=f"{10:064x}", slot=10, height=10)
+        simple_pool.process_tx(tx, block, 0, [], [], [0])
+        (state,) = PoolState.select()
+        assert (state.reserve_a, state.reserve_b, state.lp_supply) == (
+            5_000_000,
+            700,
+            1_000,
+        )
+        assert (state.fee_numerator, state.fee_denominator) == (3, 1000)
+        assert state.pool_nft.asset_name == POOL_NFT.token_name
+        clear_interning_caches()
+        indexed_outputs.load()
+    database.close()
+
+
+def test_swap_quote_matches_check_swap():
+    fee = Fraction(3, 1000)
+    pool = Pool(
+        transaction_hash="aa" * 32,
+        output_index=0,
+        pool_nft=("01", "02"),
+        token_a=("", ""),
+        token_b=("0b", "6d696c6b"),
+        lp_token=("0c", "02"),
+        fee_numerator=fee.numerator,
+        fee_denominator=fee.denominator,
+        reserve_a=5_000_001,
+        reserve_b=700_003,
+        lp_supply=1_000,
+    )
+    for swap_token, reserve_in, reserve_out in (
+        (pool.token_a, pool.reserve_a, pool.reserve_b),
+        (pool.token_b, pool.reserve_b, pool.reserve_a),
+    ):
+        for amount in (1, 333, 1_000_000):
+            quote = swap_quote(pool, swap_token, amount)
+            assert quote["deposit"] == amount + ceil_fraction(
+                mul_fraction(fee, Fraction(amount, 1))
+            )
+            assert quote["receive"] == floor_fraction(
+                sub_fraction(
+                    Fraction(reserve_out, 1),
+                    Fraction(reserve_in * reserve_out, reserve_in + amount),
+                )
+            )
+    assert swap_quote(pool, ("ff", ""), 10) is None
+    assert swap_quote(pool, pool.token_a, 0) is None
+
+
+def test_swap_quote_of_unknown_pool_or_token(monkeypatch):
+    pool = Pool(
+        transaction_hash="aa" * 32,
+        output_index=0,
+        pool_nft=("01", "02"),
+        token_a=("", ""),
+        token_b=("0b", "6d696c6b"),
+        lp_token=("0c", "02"),
+        fee_numerator=3,
+        fee_denominator=1000,
+        reserve_a=5_000_000,
+        reserve_b=700_000,
+        lp_supply=1_000,
+    )
+    reserves = PoolReserves(reload_interval=float("inf"))
+    reserves._pools, reserves._loaded_at = {pool.pool_nft: pool}, 0
+    monkeypatch.setattr(pool_queries, "pool_reserves", reserves)
+    assert query_swap_quote("01.02", ".", 1000)["receive_token"] == "0b.6d696c6b"
+    with pytest.raises(UnknownPoolError):
+        query_swap_quote("01.03", ".", 1000)
+    with pytest.raises(InvalidSwapError):
+        query_swap_quote("01.02", "0c.02", 1000)
@@ -0,0 +1,32 @@
+import pytest
+from peewee import SqliteDatabase
+
+from muesliswap_onchain_governance.api.db_models import ALL_MODELS, Block
+from muesliswap_onchain_governance.api.snapshot import (
+    SnapshotError,
+    export_snapshot,
+    import_snapshot,
+)
+
+
+def test_export_and_import_snapshot(tmp_path):
+    live_db = SqliteDatabase(tmp_path / "live.db", pragmas={"foreign_keys": 1})
+    with live_db.bind_ctx(ALL_MODELS):
+        live_db.create_tables(ALL_MODELS)
+        for slot in (10, 20, 30):
+            Block.create(hash=f"{slot:064x}", slot=slot, height=slot)
+        metadata = export_snapshot(str(tmp_path / "snapshot"), slot=20)
+        # the live database is left untouched
+        assert Block.select().count() == 3
+    live_db.close()
+    assert metadata["block"]["slot"] == 20
+    assert [p["slot"] for p in metadata["points"]] == [20, 10]
+
+    replica_db = SqliteDatabase(tmp_path / "replica.db", pragmas={"foreign_keys": 1})
+    with replica_db.bind_ctx(ALL_MODELS):
+        replica_db.create_tables(ALL_MODELS)
+        assert import_snapshot(str(tmp_path / "snapshot")) == metadata
+        assert [b.slot for b in Block.select().order_by(Block.slot)] == [10, 20]
+        with pytest.raises(SnapshotError):
+            import_snapshot(str(tmp_path / "snapshot"))
+    replica_db.close()
@@ -0,0 +1,133 @@
+import pycardano
+import pytest
+from opshin.prelude import FinitePOSIXTime, Nothing
+from opshin.prelude import Token as OnchainToken
+from peewee import SqliteDatabase
+
+from muesliswap_onchain_governance.api.db_models import (
+    ALL_MODELS,
+    Block,
+    StakingState,
+    TallyState,
+    TallyVote,
+)
+from muesliswap_onchain_governance.api.tx_processor import indexed_outputs
+from muesliswap_onchain_governance.api.tx_processor.datum_cache import datum_cache
+from muesliswap_onchain_governance.api.tx_processor.to_db import (
+    clear_interning_caches,
+)
+from muesliswap_onchain_governance.onchain import util
+from muesliswap_onchain_governance.onchain.util import Fraction
+from muesliswap_onchain_governance.utils.from_script_context import from_address
+
+from .test_tx_archive import GOV_PARAMS, gov_state_tx, sync_transaction
+
+TALLY_ADDRESS = from_address(GOV_PARAMS.tally_address)
+STAKING_ADDRESS = from_address(GOV_PARAMS.staking_address)
+TALLY_AUTH_NFT = OnchainToken(GOV_PARAMS.tally_auth_nft_policy, b"")
+
+PROPOSAL_PARAMS = util.ProposalParams(
+    100,
+    Fraction(1, 2),
+    [Nothing(), Nothing(), Nothing()],
+    FinitePOSIXTime(1_700_000_000_000),
+    1,
+    TALLY_AUTH_NFT,
+    GOV_PARAMS.staking_vote_nft_policy,
+    GOV_PARAMS.staking_address,
+    GOV_PARAMS.governance_token,
+    GOV_PARAMS.vault_ft_policy,
+)
+STAKING_STATE = util.StakingState(
+    [],
+    util.StakingParams(
+        GOV_PARAMS.staking_address,
+        GOV_PARAMS.governance_token,
+        GOV_PARAMS.vault_ft_policy,
+        TALLY_AUTH_NFT,
+    ),
+)
+
+
+def staking_output() -> pycardano.TransactionOutput:
+    return pycardano.TransactionOutput(STAKING_ADDRESS, 2_000_000, datum=STAKING_STATE)
+
+
+def tally_output(votes) -> pycardano.TransactionOutput:
+    return pycardano.TransactionOutput(
+        TALLY_ADDRESS,
+        pycardano.Value(
+            2_000_000,
+            pycardano.MultiAsset.from_primitive(
+                {TALLY_AUTH_NFT.policy_id: {TALLY_AUTH_NFT.token_name: 1}}
+            ),
+        ),
+        datum=util.TallyState(votes, PROPOSAL_PARAMS),
+    )
+
+
+def transaction(inputs, outputs) -> pycardano.Transaction:
+    return pycardano.Transaction(
+        pycardano.TransactionBody(inputs=inputs, outputs=outputs, fee=0),
+        pycardano.TransactionWitnessSet(),
+    )
+
+
+@pytest.mark.parametrize(
+    "previous_votes,next_votes,expected_votes",
+    [
+        # a single vote changing two proposals at once
+        ([0, 150, 10], [40, 150, 0], [(0, 40), (2, -10)]),
+        # the new weights may be longer than the previous ones
+        ([10], [10, 0, 25], [(2, 25)]),
+    ],
+)
+def test_vote_changes_weights(tmp_path, previous_votes, next_votes, expected_votes):
+    database = SqliteDatabase(tmp_path / "tally.db", pragmas={"foreign_keys": 1})
+    with database.bind_ctx(ALL_MODELS):
+        database.create_tables(ALL_MODELS)
+        clear_interning_caches()
+        datum_cache.clear_rows()
+        indexed_outputs.load()
+        block = Block.create(hash=f"{10:064x}", slot=10, height=10)
+        tracked_gov_states = []
+        sync_transaction(
+            gov_state_tx(
+                pycardano.TransactionInput.from_primitive([b"\x01" * 32, 0]), 0
+            ),
+            block,
+            0,
+            tracked_gov_states,
+        )
+        staking_tx = transaction(
+            [pycardano.TransactionInput.from_primitive([b"\x02" * 32, 0])],
+            [staking_output()],
+        )
+        sync_transaction(staking_tx, block, 1, tracked_gov_states)
+        tally_tx = transaction(
+            [pycardano.TransactionInput.from_primitive([b"\x03" * 32, 0])],
+            [tally_output(previous_votes)],
+        )
+        sync_transaction(tally_tx, block, 2, tracked_gov_states)
+        vote_tx = transaction(
+            [
+                pycardano.TransactionInput(tally_tx.id, 0),
+                pycardano.TransactionInput(staking_tx.id, 0),
+            ],
+            [tally_output(next_votes), staking_output()],
+        )
+        sync_transaction(vote_tx, block, 3, tracked_gov_states)
+
+        previous_tally, next_tally = TallyState.select().order_by(TallyState.id)
+        staking_state = StakingState.select().order_by(StakingState.id).first()
+        votes = TallyVote.select().order_by(TallyVote.index)
+        assert [(v.index, v.weight_delta) for v in votes] == expected_votes
+        for vote in votes:
+            assert vote.transaction.transaction_hash == vote_tx.id.payload
+            assert vote.staking_state == staking_state
+            assert vote.prev_tally_state == previous_tally
+            assert vote.next_tally_state == next_tally
+
+        clear_interning_caches()
+        datum_cache.clear_rows()
+        indexed_outputs.load()
@@ -0,0 +1,20 @@
+from peewee import SqliteDatabase
+
+from muesliswap_onchain_governance.api.db_models import Token
+from muesliswap_onchain_governance.api.metrics import metrics
+from muesliswap_onchain_governance.api.tx_processor.to_db import InterningCache
+
+
+def test_interning_cache(tmp_path):
+    database = SqliteDatabase(tmp_path / "tokens.db")
+    with database.bind_ctx([Token]):
+        database.create_tables([Token])
+        cache = InterningCache(Token, ("policy_id", "asset_name"), maxsize=1)
+        first = cache.get_or_create(policy_id=b"", asset_name=b"")
+        assert cache.get_or_create(policy_id=b"", asset_name=b"").id == first.id
+        # the least recently used row is evicted, but not duplicated
+        cache.get_or_create(policy_id=bytes.fromhex("11"), asset_name=b"")
+        assert cache.get_or_create(policy_id=b"", asset_name=b"").id == first.id
+        assert Token.select().count() == 2
+    database.close()
+    assert 'cache="token",result="hit"}' in metrics.render()
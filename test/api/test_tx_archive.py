@@ -0,0 +1,175 @@
+import pycardano
+from opshin.prelude import Token as OnchainToken
+from peewee import SqliteDatabase
+
+from muesliswap_onchain_governance.api.config import gov_state_nft_policy_id
+from muesliswap_onchain_governance.api.db_models import (
+    ALL_MODELS,
+    Address,
+    ArchivedTransaction,
+    Block,
+    GovState,
+    GovUpgrade,
+    Transaction,
+    TransactionOutput,
+)
+from muesliswap_onchain_governance.api.decode_stage import DecodedBlock
+from muesliswap_onchain_governance.api.tx_archive import (
+    archive_transaction,
+    reprocess,
+    stored_spends,
+)
+from muesliswap_onchain_governance.api.tx_processor import (
+    flush_spent_inputs,
+    indexed_outputs,
+    mark_spent_inputs,
+    process_tx,
+)
+from muesliswap_onchain_governance.api.tx_processor.datum_cache import datum_cache
+from muesliswap_onchain_governance.api.tx_processor.indexed_outputs import output_ref
+from muesliswap_onchain_governance.api.tx_processor.to_db import (
+    clear_interning_caches,
+)
+from muesliswap_onchain_governance.onchain.gov_state import gov_state
+from muesliswap_onchain_governance.onchain.util import Fraction
+from muesliswap_onchain_governance.utils.to_script_context import to_address
+
+GOV_ADDRESS = pycardano.Address(pycardano.ScriptHash(b"\x04" * 28))
+GOV_PARAMS = gov_state.GovStateParams(
+    to_address(pycardano.Address(pycardano.ScriptHash(b"\x01" * 28))),
+    to_address(pycardano.Address(pycardano.ScriptHash(b"\x02" * 28))),
+    OnchainToken(b"\x07" * 28, b"gov"),
+    b"\x0a" * 28,
+    100,
+    Fraction(1, 2),
+    1000,
+    OnchainToken(gov_state_nft_policy_id.payload, b"nft"),
+    b"\x08" * 28,
+    b"\x0b" * 28,
+    0,
+)
+
+
+def payment_tx() -> pycardano.Transaction:
+    address = pycardano.Address(pycardano.VerificationKeyHash(b"\x01" * 28))
+    return pycardano.Transaction(
+        pycardano.TransactionBody(
+            inputs=[pycardano.TransactionInput.from_primitive([b"\x00" * 32, 0])],
+            outputs=[pycardano.TransactionOutput(address, 1_000_000)],
+            fee=0,
+        ),
+        pycardano.TransactionWitnessSet(),
+    )
+
+
+def gov_state_tx(spent: pycardano.TransactionInput, last_proposal_id: int):
+    return pycardano.Transaction(
+        pycardano.TransactionBody(
+            inputs=[spent],
+            outputs=[
+                pycardano.TransactionOutput(
+                    GOV_ADDRESS,
+                    pycardano.Value(
+                        2_000_000,
+                        pycardano.MultiAsset.from_primitive(
+                            {gov_state_nft_policy_id.payload: {b"nft": 1}}
+                        ),
+                    ),
+                    datum=gov_state.GovStateDatum(GOV_PARAMS, last_proposal_id),
+                )
+            ],
+            fee=0,
+        ),
+        pycardano.TransactionWitnessSet(),
+    )
+
+
+def sync_transaction(
+    tx: pycardano.Transaction, block: Block, block_index: int, tracked_gov_states
+):
+    """
+    Process a relevant transaction like the querier
+    """
+    tx = {"id": tx.id.payload.hex(), "cbor": tx.to_cbor_hex()}
+    archive_transaction(tx, block, block_index)
+    decoded_tx = DecodedBlock().get(block_index, tx)
+    mark_spent_inputs(
+        [output_ref(i) for i in decoded_tx.transaction_body.inputs], block
+    )
+    process_tx(decoded_tx, block, block_index, tracked_gov_states, [])
+    flush_spent_inputs()
+
+
+def derived_state():
+    """
+    The states derived by the processors, by their outputs instead of their ids
+    """
+    gov_states = [
+        (
+            s.transaction_output.transaction_hash,
+            s.transaction_output.output_index,
+            s.transaction_output.spent_in_block_id,
+            s.last_proposal_id,
+            s.live,
+        )
+        for s in GovState.select()
+    ]
+    gov_upgrades = [
+        (
+            u.prev_gov_state and u.prev_gov_state.last_proposal_id,
+            u.next_gov_state.last_proposal_id,
+        )
+        for u in GovUpgrade.select()
+    ]
+    # sorted by repr, as missing previous states and spending blocks are None
+    return sorted(gov_states, key=repr), sorted(gov_upgrades, key=repr)
+
+
+def test_reprocess_rebuilds_derived_tables(tmp_path):
+    database = SqliteDatabase(tmp_path / "archive.db", pragmas={"foreign_keys": 1})
+    with database.bind_ctx(ALL_MODELS):
+        database.create_tables(ALL_MODELS)
+        clear_interning_caches()
+        datum_cache.clear_rows()
+        indexed_outputs.load()
+        first = Block.create(hash=f"{10:064x}", slot=10, height=10)
+        second = Block.create(hash=f"{20:064x}", slot=20, height=20)
+        tracked_gov_states = []
+        sync_transaction(payment_tx(), first, 0, tracked_gov_states)
+        created = gov_state_tx(
+            pycardano.TransactionInput.from_primitive([b"\x01" * 32, 0]), 0
+        )
+        sync_transaction(created, first, 2, tracked_gov_states)
+        upgraded = gov_state_tx(pycardano.TransactionInput(created.id, 0), 1)
+        sync_transaction(upgraded, second, 0, tracked_gov_states)
+        output = TransactionOutput.create(
+            transaction=Transaction.create(
+                transaction_hash=b"\xaa" * 32, block=first, block_index=1
+            ),
+            transaction_hash=b"\xaa" * 32,
+            output_index=0,
+            address=Address.create(address_raw=b"\x00"),
+            spent_in_block=second,
+        )
+        assert [(block.id, refs) for block, refs in stored_spends()] == [
+            (second.id, [(created.id.payload, 0), (output.transaction_hash, 0)])
+        ]
+        before = derived_state()
+        gov_states, gov_upgrades = before
+        assert {s[2:] for s in gov_states} == {
+            (second.id, 0, False),
+            (None, 1, True),
+        }
+        assert gov_upgrades == [(0, 1), (None, 0)]
+
+        reprocess(decode_workers=0)
+        assert derived_state() == before
+        # the payment transaction is not relevant to any processor, so nothing is derived from it
+        assert TransactionOutput.select().count() == 2
+        assert Transaction.select().count() == 2
+        assert Block.select().count() == 2
+        assert ArchivedTransaction.select().count() == 3
+        clear_interning_caches()
+        datum_cache.clear_rows()
+        indexed_outputs.load()
+    database.close()
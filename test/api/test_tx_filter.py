@@ -0,0 +1,104 @@
+from types import SimpleNamespace
+
+import pycardano
+
+from muesliswap_onchain_governance.api.tx_filter import (
+    RelevanceFilter,
+    inputs_from_tx,
+    is_script_address,
+)
+from muesliswap_onchain_governance.api.tx_processor.watch_set import WatchSet
+
+POLICY_ID = "11" * 28
+MINT_POLICY_ID = "22" * 28
+STAKING_ADDRESS = pycardano.Address(
+    pycardano.ScriptHash(bytes.fromhex("33" * 28)), network=pycardano.Network.TESTNET
+)
+OTHER_ADDRESS = pycardano.Address(
+    pycardano.VerificationKeyHash(bytes.fromhex("44" * 28)),
+    network=pycardano.Network.TESTNET,
+)
+
+
+def ogmios_tx(outputs: list, mint: dict = None) -> dict:
+    tx = {
+        "id": "55" * 32,
+        "inputs": [{"transaction": {"id": "66" * 32}, "index": 3}],
+        "outputs": outputs,
+    }
+    if mint is not None:
+        tx["mint"] = mint
+    return tx
+
+
+def ogmios_output(address: pycardano.Address, value: dict = None) -> dict:
+    return {
+        "address": address.encode(),
+        "value": {"ada": {"lovelace": 2_000_000}, **(value or {})},
+    }
+
+
+def tracked_gov_state(staking_address: pycardano.Address):
+    address = SimpleNamespace(address_raw=staking_address.to_primitive())
+    return SimpleNamespace(
+        id=1,
+        gov_params=SimpleNamespace(
+            staking_address=address,
+            tally_address=address,
+            tally_auth_nft_policy=bytes.fromhex(POLICY_ID),
+        ),
+    )
+
+
+def test_irrelevant_tx():
+    tx_filter = RelevanceFilter({POLICY_ID}, {MINT_POLICY_ID})
+    tx = ogmios_tx(
+        [ogmios_output(OTHER_ADDRESS, {"77" * 28: {"": 1}})], {"77" * 28: {"": 1}}
+    )
+    assert not tx_filter.is_relevant(tx)
+
+
+def test_relevant_policy_in_output():
+    tx_filter = RelevanceFilter({POLICY_ID}, {MINT_POLICY_ID})
+    tx = ogmios_tx([ogmios_output(OTHER_ADDRESS, {POLICY_ID: {"01": 1}})])
+    assert tx_filter.is_relevant(tx)
+
+
+def test_relevant_mint():
+    tx_filter = RelevanceFilter({POLICY_ID}, {MINT_POLICY_ID})
+    tx = ogmios_tx([ogmios_output(OTHER_ADDRESS)], {MINT_POLICY_ID: {"01": 1}})
+    assert tx_filter.is_relevant(tx)
+
+
+def test_relevant_tracked_address():
+    tx_filter = RelevanceFilter({POLICY_ID}, {MINT_POLICY_ID})
+    tx = ogmios_tx([ogmios_output(STAKING_ADDRESS)])
+    assert not tx_filter.is_relevant(tx)
+    tx_filter.update([tracked_gov_state(STAKING_ADDRESS)], [])
+    assert tx_filter.is_relevant(tx)
+    tx_filter.update([], [])
+    assert not tx_filter.is_relevant(tx)
+
+
+def test_inputs_from_tx():
+    assert inputs_from_tx(ogmios_tx([])) == [(bytes.fromhex("66" * 32), 3)]
+
+
+def test_may_become_relevant_at_any_script_address():
+    tx_filter = RelevanceFilter({POLICY_ID}, {MINT_POLICY_ID})
+    assert tx_filter.may_become_relevant(ogmios_tx([ogmios_output(STAKING_ADDRESS)]))
+    assert not tx_filter.may_become_relevant(ogmios_tx([ogmios_output(OTHER_ADDRESS)]))
+    assert not is_script_address(
+        pycardano.Address(staking_part=OTHER_ADDRESS.payment_part).encode()
+    )
+
+
+def test_watch_set_recomputed_only_on_change():
+    watch_set = WatchSet()
+    tracked = [tracked_gov_state(STAKING_ADDRESS)]
+    assert watch_set.update(tracked, [])
+    assert watch_set.staking_addresses == {STAKING_ADDRESS.to_primitive()}
+    assert watch_set.tally_auth_nft_policy_ids == {bytes.fromhex(POLICY_ID)}
+    assert not watch_set.update(list(tracked), [])
+    assert watch_set.update([], [])
+    assert not watch_set.bech32_addresses
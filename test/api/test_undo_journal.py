@@ -0,0 +1,157 @@
+import pytest
+from peewee import SqliteDatabase
+
+from muesliswap_onchain_governance.api.db_models import (
+    ALL_MODELS,
+    Address,
+    Block,
+    StakingParams,
+    StakingState,
+    TallyParams,
+    TallyState,
+    TallyWeights,
+    Token,
+    Transaction,
+    TransactionOutput,
+)
+from muesliswap_onchain_governance.api.db_models.db import insert_listeners
+from muesliswap_onchain_governance.api.tx_processor import (
+    flush_spent_inputs,
+    mark_spent_inputs,
+)
+from muesliswap_onchain_governance.api.tx_processor.indexed_outputs import (
+    indexed_outputs,
+)
+from muesliswap_onchain_governance.api.tx_processor.undo_journal import UndoJournal
+
+
+@pytest.fixture
+def journal(tmp_path, monkeypatch):
+    database = SqliteDatabase(tmp_path / "undo.db", pragmas={"foreign_keys": 1})
+    journal = UndoJournal(depth=2)
+    # record the changes only with this journal
+    monkeypatch.setattr(
+        "muesliswap_onchain_governance.api.tx_processor.undo_journal", journal
+    )
+    insert_listeners.append(journal.record_insert)
+    with database.bind_ctx(ALL_MODELS):
+        database.create_tables(ALL_MODELS)
+        indexed_outputs.load()
+        journal.reset(0)
+        yield journal
+    insert_listeners.remove(journal.record_insert)
+    database.close()
+
+
+def add_block(journal: UndoJournal, slot: int, spends=(), tracked=()):
+    journal.begin_block(slot, list(tracked), [])
+    block = Block.create(hash=f"{slot:064x}", slot=slot, height=slot)
+    mark_spent_inputs(list(spends), block)
+    tx = Transaction.create(
+        transaction_hash=slot.to_bytes(32, "big"), block=block, block_index=0
+    )
+    output = TransactionOutput.create(
+        transaction=tx,
+        transaction_hash=tx.transaction_hash,
+        output_index=0,
+        address=Address.get_or_create(address_raw=b"\x00")[0],
+    )
+    indexed_outputs.add(output, {})
+    flush_spent_inputs()
+    journal.end_block()
+    return output
+
+
+def test_rollback_undoes_inserts_and_spends(journal):
+    first = add_block(journal, 10)
+    first_ref = (first.transaction_hash, 0)
+    second = add_block(journal, 20, spends=[first_ref], tracked=["tracked"])
+    second_ref = (second.transaction_hash, 0)
+    assert first_ref not in indexed_outputs
+
+    assert journal.covers(10)
+    tracked_states = journal.rollback(10)
+    assert tracked_states == (["tracked"], [])
+    assert [b.slot for b in Block.select()] == [10]
+    assert Transaction.select().count() == 1
+    assert TransactionOutput.get_by_id(first.id).spent_in_block is None
+    # rows that are not owned by a block are kept
+    assert Address.select().count() == 1
+    assert first_ref in indexed_outputs
+    assert second_ref not in indexed_outputs
+
+
+def test_spent_outputs_written_once_per_block(journal):
+    first = add_block(journal, 10)
+    second = add_block(journal, 20)
+    block = Block.create(hash=f"{30:064x}", slot=30, height=30)
+    mark_spent_inputs([(first.transaction_hash, 0)], block)
+    mark_spent_inputs([(b"\xff" * 32, 0), (second.transaction_hash, 0)], block)
+    assert (
+        not TransactionOutput.select()
+        .where(TransactionOutput.spent_in_block.is_null(False))
+        .exists()
+    )
+    flush_spent_inputs()
+    assert [o.spent_in_block_id for o in TransactionOutput.select()] == [
+        block.id,
+        block.id,
+    ]
+
+
+def test_journal_keeps_only_depth_blocks(journal):
+    for slot in (10, 20, 30):
+        add_block(journal, slot)
+    assert not journal.covers(0)
+    assert journal.covers(10)
+    assert journal.rollback(30) is None
+
+
+def test_states_resolve_while_unspent_and_when_spent(journal):
+    output = add_block(journal, 10)
+    ref = (output.transaction_hash, 0)
+    token = Token.create(policy_id=b"", asset_name=b"")
+    state = StakingState.create(
+        transaction_output=output,
+        staking_params=StakingParams.create(
+            owner=output.address,
+            governance_token=token,
+            vault_ft_policy=b"",
+            tally_auth_nft=token,
+        ),
+    )
+    assert indexed_outputs.state(StakingState, ref) == state
+    assert indexed_outputs.state(TransactionOutput, ref) is None
+
+    add_block(journal, 20, spends=[ref])
+    # the states spent by the last transaction are still resolved
+    assert indexed_outputs.state(StakingState, ref) == state
+    indexed_outputs.pop_spent([])
+    assert indexed_outputs.state(StakingState, ref) is None
+
+    journal.rollback(10)
+    assert indexed_outputs.state(StakingState, ref) == state
+
+
+def test_loaded_tally_states_carry_weights(journal):
+    output = add_block(journal, 10)
+    token = Token.create(policy_id=b"", asset_name=b"")
+    state = TallyState.create(
+        transaction_output=output,
+        tally_params=TallyParams.create(
+            quorum=0,
+            proposal_id=0,
+            tally_auth_nft=token,
+            staking_vote_nft_policy=b"",
+            staking_address=output.address,
+            governance_token=token,
+            vault_ft_policy=b"",
+        ),
+    )
+    for index, weight in ((1, 5), (0, 3)):
+        TallyWeights.create(tally_state=state, index=index, weight=weight)
+    indexed_outputs.load()
+    assert indexed_outputs.state(TallyState, (output.transaction_hash, 0)).weights == [
+        3,
+        5,
+    ]
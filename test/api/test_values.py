@@ -0,0 +1,28 @@
+import pycardano
+
+from muesliswap_onchain_governance.api.tx_processor.values import (
+    compact_value,
+    value_delta,
+)
+
+POLICY_A = b"\x0a" * 28
+POLICY_B = b"\x0b" * 28
+
+
+def test_value_delta_matches_pycardano():
+    old = pycardano.Value.from_primitive([5_000_000, {POLICY_A: {b"x": 10, b"y": 1}}])
+    new = pycardano.Value.from_primitive(
+        [7_000_000, {POLICY_B: {b"z": 3}, POLICY_A: {b"x": 10, b"y": 4}}]
+    )
+    expected = new - old
+    delta = list(value_delta([compact_value(new)], [compact_value(old)]))
+    assert delta == [
+        (b"", b"", expected.coin),
+        (POLICY_B, b"z", 3),
+        (POLICY_A, b"y", 3),
+    ]
+
+
+def test_value_delta_without_change():
+    value = compact_value(pycardano.Value(2_000_000))
+    assert list(value_delta([value], [value])) == []
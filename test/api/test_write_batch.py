@@ -0,0 +1,83 @@
+import sqlite3
+
+import pytest
+from peewee import IntegerField, Model, SqliteDatabase
+
+from muesliswap_onchain_governance.api.write_batch import WriteBatcher
+
+
+class Row(Model):
+    slot = IntegerField()
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = tmp_path / "batch.db"
+    database = SqliteDatabase(path, pragmas={"journal_mode": "wal"})
+    with database.bind_ctx([Row]):
+        database.create_tables([Row])
+        yield database
+    database.close()
+
+
+def committed_slots(database) -> list:
+    with sqlite3.connect(database.database) as connection:
+        return [
+            slot for slot, in connection.execute("SELECT slot FROM row ORDER BY slot")
+        ]
+
+
+def test_batch_commits_after_max_blocks(database):
+    with WriteBatcher(
+        database, max_blocks=3, max_time_ms=10**6, tip_distance=0
+    ) as batcher:
+        for slot in range(1, 3):
+            with batcher.block(slot, 1000):
+                Row.create(slot=slot)
+        assert committed_slots(database) == []
+        with batcher.block(3, 1000):
+            Row.create(slot=3)
+        assert committed_slots(database) == [1, 2, 3]
+        with batcher.block(4, 1000):
+            Row.create(slot=4)
+    assert committed_slots(database) == [1, 2, 3, 4]
+
+
+def test_block_near_tip_is_committed(database):
+    batcher = WriteBatcher(
+        database, max_blocks=100, max_time_ms=10**6, tip_distance=10
+    )
+    with batcher.block(995, 1000):
+        Row.create(slot=995)
+    assert committed_slots(database) == [995]
+
+
+def test_block_is_committed_when_nothing_is_buffered(database):
+    buffered = [1]
+    batcher = WriteBatcher(
+        database,
+        max_blocks=100,
+        max_time_ms=10**6,
+        tip_distance=0,
+        buffered=lambda: buffered[0],
+    )
+    with batcher.block(1, 1000):
+        Row.create(slot=1)
+    assert committed_slots(database) == []
+    buffered[0] = 0
+    with batcher.block(2, 1000):
+        Row.create(slot=2)
+    assert committed_slots(database) == [1, 2]
+
+
+def test_failed_block_is_rolled_back(database):
+    batcher = WriteBatcher(
+        database, max_blocks=100, max_time_ms=10**6, tip_distance=0
+    )
+    with batcher.block(1, 1000):
+        Row.create(slot=1)
+    with pytest.raises(ValueError):
+        with batcher.block(2, 1000):
+            Row.create(slot=2)
+            raise ValueError("invalid block")
+    assert committed_slots(database) == [1]